@@ -16,6 +16,7 @@ from routers import ai, report, workspace, quick_generate
 from services.grok_client import GrokClient
 from services.openai_client import OpenAIClient
 from services.ai_orchestrator import AIOrchestrator
+from services.workspace_task_manager import workspace_task_manager
 from utils.secret_manager import secret_manager
 from utils.feature_flags import is_workspace_ai_v2_enabled
 
@@ -93,7 +94,9 @@ async def api_root():
             "summary": "/api/v1/ai/summary",
             "insights": "/api/v1/ai/insights",
             "classify": "/api/v1/ai/classify",
-            "health": "/api/v1/ai/health"
+            "enrich": "/api/v1/ai/enrich",
+            "health": "/api/v1/ai/health",
+            "metrics": "/api/v1/ai/metrics"
         }
     }
 
@@ -102,6 +105,9 @@ async def api_root():
 async def startup_event():
     """应用启动事件"""
     logger.info("🚀 DeepDive AI Service starting up...")
+    await grok_client.start()
+    await orchestrator.start()
+    await workspace_task_manager.open()
     logger.info(f"📝 Grok available: {grok_client.available}")
     logger.info(f"📝 OpenAI available: {openai_client.available}")
     logger.info(f"🎯 Active model: {orchestrator.active_model}")
@@ -112,6 +118,10 @@ async def startup_event():
 async def shutdown_event():
     """应用关闭事件"""
     logger.info("👋 DeepDive AI Service shutting down...")
+    await ai.close_micro_batcher()
+    await workspace_task_manager.aclose()
+    await orchestrator.aclose()
+    await grok_client.aclose()
 
 
 if __name__ == "__main__":
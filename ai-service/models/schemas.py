@@ -72,6 +72,58 @@ class ClassificationResponse(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.now)
 
 
+class EnrichRequest(BaseModel):
+    """综合增强请求（摘要 + 洞察 + 分类）"""
+
+    content: str = Field(..., description="原始内容")
+    max_length: Optional[int] = Field(200, description="最大摘要长度（字数）")
+    language: Optional[Literal["zh", "en"]] = Field("zh", description="输出语言")
+
+
+class EnrichResponse(BaseModel):
+    """综合增强响应"""
+
+    model_config = ConfigDict(protected_namespaces=())
+
+    summary: SummaryResponse = Field(..., description="摘要")
+    insights: InsightResponse = Field(..., description="洞察")
+    classification: ClassificationResponse = Field(..., description="分类")
+    model_used: str = Field(..., description="综合调用使用的模型")
+    fallback_fields: List[str] = Field(
+        default_factory=list,
+        description="综合结果解析失败、改用单独调用生成的字段",
+    )
+    timestamp: datetime = Field(default_factory=datetime.now)
+
+
+class EnrichBatchItem(BaseModel):
+    """批量增强中的单个资源"""
+
+    id: Optional[str] = Field(None, description="调用方的资源 ID（原样返回）")
+    content: str = Field(..., description="原始内容")
+    max_length: Optional[int] = Field(200, description="最大摘要长度（字数）")
+    language: Optional[Literal["zh", "en"]] = Field("zh", description="输出语言")
+
+
+class EnrichBatchRequest(BaseModel):
+    """批量增强请求"""
+
+    items: List[EnrichBatchItem] = Field(..., description="待增强的资源列表")
+    concurrency: Optional[int] = Field(
+        None,
+        ge=1,
+        description="并发数（不超过服务端上限，默认使用服务端配置）",
+    )
+
+
+class TranscriptSegment(BaseModel):
+    """带时间轴的字幕片段"""
+
+    text: str = Field(..., description="字幕文本")
+    start: Optional[float] = Field(None, description="开始时间（秒）")
+    duration: Optional[float] = Field(None, description="持续时间（秒）")
+
+
 class HealthResponse(BaseModel):
     """健康检查响应"""
 
@@ -1,16 +1,24 @@
 """
 AI API 路由
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
 from fastapi.responses import StreamingResponse
 from loguru import logger
 from models.schemas import (
     SummaryRequest, SummaryResponse,
-    InsightRequest, InsightResponse, Insight,
+    InsightRequest, InsightResponse,
     ClassificationRequest, ClassificationResponse,
-    HealthResponse
+    EnrichRequest, EnrichResponse, EnrichBatchRequest,
+    HealthResponse, TranscriptSegment
 )
+from services import content_enrichment
 from services.ai_orchestrator import AIOrchestrator
+from services.micro_batcher import MicroBatchConfig, TranslationMicroBatcher
+from services.segment_translation import SegmentTranslator
+from services.stream_relay import SSE_HEADERS, SSERelay, StreamRelayConfig, stream_metrics
+from services.transcript_summarization import SummarizationConfig, TranscriptSummarizer
+from services.translation_memory import format_references, normalize_source
+from services.workspace_task_manager import workspace_task_manager
 from pydantic import BaseModel
 from typing import Optional, Literal, List, Tuple
 import json
@@ -40,61 +48,89 @@ def get_orchestrator() -> AIOrchestrator:
     return orchestrator
 
 
+_micro_batcher: Optional[TranslationMicroBatcher] = None
+
+
+def get_micro_batcher(orch: AIOrchestrator = Depends(get_orchestrator)) -> TranslationMicroBatcher:
+    """获取单句翻译微批器（依赖注入，首次使用时创建）"""
+    global _micro_batcher
+    if _micro_batcher is None:
+        _micro_batcher = TranslationMicroBatcher(orch, MicroBatchConfig.from_env())
+    return _micro_batcher
+
+
+async def close_micro_batcher():
+    """应用关闭时发出所有待发的微批"""
+    if _micro_batcher is not None:
+        await _micro_batcher.aclose()
+
+
+def use_response_cache(
+    x_ai_cache: Optional[str] = Header(default=None),
+    cache_control: Optional[str] = Header(default=None)
+) -> bool:
+    """
+    是否使用响应缓存（依赖注入）
+
+    请求头 `X-AI-Cache: bypass` 或 `Cache-Control: no-cache` 时绕过缓存。
+    """
+    if x_ai_cache and x_ai_cache.strip().lower() in ("bypass", "no-cache", "off"):
+        return False
+    if cache_control and "no-cache" in cache_control.lower():
+        return False
+    return True
+
+
 def select_ai_client(
     preferred_model: Literal["grok", "openai", "gpt-4"],
     orch: AIOrchestrator,
     purpose: str,
-    error_detail: str = "AI services unavailable"
+    error_detail: str = "AI services unavailable",
+    endpoint: Optional[str] = None
 ) -> Tuple[object, str]:
     """
-    根据首选模型选择可用的 AI 客户端，如需时自动回退。
+    根据首选模型与路由策略选择可用的 AI 客户端，如需时自动回退。
 
     Args:
         preferred_model: 请求指定的模型
         orch: AI 编排器
         purpose: 日志上下文
+        error_detail: 无可用客户端时的错误信息
+        endpoint: 端点名称（用于路由覆盖）
 
     Returns:
         (可用客户端, 实际使用的模型名称)
     """
-    client = None
-
     normalized = preferred_model
     if preferred_model not in ("grok", "openai"):
         normalized = "openai"
 
-    active_model = normalized
-
-    if normalized == "grok":
-        if orch.grok.available:
-            client = orch.grok
-        elif orch.openai.available:
-            logger.warning("%s: Grok unavailable, falling back to OpenAI", purpose)
-            client = orch.openai
-            active_model = "openai"
-    else:
-        if orch.openai.available:
-            client = orch.openai
-        elif orch.grok.available:
-            logger.warning("%s: OpenAI unavailable, falling back to Grok", purpose)
-            client = orch.grok
-            active_model = "grok"
-
-    if client is None or not getattr(client, "available", False):
+    ranked = orch.rank_providers(preferred=normalized, endpoint=endpoint)
+    if not ranked:
         raise HTTPException(status_code=503, detail=error_detail)
 
-    return client, active_model
+    # 优先选择未熔断的提供商；都熔断时仍按路由顺序尽力而为
+    healthy = [name for name in ranked if orch.is_provider_healthy(name)]
+    active_model = healthy[0] if healthy else ranked[0]
 
+    if active_model != normalized:
+        logger.warning(f"{purpose}: routing to {active_model} instead of {normalized}")
+
+    client = orch.grok if active_model == "grok" else orch.openai
+    return client, active_model
 
 
 # OPTIONS endpoints for CORS preflight
 @router.options("/summary")
 @router.options("/insights")
 @router.options("/classify")
+@router.options("/enrich")
+@router.options("/enrich/batch")
 @router.options("/simple-chat")
 @router.options("/quick-action")
 @router.options("/translate")
 @router.options("/translate-segments")
+@router.options("/translate-segments/stream")
 @router.options("/youtube-report")
 @router.options("/chat")
 async def options_handler():
@@ -103,7 +139,8 @@ async def options_handler():
 @router.post("/summary", response_model=SummaryResponse)
 async def generate_summary(
     request: SummaryRequest,
-    orch: AIOrchestrator = Depends(get_orchestrator)
+    orch: AIOrchestrator = Depends(get_orchestrator),
+    use_cache: bool = Depends(use_response_cache)
 ):
     """
     生成内容摘要
@@ -116,35 +153,19 @@ async def generate_summary(
     """
     logger.info(f"Generating summary for content length: {len(request.content)}")
 
-    prompt = f"""请为以下内容生成一个简洁的摘要（不超过{request.max_length}字）：
-
-{request.content}
-
-要求：
-- 使用{request.language}语言
-- 抓住核心要点
-- 简洁明了
-"""
-
-    result, model = await orch.generate_completion(
-        prompt,
-        max_tokens=request.max_length * 2,  # 中文一个字约2个token
-        temperature=0.5
+    response = await content_enrichment.generate_summary(
+        orch, request.content, request.max_length, request.language, use_cache=use_cache
     )
-
-    if result is None:
+    if response is None:
         raise HTTPException(status_code=503, detail="All AI services unavailable")
-
-    return SummaryResponse(
-        summary=result,
-        model_used=model
-    )
+    return response
 
 
 @router.post("/insights", response_model=InsightResponse)
 async def extract_insights(
     request: InsightRequest,
-    orch: AIOrchestrator = Depends(get_orchestrator)
+    orch: AIOrchestrator = Depends(get_orchestrator),
+    use_cache: bool = Depends(use_response_cache)
 ):
     """
     提取关键洞察
@@ -157,59 +178,19 @@ async def extract_insights(
     """
     logger.info(f"Extracting insights for content length: {len(request.content)}")
 
-    prompt = f"""请从以下内容中提取3-5个关键洞察：
-
-{request.content}
-
-要求：
-- 使用{request.language}语言
-- 每个洞察包含标题和描述
-- 标注重要性（high/medium/low）
-- 以 JSON 格式返回，格式如下：
-[
-  {{"title": "洞察标题", "description": "洞察描述", "importance": "high"}},
-  ...
-]
-"""
-
-    result, model = await orch.generate_completion(
-        prompt,
-        max_tokens=800,
-        temperature=0.7
+    response = await content_enrichment.extract_insights(
+        orch, request.content, request.language, use_cache=use_cache
     )
-
-    if result is None:
+    if response is None:
         raise HTTPException(status_code=503, detail="All AI services unavailable")
-
-    # 解析 JSON 响应
-    try:
-        import json
-        # 提取 JSON 部分（可能被 markdown 代码块包裹）
-        if "```json" in result:
-            result = result.split("```json")[1].split("```")[0].strip()
-        elif "```" in result:
-            result = result.split("```")[1].split("```")[0].strip()
-
-        insights_data = json.loads(result)
-        insights = [Insight(**item) for item in insights_data]
-
-        return InsightResponse(
-            insights=insights,
-            model_used=model
-        )
-    except Exception as e:
-        logger.error(f"Failed to parse insights: {str(e)}")
-        # 降级处理：返回空列表
-        return InsightResponse(
-            insights=[],
-            model_used=model
-        )
+    return response
 
 
 @router.post("/classify", response_model=ClassificationResponse)
 async def classify_content(
     request: ClassificationRequest,
-    orch: AIOrchestrator = Depends(get_orchestrator)
+    orch: AIOrchestrator = Depends(get_orchestrator),
+    use_cache: bool = Depends(use_response_cache)
 ):
     """
     分类内容
@@ -222,60 +203,82 @@ async def classify_content(
     """
     logger.info(f"Classifying content length: {len(request.content)}")
 
-    prompt = f"""请对以下内容进行分类：
+    response = await content_enrichment.classify_content(orch, request.content, use_cache=use_cache)
+    if response is None:
+        raise HTTPException(status_code=503, detail="All AI services unavailable")
+    return response
 
-{request.content}
 
-要求：
-- 确定主类别（如：AI/机器学习、前端开发、后端开发、数据科学等）
-- 提取子类别（2-3个）
-- 提取相关标签（3-5个）
-- 评估难度等级（beginner/intermediate/advanced/expert）
-- 以 JSON 格式返回：
-{{
-  "category": "主类别",
-  "subcategories": ["子类别1", "子类别2"],
-  "tags": ["标签1", "标签2", "标签3"],
-  "difficulty_level": "intermediate"
-}}
-"""
+@router.post("/enrich", response_model=EnrichResponse)
+async def enrich_content(
+    request: EnrichRequest,
+    orch: AIOrchestrator = Depends(get_orchestrator),
+    use_cache: bool = Depends(use_response_cache)
+):
+    """
+    综合增强：一次调用同时生成摘要、洞察与分类
 
-    result, model = await orch.generate_completion(
-        prompt,
-        max_tokens=500,
-        temperature=0.3
-    )
+    内容只发送一次；某部分解析失败时仅对该部分单独重试（见 fallback_fields）。
 
-    if result is None:
+    Args:
+        request: 综合增强请求
+
+    Returns:
+        综合增强响应
+    """
+    logger.info(f"Enriching content length: {len(request.content)}")
+
+    response = await content_enrichment.enrich_content(
+        orch, request.content, request.max_length, request.language, use_cache=use_cache
+    )
+    if response is None:
         raise HTTPException(status_code=503, detail="All AI services unavailable")
+    return response
 
-    # 解析 JSON 响应
-    try:
-        import json
-        if "```json" in result:
-            result = result.split("```json")[1].split("```")[0].strip()
-        elif "```" in result:
-            result = result.split("```")[1].split("```")[0].strip()
-
-        classification_data = json.loads(result)
-
-        return ClassificationResponse(
-            category=classification_data.get("category", "Unknown"),
-            subcategories=classification_data.get("subcategories", []),
-            tags=classification_data.get("tags", []),
-            difficulty_level=classification_data.get("difficulty_level", "intermediate"),
-            model_used=model
-        )
-    except Exception as e:
-        logger.error(f"Failed to parse classification: {str(e)}")
-        # 降级处理
-        return ClassificationResponse(
-            category="Unknown",
-            subcategories=[],
-            tags=[],
-            difficulty_level="intermediate",
-            model_used=model
+
+@router.post("/enrich/batch")
+async def enrich_batch(
+    request: EnrichBatchRequest,
+    orch: AIOrchestrator = Depends(get_orchestrator),
+    use_cache: bool = Depends(use_response_cache)
+):
+    """
+    批量综合增强（NDJSON 流式返回）
+
+    每个资源完成后立即输出一行 {"type": "result", "index", "id", "status", ...}，
+    全部完成后输出一行 {"type": "summary", ...}。并发数受服务端上限约束，
+    提供商请求速率由 AI_RATE_LIMIT_RPS 限制。
+
+    Args:
+        request: 批量增强请求
+
+    Returns:
+        NDJSON 流
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="items must not be empty")
+    if len(request.items) > content_enrichment.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many items (max {content_enrichment.BATCH_MAX_ITEMS})"
         )
+    if not orch.rank_providers():
+        raise HTTPException(status_code=503, detail="All AI services unavailable")
+
+    async def generate():
+        async for record in content_enrichment.enrich_batch(
+            orch, request.items, request.concurrency, use_cache=use_cache
+        ):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
 
 
 @router.get("/health", response_model=HealthResponse)
@@ -296,9 +299,26 @@ async def health_check(orch: AIOrchestrator = Depends(get_orchestrator)):
     )
 
 
+@router.get("/metrics")
+async def get_metrics(orch: AIOrchestrator = Depends(get_orchestrator)):
+    """
+    运行时指标（连接池使用情况等），用于容量评估
+
+    Returns:
+        指标字典
+    """
+    metrics = orch.get_metrics()
+    if _micro_batcher is not None:
+        metrics["micro_batching"] = _micro_batcher.snapshot()
+    metrics["streaming"] = stream_metrics.snapshot()
+    metrics["workspace_tasks"] = workspace_task_manager.queue_snapshot()
+    return metrics
+
+
 @router.post("/simple-chat")
 async def simple_chat(
     request: ChatRequest,
+    http_request: Request,
     orch: AIOrchestrator = Depends(get_orchestrator)
 ):
     """
@@ -320,37 +340,38 @@ async def simple_chat(
         prompt = f"Context:\n{request.context}\n\nUser Question:\n{request.message}"
 
     # Select AI client, fallback when preferred provider is unavailable
-    client, active_model = select_ai_client(request.model, orch, "Chat")
+    _, active_model = select_ai_client(request.model, orch, "Chat", endpoint="simple-chat")
 
     if request.stream:
-        # 流式响应
-        async def generate():
-            try:
-                async for chunk in client.stream_completion(prompt, max_tokens=2000, temperature=0.7):
-                    yield f"data: {json.dumps({'content': chunk, 'model': active_model})}\n\n"
-                yield "data: [DONE]\n\n"
-            except Exception as e:
-                logger.error(f"Streaming error: {str(e)}")
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-
+        # 流式响应：合并细碎片段、发送心跳，客户端断开时取消上游
+        relay = SSERelay(
+            orch.stream_completion(active_model, prompt, max_tokens=2000, temperature=0.7),
+            endpoint="simple-chat",
+            extra={"model": active_model},
+            config=StreamRelayConfig.from_env(),
+            is_disconnected=http_request.is_disconnected,
+        )
         return StreamingResponse(
-            generate(),
+            relay.stream(),
             media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-            }
+            headers=SSE_HEADERS
         )
     else:
-        # 常规响应
-        result = await client.generate_completion(prompt, max_tokens=2000, temperature=0.7)
+        # 常规响应（经编排器调用：熔断、延迟统计与故障切换）
+        result, model = await orch.generate_completion(
+            prompt,
+            max_tokens=2000,
+            temperature=0.7,
+            preferred=active_model,
+            endpoint="simple-chat",
+        )
 
         if result is None:
             raise HTTPException(status_code=503, detail="Failed to generate response")
 
         return {
             "content": result,
-            "model": active_model
+            "model": model
         }
 
 
@@ -421,9 +442,15 @@ JSON output:
 ["""
 
     # Select AI client for quick actions with automatic fallback
-    client, active_model = select_ai_client(request.model, orch, "Quick action")
+    _, active_model = select_ai_client(request.model, orch, "Quick action", endpoint="quick-action")
 
-    result = await client.generate_completion(prompt, max_tokens=1500, temperature=0.7)
+    result, model = await orch.generate_completion(
+        prompt,
+        max_tokens=1500,
+        temperature=0.7,
+        preferred=active_model,
+        endpoint="quick-action",
+    )
 
     if result is None:
         raise HTTPException(status_code=503, detail="Failed to generate response")
@@ -481,7 +508,7 @@ JSON output:
     return {
         "content": result,
         "action": request.action,
-        "model": active_model
+        "model": model
     }
 
 
@@ -495,10 +522,13 @@ class TranslateRequest(BaseModel):
 @router.post("/translate")
 async def translate_text(
     request: TranslateRequest,
-    orch: AIOrchestrator = Depends(get_orchestrator)
+    orch: AIOrchestrator = Depends(get_orchestrator),
+    use_cache: bool = Depends(use_response_cache)
 ):
     """
-    翻译文本
+    翻译文本（单行文本优先复用翻译记忆）
+
+    多行正文不作为单条记忆读写：整段的相似版本更可能意思不同。
 
     Args:
         request: 翻译请求
@@ -508,30 +538,57 @@ async def translate_text(
     """
     logger.info(f"Translating text to {request.targetLanguage}, length: {len(request.text)}")
 
+    memory = orch.translation_memory
+    single_line = "\n" not in normalize_source(request.text)
+    references = ""
+    if use_cache and single_line:
+        match = memory.lookup(request.text, request.targetLanguage)
+        if match is not None:
+            return {
+                "translatedText": match.translation,
+                "targetLanguage": request.targetLanguage,
+                "model": "memory",
+                "memory": match.kind
+            }
+        suggestion = memory.suggest(request.text, request.targetLanguage)
+        if suggestion is not None:
+            references = format_references([suggestion])
+
     prompt = f"""Translate the following text to {request.targetLanguage}.
 Preserve the line breaks and structure. Only output the translation, no explanations.
 
-Text to translate:
+{references}Text to translate:
 {request.text}
 
 Translation:"""
 
-    client, active_model = select_ai_client(
+    _, active_model = select_ai_client(
         request.model,
         orch,
         "Translate text",
-        "AI translation services unavailable"
+        "AI translation services unavailable",
+        endpoint="translate"
     )
 
-    result = await client.generate_completion(prompt, max_tokens=4000, temperature=0.3)
+    result, model = await orch.generate_completion(
+        prompt,
+        max_tokens=4000,
+        temperature=0.3,
+        preferred=active_model,
+        endpoint="translate",
+        use_cache=use_cache,
+    )
 
     if result is None:
         raise HTTPException(status_code=503, detail="Failed to generate translation")
 
+    if single_line:
+        memory.store(request.text, request.targetLanguage, result.strip())
+
     return {
         "translatedText": result.strip(),
         "targetLanguage": request.targetLanguage,
-        "model": active_model
+        "model": model
     }
 
 
@@ -540,17 +597,21 @@ class TranslateSegmentsRequest(BaseModel):
     segments: List[str]
     targetLanguage: str = "zh-CN"
     model: Literal["grok", "openai", "gpt-4"] = "gpt-4"
-    batchSize: int = 40
+    # 单批段落数上限；未指定时按 token 预算自动分批
+    batchSize: Optional[int] = None
 
 
 @router.post("/translate-segments")
 async def translate_segments(
     request: TranslateSegmentsRequest,
-    orch: AIOrchestrator = Depends(get_orchestrator)
+    orch: AIOrchestrator = Depends(get_orchestrator),
+    use_cache: bool = Depends(use_response_cache)
 ):
     """
     逐句翻译字幕段落，确保与原始顺序对应
 
+    批次并发翻译（AI_TRANSLATE_CONCURRENCY），单个批次失败时只重试缺失的索引。
+
     Args:
         request: 翻译请求
 
@@ -566,97 +627,130 @@ async def translate_segments(
         request.targetLanguage,
     )
 
-    client, active_model = select_ai_client(
+    _, active_model = select_ai_client(
         request.model,
         orch,
         "Translate segments",
-        "AI translation services unavailable"
+        "AI translation services unavailable",
+        endpoint="translate-segments"
     )
 
-    translations: List[str] = [""] * len(request.segments)
-    batch_size = max(1, min(request.batchSize, 80))
+    batch_size = max(1, min(request.batchSize, 80)) if request.batchSize else None
+    translator = SegmentTranslator(
+        orch,
+        request.targetLanguage,
+        preferred=active_model,
+        use_cache=use_cache,
+        memory=orch.translation_memory,
+        batcher=orch.segment_batcher,
+    )
+    translated = await translator.translate(request.segments, batch_size)
 
-    for start in range(0, len(request.segments), batch_size):
-        end = min(start + batch_size, len(request.segments))
-        chunk = request.segments[start:end]
+    if not translated and translator.provider_failures:
+        raise HTTPException(status_code=503, detail="Failed to generate translation")
 
-        numbered_lines = "\n".join(
-            f"{index}: {segment}"
-            for index, segment in enumerate(chunk, start=start)
-        )
+    # 回填未翻译的段落为原文
+    translations = [
+        translated.get(idx) or segment
+        for idx, segment in enumerate(request.segments)
+    ]
 
-        prompt = f"""You are a professional translator. Translate each caption line into {request.targetLanguage}.
-Return a JSON array where each element has the form {{"index": number, "translation": "..."}}.
-- The index must match the zero-based index shown before each caption.
-- Keep the same number of items as the input.
-- Do not merge or split lines.
-- Preserve punctuation and speaker labels.
-- Use double quotes for strings and output valid JSON only.
+    return {
+        "translations": translations,
+        "targetLanguage": request.targetLanguage,
+        "model": translator.model_used or active_model,
+    }
 
-Captions:
-{numbered_lines}
 
-JSON:"""
+@router.post("/translate-segments/stream")
+async def translate_segments_stream(
+    request: TranslateSegmentsRequest,
+    format: Literal["ndjson", "sse"] = "ndjson",
+    orch: AIOrchestrator = Depends(get_orchestrator),
+    use_cache: bool = Depends(use_response_cache)
+):
+    """
+    逐句翻译字幕段落（流式）
 
-        result = await client.generate_completion(
-            prompt,
-            max_tokens=min(4096, 200 + len(chunk) * 40),
-            temperature=0.2,
-        )
+    模型输出的 JSON 数组被增量解析，每完成一句立即输出
+    {"type": "segment", "index", "translation"}；最终未能翻译的段落以原文补齐
+    （"fallback": true），最后输出一条 {"type": "done", ...}。
 
-        if result is None:
-            raise HTTPException(status_code=503, detail="Failed to generate translation")
+    Args:
+        request: 翻译请求
+        format: ndjson（默认）或 sse
 
-        cleaned = result.strip()
-        if "```" in cleaned:
-            cleaned = cleaned.split("```", 2)
-            if len(cleaned) >= 2:
-                cleaned = cleaned[1]
-            else:
-                cleaned = result.strip()
+    Returns:
+        NDJSON 或 SSE 流
+    """
+    if not request.segments:
+        raise HTTPException(status_code=400, detail="segments cannot be empty")
 
-        cleaned = cleaned.strip()
-        if cleaned.lower().startswith("json"):
-            cleaned = cleaned[4:].strip(": \n\r\t")
+    logger.info(
+        "Streaming translation of %d caption segments to %s",
+        len(request.segments),
+        request.targetLanguage,
+    )
 
-        try:
-            parsed = json.loads(cleaned)
-        except json.JSONDecodeError:
-            # 尝试从文本中提取 JSON 数组
-            start_idx = cleaned.find("[")
-            end_idx = cleaned.rfind("]")
-            if start_idx == -1 or end_idx == -1 or end_idx <= start_idx:
-                logger.error("Failed to parse translation JSON: %s", cleaned[:200])
-                raise HTTPException(status_code=500, detail="Invalid translation response format")
-            try:
-                parsed = json.loads(cleaned[start_idx:end_idx + 1])
-            except json.JSONDecodeError as json_error:
-                logger.error("JSON parsing failed: %s", str(json_error))
-                logger.debug("Translation response: %s", cleaned)
-                raise HTTPException(status_code=500, detail="Invalid translation response format")
-
-        if not isinstance(parsed, list):
-            raise HTTPException(status_code=500, detail="Unexpected translation response structure")
-
-        for item in parsed:
-            if not isinstance(item, dict):
-                continue
-            idx = item.get("index")
-            translation = item.get("translation")
-            if isinstance(idx, int) and isinstance(translation, str):
-                if 0 <= idx < len(translations):
-                    translations[idx] = translation.strip()
+    _, active_model = select_ai_client(
+        request.model,
+        orch,
+        "Translate segments (stream)",
+        "AI translation services unavailable",
+        endpoint="translate-segments"
+    )
 
-    # 回填未翻译的段落为原文
-    for idx, text in enumerate(translations):
-        if not text:
-            translations[idx] = request.segments[idx]
+    batch_size = max(1, min(request.batchSize, 80)) if request.batchSize else None
+    translator = SegmentTranslator(
+        orch,
+        request.targetLanguage,
+        preferred=active_model,
+        use_cache=use_cache,
+        memory=orch.translation_memory,
+        batcher=orch.segment_batcher,
+    )
 
-    return {
-        "translations": translations,
-        "targetLanguage": request.targetLanguage,
-        "model": active_model,
-    }
+    def encode(record: dict) -> str:
+        payload = json.dumps(record, ensure_ascii=False)
+        return f"data: {payload}\n\n" if format == "sse" else payload + "\n"
+
+    async def generate():
+        translated = set()
+        try:
+            async for index, translation in translator.iter_segments(request.segments, batch_size):
+                translated.add(index)
+                yield encode({"type": "segment", "index": index, "translation": translation})
+
+            # 回填未翻译的段落为原文
+            fallback = [idx for idx in range(len(request.segments)) if idx not in translated]
+            for idx in fallback:
+                yield encode({
+                    "type": "segment",
+                    "index": idx,
+                    "translation": request.segments[idx],
+                    "fallback": True,
+                })
+
+            yield encode({
+                "type": "done",
+                "total": len(request.segments),
+                "translated": len(translated),
+                "fallback": len(fallback),
+                "targetLanguage": request.targetLanguage,
+                "model": translator.model_used or active_model,
+            })
+        except Exception as e:
+            logger.error(f"Segment streaming error: {str(e)}")
+            yield encode({"type": "error", "error": str(e)})
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
 
 
 class TranslateSingleRequest(BaseModel):
@@ -664,16 +758,22 @@ class TranslateSingleRequest(BaseModel):
     text: str
     targetLanguage: str = "zh-CN"
     model: Literal["grok", "openai"] = "grok"  # 默认使用 grok (OpenAI在Railway上不可用)
+    # 可接受的最大排队等待（毫秒），用于与并发请求合并；0 表示立即发出
+    maxWaitMs: Optional[float] = None
 
 
 @router.post("/translate-single")
 async def translate_single(
     request: TranslateSingleRequest,
-    orch: AIOrchestrator = Depends(get_orchestrator)
+    orch: AIOrchestrator = Depends(get_orchestrator),
+    batcher: TranslationMicroBatcher = Depends(get_micro_batcher),
+    use_cache: bool = Depends(use_response_cache)
 ):
     """
     翻译单个句子（使用最便宜的模型）
 
+    同一目标语言的并发请求会在短窗口内合并为一次批量调用（AI_MICROBATCH_*）。
+
     Args:
         request: 翻译请求
 
@@ -689,79 +789,83 @@ async def translate_single(
 
     logger.info("Translating: '%s' -> %s", request.text[:50], request.targetLanguage)
 
-    client, active_model = select_ai_client(
-        request.model,
-        orch,
-        "Translate single sentence",
-        "AI translation services unavailable"
-    )
+    memory = orch.translation_memory
+    suggestion = None
+    if use_cache:
+        match = memory.lookup(request.text, request.targetLanguage)
+        if match is not None:
+            return {
+                "translation": match.translation,
+                "targetLanguage": request.targetLanguage,
+                "model": "memory",
+                "memory": match.kind
+            }
+        # 近似匹配可能意思不同，只作为建议单独返回
+        suggestion = memory.suggest(request.text, request.targetLanguage)
 
-    # 智能多语言翻译prompt
-    target_lang_name = {
-        "zh-CN": "Simplified Chinese (简体中文)",
-        "zh-TW": "Traditional Chinese (繁體中文)",
-        "en": "English",
-        "ja": "Japanese (日本語)",
-        "ko": "Korean (한국어)",
-        "fr": "French (Français)",
-        "de": "German (Deutsch)",
-        "es": "Spanish (Español)",
-    }.get(request.targetLanguage, request.targetLanguage)
-
-    prompt = f"""You are a professional translator. Translate the following text to {target_lang_name}.
-
-IMPORTANT RULES:
-1. Detect the source language automatically
-2. Translate to {target_lang_name} regardless of source language
-3. If the text is already in {target_lang_name}, keep it as is
-4. Only return the translation, no explanations or notes
-5. Preserve the original meaning and tone
-
-Text to translate:
-{request.text}
+    if not orch.rank_providers():
+        raise HTTPException(status_code=503, detail="AI translation services unavailable")
 
-Translation:"""
-
-    result = await client.generate_completion(
-        prompt,
-        max_tokens=200,
-        temperature=0.2,
+    # 走编排器：按延迟路由到当前更快的健康提供商
+    translation, active_model = await batcher.translate(
+        request.text,
+        request.targetLanguage,
+        preferred=request.model,
+        use_cache=use_cache,
+        max_wait_ms=request.maxWaitMs,
     )
 
-    if result is None:
+    response = {
+        "targetLanguage": request.targetLanguage,
+    }
+    if suggestion is not None:
+        response["suggestion"] = {
+            "source": suggestion.source,
+            "translation": suggestion.translation,
+            "score": suggestion.score,
+        }
+
+    if translation is None:
         # Fallback to original text
         logger.warning("Translation failed, using original text")
-        return {
-            "translation": request.text,
-            "targetLanguage": request.targetLanguage,
-            "model": active_model
-        }
+        return {"translation": request.text, **response, "model": request.model}
 
-    translation = result.strip()
     logger.info("Translation result: '%s'", translation[:50])
+    memory.store(request.text, request.targetLanguage, translation)
 
-    return {
-        "translation": translation,
-        "targetLanguage": request.targetLanguage,
-        "model": active_model
-    }
+    return {"translation": translation, **response, "model": active_model}
 
 
 class YouTubeReportRequest(BaseModel):
     """YouTube报告生成请求"""
     title: str
-    transcript: str
+    transcript: str = ""
+    # 带时间轴的字幕片段（提供时按时间切块）
+    segments: Optional[List[TranscriptSegment]] = None
+    # 自定义报告结构（替换默认的四个部分，分块笔记可复用）
+    template: Optional[str] = None
     model: Literal["grok", "openai", "gpt-4"] = "gpt-4"
 
 
+DEFAULT_YOUTUBE_REPORT_TEMPLATE = """Generate a structured report with the following sections:
+1. **Summary** (概要): 2-3 sentences summarizing the main content
+2. **Key Points** (要点): 3-5 bullet points of the most important takeaways
+3. **Detailed Analysis** (详细分析): Deeper analysis of the content, themes, and implications
+4. **Conclusions** (结论): Final thoughts and recommendations"""
+
+
 @router.post("/youtube-report")
 async def generate_youtube_report(
     request: YouTubeReportRequest,
-    orch: AIOrchestrator = Depends(get_orchestrator)
+    orch: AIOrchestrator = Depends(get_orchestrator),
+    use_cache: bool = Depends(use_response_cache)
 ):
     """
     根据YouTube字幕生成报告
 
+    长字幕先按时间与语义切块并发生成笔记（按块哈希缓存），分层归并后
+    再按报告模板生成最终报告；短字幕直接生成。
+
     Args:
         request: YouTube报告请求
 
@@ -769,26 +873,45 @@ async def generate_youtube_report(
         报告内容
     """
     logger.info(f"Generating YouTube report for: {request.title}")
+    if not request.transcript.strip() and not request.segments:
+        raise HTTPException(status_code=400, detail="Transcript is empty")
+
+    _, active_model = select_ai_client(request.model, orch, "YouTube report", endpoint="youtube-report")
+
+    summarizer = TranscriptSummarizer(
+        orch,
+        SummarizationConfig.from_env(),
+        preferred=active_model,
+        use_cache=use_cache,
+    )
+    digest = await summarizer.digest(request.transcript, request.segments)
+    if digest is None:
+        raise HTTPException(status_code=503, detail="Failed to generate report")
+    if digest.failed_chunks:
+        logger.warning(
+            f"YouTube report covers the transcript partially: "
+            f"{digest.failed_chunks}/{digest.chunks} chunk(s) failed"
+        )
 
     prompt = f"""Please analyze the following YouTube video transcript and generate a comprehensive report.
 
 Video Title: {request.title}
 
-Transcript:
-{request.transcript}
+{digest.heading}:
+{digest.text}
 
-Generate a structured report with the following sections:
-1. **Summary** (概要): 2-3 sentences summarizing the main content
-2. **Key Points** (要点): 3-5 bullet points of the most important takeaways
-3. **Detailed Analysis** (详细分析): Deeper analysis of the content, themes, and implications
-4. **Conclusions** (结论): Final thoughts and recommendations
+{request.template or DEFAULT_YOUTUBE_REPORT_TEMPLATE}
 
 Format the output in clear sections with markdown headings."""
 
-    # Select AI client for YouTube reports with fallback
-    client, active_model = select_ai_client(request.model, orch, "YouTube report")
-
-    result = await client.generate_completion(prompt, max_tokens=2000, temperature=0.7)
+    result, model = await orch.generate_completion(
+        prompt,
+        max_tokens=2000,
+        temperature=0.7,
+        preferred=active_model,
+        endpoint="youtube-report",
+        use_cache=use_cache,
+    )
 
     if result is None:
         raise HTTPException(status_code=503, detail="Failed to generate report")
@@ -802,5 +925,8 @@ Format the output in clear sections with markdown headings."""
                 "content": result
             }
         ],
-        "model": active_model
+        "model": model,
+        "chunks": digest.chunks,
+        "cachedChunks": digest.cached_chunks,
+        "failedChunks": digest.failed_chunks,
     }
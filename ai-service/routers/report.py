@@ -1,11 +1,26 @@
 """
 报告生成路由 - 多素材AI综合报告
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional, Tuple
+import asyncio
 import json
 import logging
+import re
+
+from models.schemas import TranscriptSegment
+from routers.ai import use_response_cache
+from services.ai_orchestrator import AIOrchestrator
+from services.context_window import split_passages
+from services.segment_translation import SegmentTranslator
+from services.stream_relay import SSE_HEADERS, SSERelay, StreamRelayConfig
+from services.transcript_summarization import (
+    SummarizationConfig,
+    TranscriptSummarizer,
+    split_transcript_sentences,
+)
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -29,6 +44,12 @@ def init_clients(grok, openai):
     logger.info("Report router: AI clients initialized")
 
 
+def get_orchestrator() -> AIOrchestrator:
+    """获取 AI 编排器实例"""
+    from main import orchestrator
+    return orchestrator
+
+
 class Resource(BaseModel):
     """资源模型"""
     id: str
@@ -61,34 +82,40 @@ class ReportResponse(BaseModel):
     metadata: Optional[Dict[str, Any]] = None
 
 
+def _format_authors(authors: Any) -> str:
+    """作者字段 -> 文本（最多3位）"""
+    if not authors:
+        return "N/A"
+    if isinstance(authors, list):
+        # 处理dict或string列表
+        author_names = []
+        for author in authors[:3]:
+            if isinstance(author, dict):
+                # 尝试从dict中提取name字段
+                author_names.append(author.get('name', author.get('id', str(author))))
+            elif isinstance(author, str):
+                author_names.append(author)
+        return ", ".join(author_names) if author_names else "N/A"
+    if isinstance(authors, str):
+        return authors
+    return "N/A"
+
+
+def _format_tags(tags: Any) -> str:
+    """标签字段 -> 文本（最多5个）"""
+    if not tags:
+        return "N/A"
+    if isinstance(tags, list):
+        return ", ".join(tags[:5])  # 只显示前5个标签
+    if isinstance(tags, str):
+        return tags
+    return "N/A"
+
+
 def prepare_resources_info(resources: List[Resource]) -> str:
     """准备资源信息文本"""
     info_parts = []
     for i, resource in enumerate(resources, 1):
-        # 处理authors
-        authors_str = "N/A"
-        if resource.authors:
-            if isinstance(resource.authors, list):
-                # 处理dict或string列表
-                author_names = []
-                for author in resource.authors[:3]:
-                    if isinstance(author, dict):
-                        # 尝试从dict中提取name字段
-                        author_names.append(author.get('name', author.get('id', str(author))))
-                    elif isinstance(author, str):
-                        author_names.append(author)
-                authors_str = ", ".join(author_names) if author_names else "N/A"
-            elif isinstance(resource.authors, str):
-                authors_str = resource.authors
-
-        # 处理tags
-        tags_str = "N/A"
-        if resource.tags:
-            if isinstance(resource.tags, list):
-                tags_str = ", ".join(resource.tags[:5])  # 只显示前5个标签
-            elif isinstance(resource.tags, str):
-                tags_str = resource.tags
-
         # 处理abstract
         abstract = resource.abstract or "No abstract available"
         if len(abstract) > 500:
@@ -100,8 +127,8 @@ Resource {i}:
 - Title: {resource.title}
 - Type: {resource.type}
 - Date: {resource.published_date or 'N/A'}
-- Authors: {authors_str}
-- Tags: {tags_str}
+- Authors: {_format_authors(resource.authors)}
+- Tags: {_format_tags(resource.tags)}
 - Abstract: {abstract}
 """
         info_parts.append(info)
@@ -109,6 +136,35 @@ Resource {i}:
     return "\n".join(info_parts)
 
 
+def prepare_resource_passages(resources: List[Resource], max_tokens: int = 200) -> List[str]:
+    """
+    把资源切成可按相关性挑选的片段（不截断摘要）
+
+    每个资源的第一个片段包含元数据，其余片段标注所属资源。
+
+    Args:
+        resources: 资源列表
+        max_tokens: 单个摘要片段的 token 上限
+
+    Returns:
+        片段列表（按资源顺序）
+    """
+    passages: List[str] = []
+    for i, resource in enumerate(resources, 1):
+        header = f"""Resource {i}:
+- ID: {resource.id}
+- Title: {resource.title}
+- Type: {resource.type}
+- Date: {resource.published_date or 'N/A'}
+- Authors: {_format_authors(resource.authors)}
+- Tags: {_format_tags(resource.tags)}"""
+        parts = split_passages(resource.abstract or "", max_tokens) or ["No abstract available"]
+        passages.append(f"{header}\n- Abstract: {parts[0]}")
+        for part in parts[1:]:
+            passages.append(f"Resource {i} ({resource.title}) abstract, continued: {part}")
+    return passages
+
+
 # 报告模板Prompts
 REPORT_PROMPTS = {
     "comparison": """You are a technical analyst. Analyze and compare the following {count} resources.
@@ -622,7 +678,10 @@ class ChatResponse(BaseModel):
 
 
 @router.post("/api/v1/ai/chat", response_model=ChatResponse)
-async def chat_with_resources(request: ChatRequest):
+async def chat_with_resources(
+    request: ChatRequest,
+    orch: AIOrchestrator = Depends(get_orchestrator)
+):
     """
     与资源进行对话，基于资源内容回答问题
 
@@ -635,26 +694,26 @@ async def chat_with_resources(request: ChatRequest):
     try:
         logger.info(f"Chat request for {len(request.resources)} resources using {request.model}")
 
-        # 1. 准备资源信息上下文
-        resources_context = prepare_resources_info(request.resources)
+        # 1. 准备资源片段（超出预算时按与问题的相关性挑选）
+        window_manager = orch.context_window
+        passages = prepare_resource_passages(request.resources, window_manager.config.passage_tokens)
 
         # 2. 构建系统提示
-        system_prompt = f"""你是一个专业的研究助手。用户选择了以下资源，你需要基于这些资源的内容回答用户的问题。
-
-资源信息：
-{resources_context}
-
-请基于以上资源内容回答用户的问题。如果问题涉及资源中没有的信息，请明确指出。回答要准确、专业、有条理。"""
-
-        # 3. 构建消息列表
-        messages = [{"role": "system", "content": system_prompt}]
-
-        # 添加历史对话（最多保留最近5轮）
-        for h in request.history[-10:]:  # 最多10条历史消息
-            messages.append(h)
-
-        # 添加当前用户消息
-        messages.append({"role": "user", "content": request.message})
+        system_prompt = """你是一个专业的研究助手。用户选择了以下资源，你需要基于这些资源的内容回答用户的问题。
+请基于资源内容回答用户的问题。如果问题涉及资源中没有的信息，请明确指出。回答要准确、专业、有条理。"""
+
+        # 3. 按 token 预算组装消息：系统提示 > 最近轮次 > 相关资源片段，旧轮次滚动为摘要
+        window = await window_manager.build(
+            system_prompt,
+            request.history,
+            request.message,
+            model="gpt-4" if request.model == "gpt-4" else grok_client.model,
+            reply_tokens=1500,
+            passages=passages,
+            passages_heading="资源信息：",
+            preferred="openai" if request.model == "gpt-4" else "grok",
+        )
+        messages = window.messages
 
         # 4. 调用AI生成响应
         if request.model == "gpt-4":
@@ -691,6 +750,32 @@ async def chat_with_resources(request: ChatRequest):
 
 
 # AI Office Chat 相关模型和端点
+
+# AI Office 上下文中资源部分的起始行（之前的内容是系统提示与指令）
+_OFFICE_RESOURCES_START = re.compile(r"^(以下是用户选择的资源信息|资源\s*\d+\s*[:：])", re.MULTILINE)
+_OFFICE_RESOURCES_HEADING = "以下是用户选择的资源信息"
+
+
+def split_office_context(context: str) -> Tuple[str, str, str]:
+    """
+    把 AI Office 的上下文拆成指令与资源两部分
+
+    Args:
+        context: 前端传入的上下文（系统提示 + 资源信息）
+
+    Returns:
+        (指令, 资源标题, 资源正文)；找不到资源部分时整段视为指令
+    """
+    match = _OFFICE_RESOURCES_START.search(context)
+    if match is None:
+        return context.strip(), "", ""
+    instructions = context[:match.start()].strip()
+    resources = context[match.start():].strip()
+    heading = ""
+    if resources.startswith(_OFFICE_RESOURCES_HEADING):
+        heading, _, resources = resources.partition("\n")
+    return instructions, heading.strip(), resources.strip()
+
 class ReportsChatRequest(BaseModel):
     """AI Office 报告对话请求"""
     message: str = Field(..., min_length=1)
@@ -702,7 +787,11 @@ class ReportsChatRequest(BaseModel):
 
 
 @router.post("/api/v1/reports/chat")
-async def reports_chat(request: ReportsChatRequest):
+async def reports_chat(
+    request: ReportsChatRequest,
+    http_request: Request,
+    orch: AIOrchestrator = Depends(get_orchestrator)
+):
     """
     AI Office 对话端点 - 支持流式和非流式响应
 
@@ -711,36 +800,6 @@ async def reports_chat(request: ReportsChatRequest):
     try:
         logger.info(f"Reports chat request using {request.model}, stream={request.stream}, message={request.message[:50]}...")
 
-        # 构建消息列表
-        messages = []
-
-        # 如果有上下文，添加为系统消息
-        if request.context:
-            messages.append({
-                "role": "system",
-                "content": request.context
-            })
-
-        # 添加对话历史（如果有）
-        if request.conversationHistory and len(request.conversationHistory) > 0:
-            # 只取最近的5轮对话（10条消息），避免上下文过长
-            recent_history = request.conversationHistory[-10:]
-            logger.info(f"Adding {len(recent_history)} messages from conversation history")
-            for hist_msg in recent_history:
-                if 'role' in hist_msg and 'content' in hist_msg:
-                    messages.append({
-                        "role": hist_msg['role'],
-                        "content": hist_msg['content']
-                    })
-
-        # 添加当前用户消息
-        messages.append({
-            "role": "user",
-            "content": request.message
-        })
-
-        logger.info(f"Total messages in context: {len(messages)}")
-
         # 选择 AI 客户端 - 基于传入的模型名称
         # 支持: gpt-4, openai, grok 等
         model_name = (request.model or "").lower()
@@ -758,59 +817,40 @@ async def reports_chat(request: ReportsChatRequest):
                 detail="AI service unavailable"
             )
 
+        # 按 token 预算组装消息：指令部分作为固定的系统提示始终保留（前缀稳定，可命中
+        # 提示词缓存），只有资源部分在超出预算时按与问题的相关性挑选段落，旧轮次滚动为摘要
+        instructions, resources_heading, resources_text = split_office_context(request.context or "")
+        window = await orch.context_window.build(
+            instructions,
+            request.conversationHistory or [],
+            request.message,
+            # 非流式的 OpenAI 对话使用 chat() 的默认模型 gpt-4
+            model="gpt-4" if ai_client is openai_client and not request.stream else ai_client.model,
+            reply_tokens=2000,
+            passages=split_passages(resources_text, orch.context_window.config.passage_tokens),
+            passages_heading=resources_heading,
+            preferred="openai" if ai_client is openai_client else "grok",
+        )
+        messages = window.messages
+        logger.info(f"Total messages in context: {len(messages)} (~{window.tokens} tokens)")
+
         # 流式响应
         if request.stream:
-            from fastapi.responses import StreamingResponse
-            import asyncio
-
-            async def generate_stream():
-                """生成 SSE 流式响应"""
-                try:
-                    import json
-                    logger.info("Starting SSE stream generation")
-                    # 使用 stream_completion 方法
-                    # 将 messages 转换为单个 prompt
-                    prompt_parts = []
-                    for msg in messages:
-                        role = msg.get("role", "user")
-                        content = msg.get("content", "")
-                        if role == "system":
-                            prompt_parts.append(f"System: {content}")
-                        elif role == "user":
-                            prompt_parts.append(f"User: {content}")
-
-                    full_prompt = "\n\n".join(prompt_parts)
-                    logger.info(f"Prompt length: {len(full_prompt)} chars")
-
-                    chunk_count = 0
-                    async for chunk in ai_client.stream_completion(
-                        prompt=full_prompt,
-                        max_tokens=2000,
-                        temperature=0.7
-                    ):
-                        if chunk:
-                            chunk_count += 1
-                            # SSE 格式 - 返回 JSON
-                            json_data = json.dumps({'content': chunk})
-                            logger.debug(f"Sending chunk {chunk_count}: {len(chunk)} chars")
-                            yield f"data: {json_data}\n\n"
-                            await asyncio.sleep(0)  # 让出控制权
-
-                    logger.info(f"Stream completed. Total chunks: {chunk_count}")
-                    # 发送结束标记
-                    yield "data: [DONE]\n\n"
-
-                except Exception as e:
-                    logger.error(f"Stream generation error: {e}", exc_info=True)
-                    yield f"data: {json.dumps({'error': str(e)})}\n\n"
-
+            # 按消息原样流式发送（保留助手轮次），稳定的系统/上下文前缀可命中提供商的提示词缓存
+            relay = SSERelay(
+                ai_client.stream_chat(
+                    messages=messages,
+                    max_tokens=2000,
+                    temperature=0.7
+                ),
+                endpoint="reports-chat",
+                config=StreamRelayConfig.from_env(),
+                is_disconnected=http_request.is_disconnected,
+            )
             return StreamingResponse(
-                generate_stream(),
+                relay.stream(),
                 media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                }
+                headers=SSE_HEADERS
             )
 
         # 非流式响应
@@ -846,7 +886,8 @@ async def reports_chat(request: ReportsChatRequest):
 class YoutubeReportRequest(BaseModel):
     """YouTube报告生成请求"""
     title: str
-    transcript: str
+    transcript: str = ""
+    segments: Optional[List[TranscriptSegment]] = None
     model: str = Field(default="gpt-4", pattern="^(grok|gpt-4)$")
 
 
@@ -861,124 +902,248 @@ class YoutubeReportResponse(BaseModel):
     title: str
     summary: str
     translations: List[TranscriptLine]
+    # 重试后仍未翻译的句子数（这些句子的 chinese 为空字符串）
+    untranslated: int = 0
+    # 生成笔记失败的字幕块数（非零时概要只覆盖部分视频）
+    failed_chunks: int = 0
 
 
-@router.post("/youtube-report", response_model=YoutubeReportResponse)
-async def generate_youtube_report(request: YoutubeReportRequest):
-    """
-    生成YouTube视频字幕报告（含逐句中英翻译）
+# 对照翻译的目标语言（与 /api/v1/ai/translate-segments 共享翻译记忆）
+YOUTUBE_REPORT_TARGET_LANGUAGE = "zh-CN"
+
+
+def _preferred_provider(model: str) -> str:
+    """请求中的模型名 -> 编排器提供商名"""
+    return "openai" if model == "gpt-4" else "grok"
+
+
+async def _generate_youtube_summary(
+    orch: AIOrchestrator,
+    request: YoutubeReportRequest,
+    preferred: str,
+    use_cache: bool = True
+) -> Tuple[str, int]:
     """
-    try:
-        logger.info(f"Generating YouTube report for: {request.title}")
+    生成视频概要（长字幕先分块生成笔记再归并，覆盖全文）
 
-        # 选择AI客户端
-        ai_client = openai_client if request.model == "gpt-4" else grok_client
+    Args:
+        orch: AI 编排器
+        request: YouTube报告请求
+        preferred: 偏好的提供商
+        use_cache: 是否使用块缓存与响应缓存
 
-        # 第一步：生成概要
-        summary_prompt = f"""
+    Returns:
+        (概要文本, 生成笔记失败的字幕块数)
+    """
+    summarizer = TranscriptSummarizer(
+        orch,
+        SummarizationConfig.from_env(),
+        preferred=preferred,
+        use_cache=use_cache,
+    )
+    digest = await summarizer.digest(request.transcript, request.segments)
+    if digest is None:
+        raise HTTPException(status_code=503, detail="AI service unavailable")
+
+    summary_prompt = f"""
+你是一个专业的视频内容分析师。
 请为以下YouTube视频生成一个简洁的概要（200-300字），包括：
 1. 视频主要内容
 2. 核心观点
 3. 关键信息
 
 视频标题：{request.title}
-视频字幕：
-{request.transcript}
+{"视频分段笔记（按时间顺序）" if digest.kind == "notes" else "视频字幕"}：
+{digest.text}
 
 请直接返回概要文本，不需要其他格式。
 """
 
-        logger.info("Step 1: Generating summary...")
-        summary_response = await ai_client.chat_completion(
-            messages=[
-                {"role": "system", "content": "你是一个专业的视频内容分析师。"},
-                {"role": "user", "content": summary_prompt}
-            ]
-        )
-
-        summary = summary_response.get("content", "")
-        logger.info(f"Summary generated: {len(summary)} characters")
+    summary, _ = await orch.generate_completion(
+        summary_prompt,
+        max_tokens=800,
+        temperature=0.7,
+        preferred=preferred,
+        endpoint="youtube-report",
+        use_cache=use_cache,
+    )
+    if summary is None:
+        raise HTTPException(status_code=503, detail="AI service unavailable")
+    logger.info(f"Summary generated: {len(summary)} characters ({digest.chunks} chunk(s))")
+    return summary.strip(), digest.failed_chunks
+
+
+def _sentence_translator(
+    orch: AIOrchestrator,
+    preferred: str,
+    use_cache: bool = True
+) -> SegmentTranslator:
+    """逐句对照翻译器（分批并发，仅重试缺失的句子）"""
+    return SegmentTranslator(
+        orch,
+        YOUTUBE_REPORT_TARGET_LANGUAGE,
+        preferred=preferred,
+        use_cache=use_cache,
+        memory=orch.translation_memory,
+        batcher=orch.segment_batcher,
+    )
 
-        # 第二步：将字幕分句并翻译
-        # 简化：一次性处理所有文本，但限制最大长度
-        transcript_text = request.transcript[:6000]  # 限制最大长度避免token超限
 
-        translation_prompt = f"""
-请将以下英文字幕按句翻译成中文。
-
-要求：
-1. 按语义完整性分句（每句2-3行左右）
-2. 每句英文对应一句中文翻译
-3. 翻译要准确、流畅、地道
-4. 确保ALL句子都有翻译，不要遗漏
-5. 返回JSON格式
+@router.post("/youtube-report", response_model=YoutubeReportResponse)
+async def generate_youtube_report(
+    request: YoutubeReportRequest,
+    orch: AIOrchestrator = Depends(get_orchestrator),
+    use_cache: bool = Depends(use_response_cache)
+):
+    """
+    生成YouTube视频字幕报告（含逐句中英翻译）
 
-格式：
-{{
-  "translations": [
-    {{"english": "First sentence here.", "chinese": "第一句的中文翻译。"}},
-    {{"english": "Second sentence here.", "chinese": "第二句的中文翻译。"}}
-  ]
-}}
+    整份字幕在本地分句，按 token 预算分批并发翻译，每句译文按索引与原句
+    对齐；概要与翻译同时进行。
+    """
+    try:
+        logger.info(f"Generating YouTube report for: {request.title}")
+        if not request.transcript.strip() and not request.segments:
+            raise HTTPException(status_code=400, detail="Transcript is empty")
 
-英文字幕：
-{transcript_text}
+        preferred = _preferred_provider(request.model)
+        sentences = split_transcript_sentences(request.transcript, request.segments)
+        translator = _sentence_translator(orch, preferred, use_cache)
 
-请严格按照JSON格式返回，不要添加markdown标记。
-"""
-
-        logger.info("Step 2: Generating translations...")
-        translation_response = await ai_client.chat_completion(
-            messages=[
-                {"role": "system", "content": "你是专业的英中翻译专家。请严格按照JSON格式返回完整的翻译结果。"},
-                {"role": "user", "content": translation_prompt}
-            ]
+        logger.info(f"Generating summary and translating {len(sentences)} sentence(s)...")
+        # 任一方失败时取消另一方，避免客户端已收到错误后仍在消耗配额
+        summary_task = asyncio.create_task(
+            _generate_youtube_summary(orch, request, preferred, use_cache)
         )
-
-        # 解析翻译结果
-        translation_content = translation_response.get("content", "")
-        logger.info(f"Translation response: {len(translation_content)} characters")
-
-        # 清理并解析JSON
+        translate_task = asyncio.create_task(translator.translate(sentences))
         try:
-            # 移除可能的markdown代码块标记
-            clean_content = translation_content.strip()
-            if clean_content.startswith("```"):
-                lines = clean_content.split("\n")
-                clean_content = "\n".join(lines[1:-1]) if len(lines) > 2 else clean_content
-                clean_content = clean_content.replace("```json", "").replace("```", "").strip()
-
-            translation_data = json.loads(clean_content)
-            translations = translation_data.get("translations", [])
-
-            if not translations:
-                raise ValueError("No translations found in response")
-
-            logger.info(f"Successfully parsed {len(translations)} translation pairs")
-
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.error(f"Failed to parse translations: {e}")
-            logger.error(f"Raw content: {translation_content[:1000]}")
-
-            # 降级处理：简单分段
-            sentences = [s.strip() + '.' for s in request.transcript.split('.') if s.strip()]
-            translations = []
-
-            for i, sentence in enumerate(sentences[:30]):  # 限制最多30句
-                if sentence:
-                    translations.append({
-                        "english": sentence,
-                        "chinese": f"[翻译失败] 句子 {i+1}"
-                    })
-
-        logger.info(f"Generated {len(translations)} translation pairs")
+            (summary, failed_chunks), translated = await asyncio.gather(
+                summary_task, translate_task
+            )
+        finally:
+            for task in (summary_task, translate_task):
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()
+
+        untranslated = len(sentences) - len(translated)
+        if untranslated:
+            logger.warning(f"{untranslated}/{len(sentences)} sentence(s) left untranslated")
+        if failed_chunks:
+            logger.warning(f"Summary covers the transcript partially: {failed_chunks} chunk(s) failed")
+        logger.info(f"Generated {len(translated)} translation pairs")
 
         return YoutubeReportResponse(
             title=request.title,
             summary=summary,
-            translations=[TranscriptLine(**t) for t in translations]
+            translations=[
+                TranscriptLine(english=sentence, chinese=translated.get(index, ""))
+                for index, sentence in enumerate(sentences)
+            ],
+            untranslated=untranslated,
+            failed_chunks=failed_chunks,
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating YouTube report: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/youtube-report/stream")
+async def stream_youtube_report(
+    request: YoutubeReportRequest,
+    format: Literal["ndjson", "sse"] = "ndjson",
+    orch: AIOrchestrator = Depends(get_orchestrator),
+    use_cache: bool = Depends(use_response_cache)
+):
+    """
+    生成YouTube视频字幕报告（流式）
+
+    先输出 {"type": "start", "total"}，随后每译完一句输出
+    {"type": "pair", "index", "english", "chinese"}（按完成顺序），概要就绪时
+    输出 {"type": "summary", "summary", "failed_chunks"}；重试后仍未翻译的句子以空译文补齐
+    （"fallback": true），最后输出 {"type": "done", ...}。
+    """
+    if not request.transcript.strip() and not request.segments:
+        raise HTTPException(status_code=400, detail="Transcript is empty")
+
+    preferred = _preferred_provider(request.model)
+    sentences = split_transcript_sentences(request.transcript, request.segments)
+    translator = _sentence_translator(orch, preferred, use_cache)
+
+    def encode(record: dict) -> str:
+        payload = json.dumps(record, ensure_ascii=False)
+        return f"data: {payload}\n\n" if format == "sse" else payload + "\n"
+
+    def summary_record(task: asyncio.Task) -> dict:
+        error = task.exception()
+        if error is None:
+            summary, failed_chunks = task.result()
+            return {"type": "summary", "summary": summary, "failed_chunks": failed_chunks}
+        detail = error.detail if isinstance(error, HTTPException) else str(error)
+        logger.error(f"YouTube report summary failed: {detail}")
+        return {"type": "error", "stage": "summary", "error": detail}
+
+    async def generate():
+        summary_task = asyncio.create_task(
+            _generate_youtube_summary(orch, request, preferred, use_cache)
+        )
+        summary_sent = False
+        translated = set()
+        try:
+            yield encode({"type": "start", "title": request.title, "total": len(sentences)})
+
+            async for index, chinese in translator.iter_segments(sentences):
+                translated.add(index)
+                yield encode({
+                    "type": "pair",
+                    "index": index,
+                    "english": sentences[index],
+                    "chinese": chinese,
+                })
+                if not summary_sent and summary_task.done():
+                    summary_sent = True
+                    yield encode(summary_record(summary_task))
+
+            fallback = [idx for idx in range(len(sentences)) if idx not in translated]
+            for idx in fallback:
+                yield encode({
+                    "type": "pair",
+                    "index": idx,
+                    "english": sentences[idx],
+                    "chinese": "",
+                    "fallback": True,
+                })
+
+            if not summary_sent:
+                await asyncio.wait({summary_task})
+                summary_sent = True
+                yield encode(summary_record(summary_task))
+
+            yield encode({
+                "type": "done",
+                "total": len(sentences),
+                "translated": len(translated),
+                "fallback": len(fallback),
+                "model": translator.model_used or preferred,
+            })
+        except Exception as e:
+            logger.error(f"YouTube report streaming error: {e}")
+            yield encode({"type": "error", "error": str(e)})
+        finally:
+            if not summary_task.done():
+                summary_task.cancel()
+            elif not summary_task.cancelled():
+                summary_task.exception()
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
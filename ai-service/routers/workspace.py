@@ -1,12 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Any, Dict, List, Optional
 
 from services.workspace_task_manager import (
+    TaskPriority,
     WorkspaceTaskPayload,
     workspace_task_manager,
     WorkspaceTaskStatus,
 )
+from services.stream_relay import SSE_HEADERS, StreamRelayConfig
 from utils.feature_flags import is_workspace_ai_v2_enabled
 
 
@@ -18,6 +21,12 @@ class CreateWorkspaceTaskRequest(BaseModel):
     question: Optional[str] = None
     overrides: Optional[Dict[str, Any]] = None
     resourceIds: Optional[List[str]] = Field(default=None, description="Filtered resource ids used for the task")
+    priority: TaskPriority = Field(default="normal", description="Queue priority class: high/normal/low")
+    deadlineSeconds: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="Seconds from creation before the task is failed (defaults to WORKSPACE_TASK_DEADLINE_SECONDS)",
+    )
 
 
 class WorkspaceTaskStatusResponse(WorkspaceTaskStatus):
@@ -44,6 +53,8 @@ async def create_workspace_task(request: CreateWorkspaceTaskRequest):
         question=request.question,
         overrides=request.overrides,
         resource_ids=request.resourceIds,
+        priority=request.priority,
+        deadline_seconds=request.deadlineSeconds,
     )
     status = await workspace_task_manager.create_task(payload)
     return status
@@ -56,3 +67,34 @@ async def get_workspace_task_status(task_id: str):
         return await workspace_task_manager.get_task(task_id)
     except KeyError:
         raise HTTPException(status_code=404, detail=f"任务 {task_id} 不存在")
+
+
+@router.delete("/{task_id}", response_model=WorkspaceTaskStatusResponse)
+async def cancel_workspace_task(task_id: str):
+    """Cancel a pending or running task; in-flight provider requests are aborted."""
+    _ensure_enabled()
+    try:
+        return await workspace_task_manager.cancel_task(task_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"任务 {task_id} 不存在")
+
+
+@router.get("/{task_id}/events")
+async def stream_workspace_task_events(task_id: str, http_request: Request):
+    """
+    Push task progress over SSE instead of polling.
+
+    Events: status (transitions and queue position), progress (pipeline
+    stage counters), section (each report section once produced) and a final
+    result carrying the same body as GET /{task_id}, after which the stream ends.
+    """
+    _ensure_enabled()
+    try:
+        frames = await workspace_task_manager.subscribe(
+            task_id,
+            heartbeat_seconds=StreamRelayConfig.from_env().heartbeat_seconds,
+            is_disconnected=http_request.is_disconnected,
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"任务 {task_id} 不存在")
+    return StreamingResponse(frames, media_type="text/event-stream", headers=SSE_HEADERS)
@@ -1,10 +1,23 @@
 """
 AI 编排器 - 管理多个 AI 服务提供商的故障切换
 """
-from typing import Optional, Literal
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Optional, Literal
 from loguru import logger
+from utils.deadline import deadline_expired
+from .context_window import ContextWindowConfig, ContextWindowManager
+from .circuit_breaker import BreakerPermit, CircuitBreaker, CircuitBreakerConfig, CircuitState
 from .grok_client import GrokClient
 from .openai_client import OpenAIClient
+from .persistent_cache import PersistentCache, PersistentCacheConfig
+from .provider_routing import DEFAULT_ENDPOINT, LatencyTracker, RoutingPolicy, build_routing_policy
+from .rate_limiter import ProviderRateLimiter, RateLimitConfig
+from .request_hedging import HedgingConfig, RequestHedger
+from .response_cache import ResponseCache, ResponseCacheConfig, build_cache_key
+from .single_flight import SingleFlight
+from .token_batching import TokenBatchingConfig, TokenBudgetBatcher
+from .translation_memory import TranslationMemory, TranslationMemoryConfig
 
 
 class AIOrchestrator:
@@ -21,88 +34,486 @@ class AIOrchestrator:
         self.grok = grok_client
         self.openai = openai_client
 
-        # 故障计数器
-        self.grok_failures = 0
-        self.openai_failures = 0
+        # 默认偏好（优先使用 Grok），实际顺序由路由策略决定，熔断时自动跳过
+        self.preferred_model: Literal["grok", "openai"] = "grok"
 
-        # 故障阈值（连续失败 3 次则切换）
-        self.failure_threshold = 3
+        # 每个提供商一个熔断器
+        breaker_config = CircuitBreakerConfig.from_env()
+        self.breakers: Dict[str, CircuitBreaker] = {
+            "grok": CircuitBreaker("grok", breaker_config),
+            "openai": CircuitBreaker("openai", breaker_config),
+        }
+
+        # 滚动延迟统计 + 可插拔路由策略
+        self.latency = LatencyTracker()
+        self.policy: RoutingPolicy = build_routing_policy(self.latency)
+
+        # 对冲请求（按端点 opt-in）
+        self.hedger = RequestHedger(HedgingConfig.from_env())
+
+        # 内容寻址响应缓存：内存 LRU（一级）+ SQLite 持久化（二级，重启后仍可命中）
+        self.cache = ResponseCache(ResponseCacheConfig.from_env())
+        self.disk_cache = PersistentCache(PersistentCacheConfig.from_env())
+
+        # 翻译记忆（按原文复用译文，供各翻译端点共享）
+        self.translation_memory = TranslationMemory(TranslationMemoryConfig.from_env())
+
+        # 字幕翻译按 token 预算分批（跨请求学习各语言对的输出/输入比）
+        self.segment_batcher = TokenBudgetBatcher(TokenBatchingConfig.from_env())
+
+        # 对话上下文按 token 预算组装（旧轮次滚动为摘要，摘要存放在上面的缓存中）
+        self.context_window = ContextWindowManager(self, ContextWindowConfig.from_env())
+
+        # 按提供商限流（批量回填时避免触发上游 429）
+        self.rate_limiter = ProviderRateLimiter(RateLimitConfig.from_env())
 
-        # 当前活跃模型
-        self._active_model: Literal["grok", "openai"] = "grok"  # 默认优先使用 Grok
+        # 合并并发的相同请求（批量入库时多个 worker 可能同时处理相同内容）
+        self.single_flight = SingleFlight()
 
-        logger.info("AIOrchestrator initialized")
+        logger.info(f"AIOrchestrator initialized (routing policy: {self.policy.name})")
+
+    async def start(self):
+        """应用启动时打开持久化缓存与翻译记忆"""
+        await self.disk_cache.open()
+        await self.translation_memory.open()
+
+    async def aclose(self):
+        """应用关闭时刷新并关闭持久化缓存与翻译记忆"""
+        await self.context_window.aclose()
+        await self.translation_memory.close()
+        await self.disk_cache.close()
+
+    def set_policy(self, policy: RoutingPolicy):
+        """
+        替换路由策略
+
+        Args:
+            policy: 新的路由策略
+        """
+        self.policy = policy
+        logger.info(f"Routing policy set to {policy.name}")
 
     @property
     def active_model(self) -> str:
-        """获取当前活跃模型"""
-        return self._active_model
+        """获取当前活跃模型（路由顺序中首个未熔断的提供商）"""
+        for name in self.rank_providers():
+            if self.breakers[name].state != CircuitState.OPEN:
+                return name
+        return self.preferred_model
+
+    def rank_providers(
+        self,
+        preferred: Optional[str] = None,
+        endpoint: Optional[str] = None
+    ) -> List[str]:
+        """
+        按路由策略排列可用提供商
+
+        Args:
+            preferred: 请求偏好的提供商
+            endpoint: 端点名称（用于端点级覆盖）
+
+        Returns:
+            提供商名称列表，按尝试顺序排列
+        """
+        fallback = "openai" if self.preferred_model == "grok" else "grok"
+        candidates = [
+            (name, self._client(name).model)
+            for name in (self.preferred_model, fallback)
+            if self._client(name).available
+        ]
+        return self.policy.rank(
+            candidates,
+            preferred=preferred or self.preferred_model,
+            endpoint=endpoint,
+        )
+
+    def _client(self, name: str):
+        return self.grok if name == "grok" else self.openai
+
+    def provider_model(self, name: str) -> str:
+        """
+        提供商当前使用的模型名称
+
+        Args:
+            name: 提供商名称
+
+        Returns:
+            模型名称
+        """
+        return self._client(name).model
+
+    def is_provider_healthy(self, name: str) -> bool:
+        """
+        提供商是否可用且未熔断
+
+        Args:
+            name: 提供商名称
+
+        Returns:
+            是否健康
+        """
+        return self._client(name).available and self.breakers[name].state != CircuitState.OPEN
 
     async def generate_completion(
         self,
         prompt: str,
         max_tokens: int = 500,
         temperature: float = 0.7,
-        force_model: Optional[Literal["grok", "openai"]] = None
+        force_model: Optional[Literal["grok", "openai"]] = None,
+        preferred: Optional[Literal["grok", "openai"]] = None,
+        endpoint: Optional[str] = None,
+        hedge: Optional[bool] = None,
+        use_cache: bool = True,
+        cache_high_temperature: bool = False
     ) -> tuple[Optional[str], str]:
         """
-        生成文本补全（带故障切换）
+        生成文本补全（带缓存、路由、熔断、对冲与故障切换）
 
         Args:
             prompt: 提示词
             max_tokens: 最大 token 数
             temperature: 温度参数
             force_model: 强制使用的模型
+            preferred: 偏好的模型（路由策略可能因延迟改选）
+            endpoint: 端点名称（用于路由覆盖与统计）
+            hedge: 是否对冲，None 表示按端点配置决定
+            use_cache: 是否使用响应缓存（调用方可通过请求头绕过）
+            cache_high_temperature: 是否允许缓存高温度请求
 
         Returns:
             (生成的文本, 使用的模型名称)
         """
-        # 如果指定了强制模型，直接使用
-        if force_model:
-            return await self._try_model(force_model, prompt, max_tokens, temperature)
+        order = [force_model] if force_model else self.rank_providers(preferred, endpoint)
+
+        cache_keys: Dict[str, str] = {}
+        if not use_cache:
+            self.cache.record_bypass()
+        elif self.cache.is_cacheable(temperature, cache_high_temperature):
+            cache_keys = {
+                name: self._cache_key(name, prompt, max_tokens, temperature)
+                for name in order
+            }
+            keys = list(cache_keys.values())
+            hit = self.cache.lookup(keys)
+            if hit is None:
+                hit = await self.disk_cache.lookup(keys)
+                if hit is not None:
+                    # 二级命中后提升到内存缓存
+                    self.cache.set(*hit)
+            if hit is not None:
+                key, value = hit
+                model = next(name for name, candidate in cache_keys.items() if candidate == key)
+                logger.debug(f"Response cache hit ({model})")
+                return value, model
 
-        # 否则使用故障切换逻辑
-        result, model = await self._try_model(self._active_model, prompt, max_tokens, temperature)
+        # 在这里解析是否对冲，使其成为 single-flight 键的一部分
+        use_hedge = len(order) > 1 and (
+            self.hedger.is_enabled(endpoint) if hedge is None else hedge
+        )
 
-        if result is not None:
-            # 成功，重置失败计数
-            if model == "grok":
-                self.grok_failures = 0
-            else:
-                self.openai_failures = 0
+        async def call() -> tuple[Optional[str], str]:
+            result, model = await self._generate_uncached(
+                order, force_model, prompt, max_tokens, temperature, endpoint, use_hedge
+            )
+            if result is not None and model in cache_keys:
+                self.cache.set(cache_keys[model], result)
+                self.disk_cache.set_nowait(cache_keys[model], result)
             return result, model
 
-        # 当前模型失败，增加失败计数
-        logger.warning(f"{self._active_model} failed, trying fallback")
+        # 并发的相同请求只调用一次提供商：键包含实际的提供商顺序、是否对冲与是否
+        # 绕过缓存，调用方式不同或要求新鲜结果的请求不会共享别人的结果
+        flight_key = build_cache_key(
+            f"{'>'.join(order)}|{'hedged' if use_hedge else 'direct'}|"
+            f"{'fresh' if not use_cache else 'cached'}",
+            [{"role": "user", "content": prompt.strip()}],
+            temperature,
+            max_tokens,
+        )
+        return await self.single_flight.do(flight_key, call)
 
-        if self._active_model == "grok":
-            self.grok_failures += 1
-            if self.grok_failures >= self.failure_threshold:
-                logger.warning(f"Grok failed {self.grok_failures} times, switching to OpenAI")
-                self._active_model = "openai"
+    def stream_completion(
+        self,
+        model: Literal["grok", "openai"],
+        prompt: str,
+        max_tokens: int = 500,
+        temperature: float = 0.7
+    ) -> AsyncIterator[str]:
+        """
+        流式生成（并发的相同请求共享同一个上游流）
 
-            # 尝试 OpenAI
-            result, model = await self._try_model("openai", prompt, max_tokens, temperature)
-            if result is not None:
-                self.openai_failures = 0
-                return result, model
+        Args:
+            model: 提供商名称
+            prompt: 提示词
+            max_tokens: 最大 token 数
+            temperature: 温度参数
 
-        else:
-            self.openai_failures += 1
-            if self.openai_failures >= self.failure_threshold:
-                logger.warning(f"OpenAI failed {self.openai_failures} times, switching to Grok")
-                self._active_model = "grok"
+        Returns:
+            文本片段迭代器
+        """
+        client = self._client(model)
+        key = build_cache_key(
+            client.model,
+            [{"role": "user", "content": prompt.strip()}],
+            temperature,
+            max_tokens,
+        )
+        return self.single_flight.stream(
+            key,
+            lambda: self._stream_provider(model, prompt, max_tokens, temperature),
+        )
 
-            # 尝试 Grok
-            result, model = await self._try_model("grok", prompt, max_tokens, temperature)
+    async def _stream_provider(
+        self,
+        name: Literal["grok", "openai"],
+        prompt: str,
+        max_tokens: int,
+        temperature: float
+    ) -> AsyncIterator[str]:
+        """获取限流配额后开始上游流"""
+        await self.rate_limiter.acquire(name)
+        async for chunk in self._client(name).stream_completion(
+            prompt, max_tokens=max_tokens, temperature=temperature
+        ):
+            yield chunk
+
+    def _cache_key(self, name: str, prompt: str, max_tokens: int, temperature: float) -> str:
+        """提供商模型 + 消息 + 采样参数的内容哈希"""
+        return build_cache_key(
+            self._client(name).model,
+            [{"role": "user", "content": prompt}],
+            temperature,
+            max_tokens,
+        )
+
+    async def _generate_uncached(
+        self,
+        order: List[str],
+        force_model: Optional[str],
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        endpoint: Optional[str],
+        hedge: Optional[bool]
+    ) -> tuple[Optional[str], str]:
+        """实际调用提供商（缓存未命中时）"""
+        # 如果指定了强制模型，直接使用（不受熔断限制，但仍记录结果）
+        if force_model:
+            return await self._call_provider(
+                force_model, prompt, max_tokens, temperature, endpoint=endpoint
+            )
+
+        use_hedge = self.hedger.is_enabled(endpoint) if hedge is None else hedge
+        if use_hedge and len(order) > 1:
+            return await self._generate_hedged(order, prompt, max_tokens, temperature, endpoint)
+
+        return await self._generate_sequential(order, prompt, max_tokens, temperature, endpoint)
+
+    async def _generate_sequential(
+        self,
+        order: List[str],
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        endpoint: Optional[str] = None
+    ) -> tuple[Optional[str], str]:
+        """按顺序逐个尝试提供商，跳过熔断中的提供商"""
+        for name in order:
+            if deadline_expired():
+                # 截止时间已过，不再切换到下一个提供商
+                logger.warning(f"Deadline exceeded, not trying {name}")
+                return None, "none"
+            breaker = self.breakers[name]
+            permit = breaker.allow_request()
+            if not permit:
+                # 熔断中的提供商直接跳过，不再等待超时
+                logger.debug(f"{name} circuit {breaker.state.value}, skipping")
+                continue
+
+            result, model = await self._call_provider(
+                name, prompt, max_tokens, temperature, permit=permit, endpoint=endpoint
+            )
             if result is not None:
-                self.grok_failures = 0
                 return result, model
 
+            logger.warning(f"{name} failed, trying fallback")
+
         # 所有模型都失败
         logger.error("All AI models failed")
         return None, "none"
 
+    async def _generate_hedged(
+        self,
+        order: List[str],
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        endpoint: Optional[str] = None
+    ) -> tuple[Optional[str], str]:
+        """
+        对冲调用：主提供商在该端点近期延迟分位数内未返回时，向下一个提供商
+        发出同样的请求，取先成功者并取消另一个
+
+        Args:
+            order: 路由顺序
+            prompt: 提示词
+            max_tokens: 最大 token 数
+            temperature: 温度参数
+            endpoint: 端点名称（对冲等待时间按该端点的延迟分布计算）
+
+        Returns:
+            (生成的文本, 使用的模型名称)
+        """
+        self.hedger.record_request()
+        remaining = list(order)
+
+        primary = None
+        primary_permit: Optional[BreakerPermit] = None
+        while remaining:
+            name = remaining.pop(0)
+            primary_permit = self.breakers[name].allow_request()
+            if primary_permit:
+                primary = name
+                break
+            logger.debug(f"{name} circuit {self.breakers[name].state.value}, skipping")
+
+        if primary is None:
+            logger.error("All AI models failed")
+            return None, "none"
+
+        tasks: Dict[asyncio.Task, str] = {
+            asyncio.create_task(
+                self._call_provider(
+                    primary, prompt, max_tokens, temperature,
+                    permit=primary_permit, hedged=True, endpoint=endpoint,
+                )
+            ): primary
+        }
+        # 只用同一端点的样本：混入长报告的延迟会让短请求几乎永远等不到对冲
+        delay = self.hedger.hedge_delay(
+            self.latency.percentile(
+                primary,
+                self._client(primary).model,
+                self.hedger.config.delay_percentile,
+                endpoint=endpoint or DEFAULT_ENDPOINT,
+            )
+        )
+        hedged = False
+
+        try:
+            done, _ = await asyncio.wait(set(tasks), timeout=delay)
+            if not done:
+                secondary = next(
+                    (name for name in remaining if self.breakers[name].state != CircuitState.OPEN),
+                    None,
+                )
+                secondary_permit = (
+                    self.breakers[secondary].allow_request() if secondary is not None else None
+                )
+                if secondary_permit:
+                    if self.hedger.try_acquire():
+                        remaining.remove(secondary)
+                        tasks[asyncio.create_task(
+                            self._call_provider(
+                                secondary, prompt, max_tokens, temperature,
+                                permit=secondary_permit, hedged=True, endpoint=endpoint,
+                            )
+                        )] = secondary
+                        hedged = True
+                        logger.info(f"Hedging {primary} -> {secondary} after {delay:.2f}s")
+                    else:
+                        self.breakers[secondary].release(secondary_permit)
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result, model = task.result()
+                    except Exception as e:
+                        logger.error(f"{tasks[task]} hedged call raised: {str(e)}")
+                        continue
+                    if result is not None:
+                        if hedged:
+                            self.hedger.record_winner(hedge_won=tasks[task] != primary)
+                        return result, model
+        finally:
+            # 取消落败（或仍在进行）的请求
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        # 参与对冲的提供商都失败，继续尝试剩余提供商
+        logger.warning("Hedged providers failed, trying remaining providers")
+        return await self._generate_sequential(remaining, prompt, max_tokens, temperature, endpoint)
+
+    async def _call_provider(
+        self,
+        name: Literal["grok", "openai"],
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        permit: Optional[BreakerPermit] = None,
+        hedged: bool = False,
+        endpoint: Optional[str] = None
+    ) -> tuple[Optional[str], str]:
+        """
+        调用提供商并把结果记录到熔断器与延迟统计
+
+        Args:
+            name: 提供商名称
+            prompt: 提示词
+            max_tokens: 最大 token 数
+            temperature: 温度参数
+            permit: allow_request() 返回的凭据（被取消时据此归还探测名额）
+            hedged: 是否为对冲调用（落败被取消时把已耗时记为延迟下界）
+            endpoint: 端点名称（延迟按端点分别统计）
+
+        Returns:
+            (生成的文本, 模型名称)
+        """
+        breaker = self.breakers[name]
+        started: Optional[float] = None
+        try:
+            # 限流等待不计入提供商延迟
+            await self.rate_limiter.acquire(name)
+            started = time.monotonic()
+            result, model = await self._try_model(name, prompt, max_tokens, temperature)
+        except asyncio.CancelledError:
+            # 取消不算失败：归还探测名额，不记录熔断结果
+            breaker.release(permit)
+            if hedged and started is not None:
+                self._record_latency_lower_bound(name, time.monotonic() - started, endpoint)
+            raise
+
+        ok = result is not None
+        if not ok and deadline_expired():
+            # 因调用方截止时间被截断的请求不算提供商故障
+            breaker.release(permit)
+            return result, model
+        self.latency.record(
+            name, self._client(name).model, time.monotonic() - started, ok, endpoint=endpoint
+        )
+        if ok:
+            breaker.record_success(permit)
+        else:
+            breaker.record_failure(permit)
+        return result, model
+
+    def _record_latency_lower_bound(self, name: str, elapsed: float, endpoint: Optional[str] = None):
+        """
+        对冲落败被取消的调用：真实延迟至少为 elapsed
+
+        慢的主提供商总是输给对冲请求时，如果不记录，它的 p95 会停留在旧的
+        较快值，延迟路由不会降级它，对冲延迟也一直偏短。只记录高于当前 p95
+        的下界：低于 p95 的截断样本没有信息量，反而会把分位数拉低。
+        """
+        model = self._client(name).model
+        p95 = self.latency.percentile(name, model, 0.95, endpoint=endpoint or DEFAULT_ENDPOINT)
+        if p95 is None or elapsed > p95:
+            self.latency.record(name, model, elapsed, True, endpoint=endpoint)
+            logger.debug(f"Recorded {elapsed:.2f}s lower-bound latency for cancelled {name} call")
+
     async def _try_model(
         self,
         model: Literal["grok", "openai"],
@@ -142,12 +553,41 @@ class AIOrchestrator:
         return {
             "grok_available": grok_healthy,
             "openai_available": openai_healthy,
-            "active_model": self._active_model,
+            "active_model": self.active_model,
             "status": "ok" if (grok_healthy or openai_healthy) else "error"
         }
 
+    def get_metrics(self) -> dict:
+        """
+        运行时指标
+
+        Returns:
+            连接池、熔断器、路由延迟、对冲、缓存、请求合并、限流、翻译记忆、分批、上下文窗口等运行时统计
+        """
+        return {
+            "pools": {
+                "grok": self.grok.pool_stats(),
+            },
+            "breakers": {
+                name: breaker.snapshot() for name, breaker in self.breakers.items()
+            },
+            "routing": {
+                "policy": self.policy.name,
+                "order": self.rank_providers(),
+                "latency": self.latency.snapshot(),
+            },
+            "hedging": self.hedger.snapshot(),
+            "cache": self.cache.snapshot(),
+            "disk_cache": self.disk_cache.snapshot(),
+            "single_flight": self.single_flight.snapshot(),
+            "rate_limits": self.rate_limiter.snapshot(),
+            "translation_memory": self.translation_memory.snapshot(),
+            "segment_batching": self.segment_batcher.snapshot(),
+            "context_window": self.context_window.snapshot(),
+        }
+
     def reset_failures(self):
-        """重置失败计数器"""
-        self.grok_failures = 0
-        self.openai_failures = 0
-        logger.info("Failure counters reset")
+        """重置所有熔断器"""
+        for breaker in self.breakers.values():
+            breaker.reset()
+        logger.info("Circuit breakers reset")
@@ -0,0 +1,255 @@
+"""
+熔断器 - 按服务提供商隔离故障（closed / open / half-open）
+"""
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from loguru import logger
+
+from utils.env import env_float, env_int
+
+
+class CircuitState(str, Enum):
+    """熔断器状态"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+@dataclass(frozen=True)
+class BreakerPermit:
+    """allow_request() 放行的凭据：记录放行时的状态代数与是否占用探测名额"""
+
+    generation: int
+    probe: bool
+
+
+@dataclass
+class CircuitBreakerConfig:
+    """熔断器配置"""
+
+    # 统计窗口（秒），只有窗口内的调用参与失败率计算
+    window_seconds: float = 60.0
+    # 窗口内最少调用次数，低于该值不触发熔断
+    min_requests: int = 5
+    # 失败率阈值（0-1）
+    failure_rate_threshold: float = 0.5
+    # 熔断后冷却时间（秒），之后进入半开状态
+    cooldown_seconds: float = 30.0
+    # 半开状态下允许同时进行的探测请求数
+    half_open_max_probes: int = 1
+    # 半开状态下连续成功多少次后恢复
+    half_open_success_threshold: int = 2
+
+    @classmethod
+    def from_env(cls, prefix: str = "AI_BREAKER") -> "CircuitBreakerConfig":
+        """
+        从环境变量读取配置，例如 AI_BREAKER_COOLDOWN_SECONDS
+
+        Args:
+            prefix: 环境变量前缀
+
+        Returns:
+            熔断器配置
+        """
+        defaults = cls()
+        return cls(
+            window_seconds=env_float(f"{prefix}_WINDOW_SECONDS", defaults.window_seconds),
+            min_requests=env_int(f"{prefix}_MIN_REQUESTS", defaults.min_requests),
+            failure_rate_threshold=env_float(
+                f"{prefix}_FAILURE_RATE", defaults.failure_rate_threshold
+            ),
+            cooldown_seconds=env_float(f"{prefix}_COOLDOWN_SECONDS", defaults.cooldown_seconds),
+            half_open_max_probes=env_int(
+                f"{prefix}_HALF_OPEN_PROBES", defaults.half_open_max_probes
+            ),
+            half_open_success_threshold=env_int(
+                f"{prefix}_HALF_OPEN_SUCCESSES", defaults.half_open_success_threshold
+            ),
+        )
+
+
+class CircuitBreaker:
+    """
+    单个服务提供商的熔断器
+
+    调用方在请求前调用 allow_request()，请求结束后把拿到的凭据传给
+    record_success() / record_failure()；若请求被取消，需调用 release() 归还
+    半开探测名额。只有在当前半开期放行的探测请求才会改变探测计数：closed
+    时放行、在熔断器转入半开后才结束的请求不会归还它从未占用的名额。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        config: CircuitBreakerConfig = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        初始化熔断器
+
+        Args:
+            name: 服务提供商名称
+            config: 熔断器配置
+            clock: 时钟函数（便于测试）
+        """
+        self.name = name
+        self.config = config or CircuitBreakerConfig()
+        self._clock = clock
+
+        self._state = CircuitState.CLOSED
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        # 每次状态转换递增，用于识别放行凭据是否属于当前半开期
+        self._generation = 0
+        self._probes_in_flight = 0
+        self._half_open_successes = 0
+        self._times_opened = 0
+        self._rejected = 0
+
+    @property
+    def state(self) -> CircuitState:
+        """当前状态（冷却结束后自动从 open 进入 half-open）"""
+        if (
+            self._state == CircuitState.OPEN
+            and self._clock() - self._opened_at >= self.config.cooldown_seconds
+        ):
+            self._transition(CircuitState.HALF_OPEN)
+        return self._state
+
+    def allow_request(self) -> Optional[BreakerPermit]:
+        """
+        是否允许向该提供商发送请求
+
+        Returns:
+            放行凭据（真值），拒绝时为 None；半开状态下会占用一个探测名额
+        """
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return BreakerPermit(self._generation, probe=False)
+        if state == CircuitState.HALF_OPEN and self._probes_in_flight < self.config.half_open_max_probes:
+            self._probes_in_flight += 1
+            return BreakerPermit(self._generation, probe=True)
+        self._rejected += 1
+        return None
+
+    def _is_current_probe(self, permit: Optional[BreakerPermit]) -> bool:
+        return (
+            permit is not None
+            and permit.probe
+            and permit.generation == self._generation
+            and self._state == CircuitState.HALF_OPEN
+        )
+
+    def record_success(self, permit: Optional[BreakerPermit] = None):
+        """
+        记录一次成功调用
+
+        Args:
+            permit: allow_request() 返回的凭据（未经 allow_request() 的调用为 None）
+        """
+        now = self._clock()
+        if self._state == CircuitState.HALF_OPEN:
+            # 半开期只统计本期放行的探测请求
+            if self._is_current_probe(permit):
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._half_open_successes += 1
+                if self._half_open_successes >= self.config.half_open_success_threshold:
+                    self._transition(CircuitState.CLOSED)
+            return
+        self._record(now, True)
+
+    def record_failure(self, permit: Optional[BreakerPermit] = None):
+        """
+        记录一次失败调用
+
+        Args:
+            permit: allow_request() 返回的凭据（未经 allow_request() 的调用为 None）
+        """
+        now = self._clock()
+        if self._state == CircuitState.HALF_OPEN:
+            # 熔断前放行、现在才失败的请求不代表提供商当前的状态
+            if self._is_current_probe(permit):
+                self._transition(CircuitState.OPEN)
+            return
+        self._record(now, False)
+
+        if self._state == CircuitState.CLOSED:
+            total, failures = self._window_counts()
+            if (
+                total >= self.config.min_requests
+                and failures / total >= self.config.failure_rate_threshold
+            ):
+                self._transition(CircuitState.OPEN)
+
+    def release(self, permit: Optional[BreakerPermit] = None):
+        """
+        归还探测名额（请求被取消、未产生结果时调用）
+
+        Args:
+            permit: allow_request() 返回的凭据
+        """
+        if self._is_current_probe(permit):
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def reset(self):
+        """强制恢复为 closed 并清空统计"""
+        self._transition(CircuitState.CLOSED)
+
+    def _record(self, now: float, ok: bool):
+        self._outcomes.append((now, ok))
+        self._prune(now)
+
+    def _prune(self, now: float):
+        cutoff = now - self.config.window_seconds
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
+
+    def _window_counts(self) -> Tuple[int, int]:
+        self._prune(self._clock())
+        total = len(self._outcomes)
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return total, failures
+
+    def _transition(self, new_state: CircuitState):
+        old_state = self._state
+        self._state = new_state
+        self._generation += 1
+        self._probes_in_flight = 0
+        self._half_open_successes = 0
+
+        if new_state == CircuitState.OPEN:
+            self._opened_at = self._clock()
+            self._times_opened += 1
+            logger.warning(
+                f"Circuit breaker [{self.name}] opened, cooling down for {self.config.cooldown_seconds}s"
+            )
+        elif new_state == CircuitState.CLOSED:
+            self._outcomes.clear()
+            if old_state != CircuitState.CLOSED:
+                logger.info(f"Circuit breaker [{self.name}] closed")
+        elif new_state == CircuitState.HALF_OPEN:
+            logger.info(f"Circuit breaker [{self.name}] half-open, probing")
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        熔断器状态快照
+
+        Returns:
+            状态、窗口统计等信息
+        """
+        state = self.state
+        total, failures = self._window_counts()
+        return {
+            "state": state.value,
+            "window_requests": total,
+            "window_failures": failures,
+            "failure_rate": round(failures / total, 3) if total else 0.0,
+            "times_opened": self._times_opened,
+            "rejected": self._rejected,
+            "probes_in_flight": self._probes_in_flight,
+        }
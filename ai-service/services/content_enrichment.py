@@ -0,0 +1,445 @@
+"""
+内容增强 - 摘要、洞察、分类的提示词与解析，以及单次调用的综合增强
+"""
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+from pydantic import ValidationError
+
+from models.schemas import (
+    ClassificationResponse,
+    EnrichBatchItem,
+    EnrichResponse,
+    Insight,
+    InsightResponse,
+    SummaryResponse,
+)
+from services.ai_orchestrator import AIOrchestrator
+from utils.env import env_int
+
+# 批量增强的默认并发数与服务端上限
+BATCH_CONCURRENCY = env_int("AI_ENRICH_BATCH_CONCURRENCY", 8)
+BATCH_MAX_CONCURRENCY = env_int("AI_ENRICH_BATCH_MAX_CONCURRENCY", 32)
+BATCH_MAX_ITEMS = env_int("AI_ENRICH_BATCH_MAX_ITEMS", 1000)
+
+
+def build_summary_prompt(content: str, max_length: int, language: str) -> str:
+    """摘要提示词"""
+    return f"""请为以下内容生成一个简洁的摘要（不超过{max_length}字）：
+
+{content}
+
+要求：
+- 使用{language}语言
+- 抓住核心要点
+- 简洁明了
+"""
+
+
+def build_insights_prompt(content: str, language: str) -> str:
+    """洞察提示词"""
+    return f"""请从以下内容中提取3-5个关键洞察：
+
+{content}
+
+要求：
+- 使用{language}语言
+- 每个洞察包含标题和描述
+- 标注重要性（high/medium/low）
+- 以 JSON 格式返回，格式如下：
+[
+  {{"title": "洞察标题", "description": "洞察描述", "importance": "high"}},
+  ...
+]
+"""
+
+
+def build_classification_prompt(content: str) -> str:
+    """分类提示词"""
+    return f"""请对以下内容进行分类：
+
+{content}
+
+要求：
+- 确定主类别（如：AI/机器学习、前端开发、后端开发、数据科学等）
+- 提取子类别（2-3个）
+- 提取相关标签（3-5个）
+- 评估难度等级（beginner/intermediate/advanced/expert）
+- 以 JSON 格式返回：
+{{
+  "category": "主类别",
+  "subcategories": ["子类别1", "子类别2"],
+  "tags": ["标签1", "标签2", "标签3"],
+  "difficulty_level": "intermediate"
+}}
+"""
+
+
+def build_enrich_prompt(content: str, max_length: int, language: str) -> str:
+    """综合增强提示词：一次返回摘要、洞察与分类"""
+    return f"""请对以下内容同时完成摘要、洞察提取和分类：
+
+{content}
+
+要求：
+- summary：不超过{max_length}字的简洁摘要，抓住核心要点
+- insights：3-5个关键洞察，每个包含标题、描述和重要性（high/medium/low）
+- classification：主类别（如：AI/机器学习、前端开发、后端开发、数据科学等）、
+  2-3个子类别、3-5个标签、难度等级（beginner/intermediate/advanced/expert）
+- 摘要与洞察使用{language}语言
+- 只返回一个 JSON 对象，格式如下：
+{{
+  "summary": "摘要",
+  "insights": [
+    {{"title": "洞察标题", "description": "洞察描述", "importance": "high"}}
+  ],
+  "classification": {{
+    "category": "主类别",
+    "subcategories": ["子类别1", "子类别2"],
+    "tags": ["标签1", "标签2", "标签3"],
+    "difficulty_level": "intermediate"
+  }}
+}}
+"""
+
+
+def strip_code_fence(text: str) -> str:
+    """
+    去掉模型输出外层的 markdown 代码块
+
+    Args:
+        text: 模型输出
+
+    Returns:
+        代码块内的文本（没有代码块时原样返回）
+    """
+    if "```json" in text:
+        return text.split("```json")[1].split("```")[0].strip()
+    if "```" in text:
+        return text.split("```")[1].split("```")[0].strip()
+    return text.strip()
+
+
+def parse_insights(data: Any, model: str) -> InsightResponse:
+    """
+    校验洞察数据
+
+    Args:
+        data: 已解析的 JSON（洞察列表）
+        model: 使用的模型
+
+    Returns:
+        洞察响应
+
+    Raises:
+        ValueError: 数据不符合 InsightResponse
+    """
+    if not isinstance(data, list):
+        raise ValueError("insights is not a list")
+    return InsightResponse(insights=[Insight(**item) for item in data], model_used=model)
+
+
+def parse_classification(data: Any, model: str) -> ClassificationResponse:
+    """
+    校验分类数据
+
+    Args:
+        data: 已解析的 JSON（分类对象）
+        model: 使用的模型
+
+    Returns:
+        分类响应
+
+    Raises:
+        ValueError: 数据不符合 ClassificationResponse
+    """
+    if not isinstance(data, dict):
+        raise ValueError("classification is not an object")
+    return ClassificationResponse(
+        category=data.get("category", "Unknown"),
+        subcategories=data.get("subcategories", []),
+        tags=data.get("tags", []),
+        difficulty_level=data.get("difficulty_level", "intermediate"),
+        model_used=model,
+    )
+
+
+def fallback_insights(model: str) -> InsightResponse:
+    """洞察降级结果：空列表"""
+    return InsightResponse(insights=[], model_used=model)
+
+
+def fallback_classification(model: str) -> ClassificationResponse:
+    """分类降级结果：Unknown"""
+    return ClassificationResponse(
+        category="Unknown",
+        subcategories=[],
+        tags=[],
+        difficulty_level="intermediate",
+        model_used=model,
+    )
+
+
+async def generate_summary(
+    orch: AIOrchestrator,
+    content: str,
+    max_length: int = 200,
+    language: str = "zh",
+    use_cache: bool = True,
+) -> Optional[SummaryResponse]:
+    """
+    生成摘要
+
+    Returns:
+        摘要响应，所有提供商都不可用时为 None
+    """
+    result, model = await orch.generate_completion(
+        build_summary_prompt(content, max_length, language),
+        max_tokens=max_length * 2,  # 中文一个字约2个token
+        temperature=0.5,
+        endpoint="summary",
+        use_cache=use_cache,
+    )
+    if result is None:
+        return None
+    return SummaryResponse(summary=result, model_used=model)
+
+
+async def extract_insights(
+    orch: AIOrchestrator,
+    content: str,
+    language: str = "zh",
+    use_cache: bool = True,
+) -> Optional[InsightResponse]:
+    """
+    提取洞察（解析失败时降级为空列表）
+
+    Returns:
+        洞察响应，所有提供商都不可用时为 None
+    """
+    result, model = await orch.generate_completion(
+        build_insights_prompt(content, language),
+        max_tokens=800,
+        temperature=0.7,
+        endpoint="insights",
+        use_cache=use_cache,
+        # 资源重复入库时会反复请求同一内容的洞察，显式允许缓存
+        cache_high_temperature=True,
+    )
+    if result is None:
+        return None
+    try:
+        return parse_insights(json.loads(strip_code_fence(result)), model)
+    except (ValueError, TypeError, ValidationError) as e:
+        logger.error(f"Failed to parse insights: {str(e)}")
+        return fallback_insights(model)
+
+
+async def classify_content(
+    orch: AIOrchestrator,
+    content: str,
+    use_cache: bool = True,
+) -> Optional[ClassificationResponse]:
+    """
+    分类内容（解析失败时降级为 Unknown）
+
+    Returns:
+        分类响应，所有提供商都不可用时为 None
+    """
+    result, model = await orch.generate_completion(
+        build_classification_prompt(content),
+        max_tokens=500,
+        temperature=0.3,
+        endpoint="classify",
+        use_cache=use_cache,
+    )
+    if result is None:
+        return None
+    try:
+        return parse_classification(json.loads(strip_code_fence(result)), model)
+    except (ValueError, TypeError, ValidationError) as e:
+        logger.error(f"Failed to parse classification: {str(e)}")
+        return fallback_classification(model)
+
+
+def _parse_enrich_payload(result: str) -> dict:
+    text = strip_code_fence(result)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("no JSON object in response")
+    data = json.loads(text[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("enrich payload is not an object")
+    return data
+
+
+async def enrich_content(
+    orch: AIOrchestrator,
+    content: str,
+    max_length: int = 200,
+    language: str = "zh",
+    use_cache: bool = True,
+) -> Optional[EnrichResponse]:
+    """
+    一次补全同时生成摘要、洞察与分类
+
+    内容只发送一次；某一部分缺失或校验失败时，仅对该部分单独重试，
+    其余部分保留综合调用的结果。
+
+    Args:
+        orch: AI 编排器
+        content: 原始内容
+        max_length: 摘要最大长度（字数）
+        language: 输出语言
+        use_cache: 是否使用响应缓存
+
+    Returns:
+        综合增强响应，所有提供商都不可用时为 None
+    """
+    result, model = await orch.generate_completion(
+        build_enrich_prompt(content, max_length, language),
+        # 摘要（约 2 token/字）+ 洞察（800）+ 分类（500）
+        max_tokens=max_length * 2 + 1300,
+        temperature=0.3,
+        endpoint="enrich",
+        use_cache=use_cache,
+    )
+    if result is None:
+        return None
+
+    try:
+        data = _parse_enrich_payload(result)
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Failed to parse enrich response, falling back per field: {e}")
+        data = {}
+
+    summary: Optional[SummaryResponse] = None
+    insights: Optional[InsightResponse] = None
+    classification: Optional[ClassificationResponse] = None
+
+    raw_summary = data.get("summary")
+    if isinstance(raw_summary, str) and raw_summary.strip():
+        summary = SummaryResponse(summary=raw_summary.strip(), model_used=model)
+
+    try:
+        insights = parse_insights(data.get("insights"), model)
+    except (ValueError, TypeError, ValidationError) as e:
+        logger.warning(f"Enrich insights invalid: {e}")
+
+    try:
+        classification = parse_classification(data.get("classification"), model)
+    except (ValueError, TypeError, ValidationError) as e:
+        logger.warning(f"Enrich classification invalid: {e}")
+
+    # 仅对失败的部分使用专用提示词重试（并发执行）
+    fallback_fields: List[str] = []
+    retries: List[Tuple[str, Any]] = []
+    if summary is None:
+        retries.append(("summary", generate_summary(orch, content, max_length, language, use_cache)))
+    if insights is None:
+        retries.append(("insights", extract_insights(orch, content, language, use_cache)))
+    if classification is None:
+        retries.append(("classification", classify_content(orch, content, use_cache)))
+
+    if retries:
+        fallback_fields = [name for name, _ in retries]
+        logger.info(f"Enrich falling back for fields: {', '.join(fallback_fields)}")
+        outcomes = await asyncio.gather(*(coro for _, coro in retries))
+        for (name, _), outcome in zip(retries, outcomes):
+            if name == "summary":
+                summary = outcome
+            elif name == "insights":
+                insights = outcome or fallback_insights(model)
+            else:
+                classification = outcome or fallback_classification(model)
+
+    if summary is None:
+        # 摘要重试也失败：返回空摘要，由调用方决定如何处理
+        summary = SummaryResponse(summary="", model_used=model)
+
+    return EnrichResponse(
+        summary=summary,
+        insights=insights,
+        classification=classification,
+        model_used=model,
+        fallback_fields=fallback_fields,
+    )
+
+
+async def enrich_batch(
+    orch: AIOrchestrator,
+    items: Sequence[EnrichBatchItem],
+    concurrency: Optional[int] = None,
+    use_cache: bool = True,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    批量增强，按完成顺序逐条产出结果
+
+    固定数量的 worker 从队列中取资源，任一资源完成即产出，不等待最慢的资源；
+    提供商请求速率由编排器的限流器约束。调用方停止迭代（如客户端断开）时
+    取消所有进行中的调用。
+
+    Args:
+        orch: AI 编排器
+        items: 待增强的资源
+        concurrency: 并发数（默认 AI_ENRICH_BATCH_CONCURRENCY）
+        use_cache: 是否使用响应缓存
+
+    Yields:
+        每个资源一条 {"type": "result", ...}，最后一条 {"type": "summary", ...}
+    """
+    workers = max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY, len(items) or 1))
+    pending: "asyncio.Queue[Tuple[int, EnrichBatchItem]]" = asyncio.Queue()
+    for index, item in enumerate(items):
+        pending.put_nowait((index, item))
+    results: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+
+    async def worker():
+        while True:
+            try:
+                index, item = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.monotonic()
+            record: Dict[str, Any] = {"type": "result", "index": index, "id": item.id}
+            try:
+                response = await enrich_content(
+                    orch, item.content, item.max_length, item.language, use_cache=use_cache
+                )
+                if response is None:
+                    record.update(status="error", error="All AI services unavailable")
+                else:
+                    record.update(status="ok", result=response.model_dump(mode="json"))
+            except Exception as e:
+                logger.error(f"Batch enrich item {index} failed: {e}")
+                record.update(status="error", error=str(e))
+            record["elapsed_ms"] = round((time.monotonic() - started) * 1000)
+            await results.put(record)
+
+    logger.info(f"Batch enrich: {len(items)} items, concurrency {workers}")
+    started = time.monotonic()
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    succeeded = failed = 0
+    try:
+        for _ in range(len(items)):
+            record = await results.get()
+            if record["status"] == "ok":
+                succeeded += 1
+            else:
+                failed += 1
+            yield record
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    yield {
+        "type": "summary",
+        "total": len(items),
+        "succeeded": succeeded,
+        "failed": failed,
+        "elapsed_ms": round((time.monotonic() - started) * 1000),
+    }
@@ -0,0 +1,465 @@
+"""
+对话上下文窗口 - 按模型 token 预算依优先级填充系统提示、最近轮次与相关资源片段，旧轮次滚动为摘要
+"""
+import asyncio
+import hashlib
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Set, Tuple
+
+from loguru import logger
+
+from services.token_batching import DEFAULT_CONTEXT_LIMITS, estimate_tokens
+from utils.env import env_float, env_int, env_mapping
+
+if TYPE_CHECKING:
+    from services.ai_orchestrator import AIOrchestrator
+
+# 每条消息的格式开销（role、分隔符）
+MESSAGE_OVERHEAD = 4
+# 对话摘要提示词版本（修改提示词时递增，使旧的摘要缓存失效）
+SUMMARY_PROMPT_VERSION = "1"
+
+_WORD = re.compile(r"[a-z0-9]{3,}")
+_CJK_RUN = re.compile(r"[㐀-䶿一-鿿]+")
+_PARAGRAPH = re.compile(r"\n\s*\n")
+
+
+def count_tokens(text: str) -> int:
+    """单条消息的估算 token 数（含格式开销）"""
+    return estimate_tokens(text) + MESSAGE_OVERHEAD
+
+
+def _terms(text: str) -> List[str]:
+    """相关性匹配用的词项：拉丁词与 CJK 二元组"""
+    folded = text.casefold()
+    terms = _WORD.findall(folded)
+    for run in _CJK_RUN.findall(folded):
+        terms.extend(run[i:i + 2] for i in range(max(1, len(run) - 1)))
+    return terms
+
+
+def split_passages(text: str, max_tokens: int = 200) -> List[str]:
+    """
+    把长文本按段落切成片段，超长段落再按句子/长度切开
+
+    Args:
+        text: 原文
+        max_tokens: 单个片段的 token 上限
+
+    Returns:
+        片段列表
+    """
+    passages: List[str] = []
+    for paragraph in _PARAGRAPH.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            passages.append(paragraph)
+            continue
+        current = ""
+        for sentence in re.split(r"(?<=[.!?。！？\n])", paragraph):
+            if current and estimate_tokens(current + sentence) > max_tokens:
+                passages.append(current.strip())
+                current = ""
+            while estimate_tokens(sentence) > max_tokens:
+                cut = max(1, len(sentence) * max_tokens // estimate_tokens(sentence))
+                passages.append(sentence[:cut].strip())
+                sentence = sentence[cut:]
+            current += sentence
+        if current.strip():
+            passages.append(current.strip())
+    return passages
+
+
+def _int_mapping(key: str) -> Dict[str, int]:
+    limits: Dict[str, int] = {}
+    for model, value in env_mapping(key).items():
+        try:
+            limits[model] = int(value)
+        except ValueError:
+            logger.warning(f"Invalid context limit for {model} in {key}: {value}")
+    return limits
+
+
+@dataclass
+class ContextWindowConfig:
+    """上下文窗口配置"""
+
+    # 单次请求输入 token 的额外上限（0 表示只受模型上下文约束）
+    max_input_tokens: int = 0
+    # 未知模型按此上下文长度计算预算
+    fallback_context_tokens: int = 8192
+    # 资源片段参与竞争时，最近轮次最多占用剩余预算的比例
+    history_share: float = 0.6
+    # 运行摘要的 token 上限
+    summary_max_tokens: int = 400
+    # 累计多少条未摘要的旧消息后才更新摘要
+    summary_min_messages: int = 2
+    # 资源片段的 token 上限
+    passage_tokens: int = 200
+    context_limits: Dict[str, int] = field(
+        default_factory=lambda: {**DEFAULT_CONTEXT_LIMITS, "gpt-4": 8192}
+    )
+
+    @classmethod
+    def from_env(cls, prefix: str = "AI_CONTEXT") -> "ContextWindowConfig":
+        """
+        从环境变量读取配置，例如 AI_CONTEXT_MAX_INPUT_TOKENS
+
+        AI_CONTEXT_MODEL_LIMITS: 例如 "gpt-4=8192,grok-3=131072"
+
+        Args:
+            prefix: 环境变量前缀
+
+        Returns:
+            上下文窗口配置
+        """
+        defaults = cls()
+        return cls(
+            max_input_tokens=env_int(f"{prefix}_MAX_INPUT_TOKENS", defaults.max_input_tokens),
+            fallback_context_tokens=env_int(
+                f"{prefix}_FALLBACK_CONTEXT_TOKENS", defaults.fallback_context_tokens
+            ),
+            history_share=env_float(f"{prefix}_HISTORY_SHARE", defaults.history_share),
+            summary_max_tokens=env_int(f"{prefix}_SUMMARY_MAX_TOKENS", defaults.summary_max_tokens),
+            summary_min_messages=env_int(
+                f"{prefix}_SUMMARY_MIN_MESSAGES", defaults.summary_min_messages
+            ),
+            passage_tokens=env_int(f"{prefix}_PASSAGE_TOKENS", defaults.passage_tokens),
+            context_limits={**defaults.context_limits, **_int_mapping(f"{prefix}_MODEL_LIMITS")},
+        )
+
+
+@dataclass
+class ContextWindow:
+    """组装好的上下文"""
+
+    messages: List[Dict[str, str]]
+    tokens: int
+    budget: int
+    # 保留的历史消息数 / 被滚动进摘要（或丢弃）的历史消息数
+    kept_messages: int
+    dropped_messages: int
+    # 摘要覆盖的历史消息数（0 表示没有可用摘要）
+    summarized_messages: int
+    passages_used: int
+    passages_total: int
+
+
+def build_summary_prompt(summary: Optional[str], messages: Sequence[Dict[str, str]]) -> str:
+    """
+    增量摘要提示词：在已有摘要的基础上并入新滚出窗口的消息
+
+    Args:
+        summary: 已有摘要
+        messages: 新滚出窗口的消息
+
+    Returns:
+        提示词
+    """
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    previous = summary or "(none)"
+    return f"""You maintain a running summary of a conversation between a user and an assistant.
+Update the summary so it also covers the new messages below.
+- Keep facts, decisions, user preferences, open questions and any names or numbers
+- Drop pleasantries and repetition
+- Write in the same language as the conversation, at most 200 words
+
+Current summary:
+{previous}
+
+New messages:
+{transcript}
+
+Updated summary:"""
+
+
+class ContextWindowManager:
+    """
+    按 token 预算组装对话上下文
+
+    优先级：系统提示与当前问题 > 最近轮次 > 与当前问题相关的资源片段 >
+    更早的轮次。窗口外的旧轮次滚动进运行摘要：摘要按"历史前缀哈希"缓存
+    在编排器的缓存中，只对新滚出的消息增量更新，并在后台完成，不阻塞
+    当前请求。全部内容都放得下时输出与原样拼接一致，稳定前缀可命中
+    提供商的提示词缓存。
+    """
+
+    def __init__(self, orch: "AIOrchestrator", config: Optional[ContextWindowConfig] = None):
+        """
+        初始化上下文管理器
+
+        Args:
+            orch: AI 编排器（用于生成摘要与缓存摘要）
+            config: 上下文窗口配置
+        """
+        self.orch = orch
+        self.config = config or ContextWindowConfig()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._builds = 0
+        self._trimmed = 0
+        self._summary_hits = 0
+        self._summary_updates = 0
+
+    def budget(self, model: Optional[str], reply_tokens: int) -> int:
+        """
+        模型的输入 token 预算：模型上下文长度减去回复预留
+
+        Args:
+            model: 模型名称
+            reply_tokens: 为回复预留的 token 数
+
+        Returns:
+            输入预算
+        """
+        context = self.config.context_limits.get(model or "") or self.config.fallback_context_tokens
+        budget = context - reply_tokens
+        if self.config.max_input_tokens > 0:
+            budget = min(budget, self.config.max_input_tokens)
+        return max(256, budget)
+
+    async def build(
+        self,
+        system: str,
+        history: Sequence[Dict[str, str]],
+        message: str,
+        model: Optional[str],
+        reply_tokens: int = 1500,
+        passages: Sequence[str] = (),
+        passages_heading: str = "",
+        preferred: Optional[str] = None,
+    ) -> ContextWindow:
+        """
+        组装上下文消息
+
+        Args:
+            system: 系统提示（始终保留）
+            history: 历史消息（按时间顺序，只使用 user/assistant）
+            message: 当前用户消息
+            model: 目标模型名称（决定上下文上限）
+            reply_tokens: 为回复预留的 token 数
+            passages: 资源片段（按原顺序，超出预算时按相关性挑选）
+            passages_heading: 资源片段在系统提示中的标题
+            preferred: 生成摘要时偏好的提供商
+
+        Returns:
+            组装好的上下文
+        """
+        self._builds += 1
+        turns = [
+            {"role": item["role"], "content": item["content"]}
+            for item in history
+            if item.get("role") in ("user", "assistant") and item.get("content")
+        ]
+        budget = self.budget(model, reply_tokens)
+        fixed = count_tokens(system) + count_tokens(message) + 2
+        if passages:
+            fixed += estimate_tokens(passages_heading) + 1
+        remaining = max(0, budget - fixed)
+
+        turn_tokens = [count_tokens(turn["content"]) for turn in turns]
+        fits_all = sum(turn_tokens) + sum(count_tokens(p) for p in passages) <= remaining
+
+        if fits_all:
+            keep_from = 0
+            chosen = list(range(len(passages)))
+        else:
+            reserve = min(self.config.summary_max_tokens, remaining // 4)
+            available = max(0, remaining - reserve)
+            share = available if not passages else int(available * self.config.history_share)
+            keep_from, used = self._fill_turns(turn_tokens, len(turns), share)
+            chosen, passage_used = self._select_passages(passages, message, turns[-2:], available - used)
+            # 资源片段用不完的预算再留给更早的轮次
+            keep_from, used = self._fill_turns(
+                turn_tokens, keep_from, available - passage_used - used, used
+            )
+
+        summary_text, summarized = (None, 0)
+        if keep_from > 0:
+            self._trimmed += 1
+            summary_text, summarized = await self._summary(turns, keep_from, preferred)
+
+        # 稳定的部分在前（系统提示、资源片段），变化较多的摘要在后
+        parts = [system]
+        if chosen:
+            selected = "\n\n".join(passages[index] for index in chosen)
+            parts.append(f"{passages_heading}\n{selected}" if passages_heading else selected)
+        if summary_text:
+            parts.append(f"Summary of the earlier conversation:\n{summary_text}")
+        system_content = "\n\n".join(part for part in parts if part)
+
+        messages = [{"role": "system", "content": system_content}] if system_content else []
+        messages.extend(turns[keep_from:])
+        messages.append({"role": "user", "content": message})
+        tokens = sum(count_tokens(item["content"]) for item in messages) + 2
+
+        if keep_from or len(chosen) < len(passages):
+            logger.info(
+                f"Context window ({model}): {tokens}/{budget} tokens, "
+                f"kept {len(turns) - keep_from}/{len(turns)} message(s), "
+                f"{len(chosen)}/{len(passages)} passage(s), summary covers {summarized}"
+            )
+        return ContextWindow(
+            messages=messages,
+            tokens=tokens,
+            budget=budget,
+            kept_messages=len(turns) - keep_from,
+            dropped_messages=keep_from,
+            summarized_messages=summarized,
+            passages_used=len(chosen),
+            passages_total=len(passages),
+        )
+
+    def _fill_turns(
+        self,
+        turn_tokens: List[int],
+        keep_from: int,
+        limit: int,
+        used: int = 0,
+    ) -> Tuple[int, int]:
+        """从 keep_from 往前（更早）逐条加入轮次，返回 (新的 keep_from, 已用 token)"""
+        budget = used + max(0, limit)
+        while keep_from > 0 and used + turn_tokens[keep_from - 1] <= budget:
+            keep_from -= 1
+            used += turn_tokens[keep_from]
+        return keep_from, used
+
+    def _select_passages(
+        self,
+        passages: Sequence[str],
+        message: str,
+        recent: Sequence[Dict[str, str]],
+        limit: int,
+    ) -> Tuple[List[int], int]:
+        """按与当前问题（及最近一轮）的相关性挑选片段，返回 (按原顺序的索引, 已用 token)"""
+        if not passages or limit <= 0:
+            return [], 0
+        query = Counter(_terms(" ".join([message] + [turn["content"] for turn in recent])))
+        documents = [Counter(_terms(passage)) for passage in passages]
+        frequency: Counter = Counter()
+        for document in documents:
+            frequency.update(document.keys())
+
+        def score(index: int) -> float:
+            document = documents[index]
+            weight = sum(
+                math.log(1 + len(passages) / frequency[term]) * min(count, document[term])
+                for term, count in query.items()
+                if term in document
+            )
+            # 同分时优先靠前的片段（通常是资源标题与摘要开头）
+            return weight - index * 1e-6
+
+        chosen: List[int] = []
+        used = 0
+        for index in sorted(range(len(passages)), key=score, reverse=True):
+            cost = count_tokens(passages[index])
+            if used + cost <= limit:
+                chosen.append(index)
+                used += cost
+        return sorted(chosen), used
+
+    @staticmethod
+    def _prefix_keys(turns: Sequence[Dict[str, str]], length: int) -> List[str]:
+        """历史前缀 turns[:1..length] 的滚动哈希键（由长到短）"""
+        keys: List[str] = []
+        digest = SUMMARY_PROMPT_VERSION
+        for turn in turns[:length]:
+            digest = hashlib.sha256(
+                f"{digest}\x1f{turn['role']}\x1f{turn['content']}".encode("utf-8")
+            ).hexdigest()
+            keys.append(f"chat-summary:{digest}")
+        return keys[::-1]
+
+    async def _summary(
+        self,
+        turns: Sequence[Dict[str, str]],
+        keep_from: int,
+        preferred: Optional[str],
+    ) -> Tuple[Optional[str], int]:
+        """取覆盖最长历史前缀的已缓存摘要，必要时在后台增量更新"""
+        keys = self._prefix_keys(turns, keep_from)
+        hit = self.orch.cache.lookup(keys)
+        if hit is None:
+            hit = await self.orch.disk_cache.lookup(keys)
+            if hit is not None:
+                self.orch.cache.set(*hit)
+
+        summary: Optional[str] = None
+        covered = 0
+        if hit is not None:
+            key, summary = hit
+            covered = keep_from - keys.index(key)
+            self._summary_hits += 1
+
+        if keep_from - covered >= max(1, self.config.summary_min_messages):
+            self._schedule_update(keys[0], summary, list(turns[covered:keep_from]), preferred)
+        return summary, covered
+
+    def _schedule_update(
+        self,
+        key: str,
+        summary: Optional[str],
+        messages: List[Dict[str, str]],
+        preferred: Optional[str],
+    ):
+        if key in self._inflight:
+            return
+        task = asyncio.create_task(self._update_summary(key, summary, messages, preferred))
+        self._inflight[key] = task
+        self._tasks.add(task)
+
+        def _done(finished: asyncio.Task, key: str = key):
+            self._tasks.discard(finished)
+            self._inflight.pop(key, None)
+
+        task.add_done_callback(_done)
+
+    async def _update_summary(
+        self,
+        key: str,
+        summary: Optional[str],
+        messages: List[Dict[str, str]],
+        preferred: Optional[str],
+    ):
+        try:
+            result, _ = await self.orch.generate_completion(
+                build_summary_prompt(summary, messages),
+                max_tokens=self.config.summary_max_tokens,
+                temperature=0.2,
+                preferred=preferred,
+                endpoint="chat-summary",
+            )
+        except Exception as e:
+            logger.warning(f"Conversation summary update failed: {e}")
+            return
+        if not result or not result.strip():
+            return
+        self._summary_updates += 1
+        self.orch.cache.set(key, result.strip())
+        self.orch.disk_cache.set_nowait(key, result.strip())
+
+    async def aclose(self):
+        """等待进行中的摘要更新完成"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        上下文窗口统计
+
+        Returns:
+            组装次数、裁剪次数与摘要命中/更新次数
+        """
+        return {
+            "builds": self._builds,
+            "trimmed": self._trimmed,
+            "summary_hits": self._summary_hits,
+            "summary_updates": self._summary_updates,
+            "summary_updates_in_flight": len(self._inflight),
+        }
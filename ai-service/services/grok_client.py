@@ -1,10 +1,12 @@
 """
 Grok API 客户端 (x.AI)
 """
-import httpx
-from typing import Optional
+import json
+from typing import Any, Dict, Optional
 from loguru import logger
 
+from .http_pool import HTTPPoolConfig, PooledHTTPClient
+
 
 class GrokClient:
     """Grok API 客户端"""
@@ -18,13 +20,43 @@ class GrokClient:
         """
         self.api_key = api_key
         self.base_url = "https://api.x.ai/v1"
+        self.model = "grok-3"
         self.available = bool(api_key)
 
+        # 长连接池（HTTP/2 + keep-alive），由 FastAPI 生命周期 start()/aclose()
+        self._http = PooledHTTPClient(
+            name="grok",
+            base_url=self.base_url,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            },
+            config=HTTPPoolConfig.from_env("GROK_HTTP"),
+        )
+
         if not self.available:
             logger.warning("Grok API key not available")
         else:
             logger.info("Grok client initialized")
 
+    async def start(self):
+        """打开共享连接池"""
+        if self.available:
+            await self._http.start()
+
+    async def aclose(self):
+        """关闭共享连接池"""
+        await self._http.aclose()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """
+        连接池统计
+
+        Returns:
+            连接池使用情况（in_use / idle / waits 等）
+        """
+        return self._http.stats()
+
     async def generate_completion(
         self,
         prompt: str,
@@ -47,29 +79,25 @@ class GrokClient:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": "grok-3",
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ],
-                        "max_tokens": max_tokens,
-                        "temperature": temperature,
-                    }
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    return data["choices"][0]["message"]["content"]
-                else:
-                    logger.error(f"Grok API error: {response.status_code} - {response.text}")
-                    return None
+            response = await self._http.post(
+                "/chat/completions",
+                json={
+                    "model": self.model,
+                    "messages": [
+                        {"role": "user", "content": prompt}
+                    ],
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                },
+                timeout=30.0,
+            )
+
+            if response.status_code == 200:
+                data = response.json()
+                return data["choices"][0]["message"]["content"]
+            else:
+                logger.error(f"Grok API error: {response.status_code} - {response.text}")
+                return None
 
         except Exception as e:
             logger.error(f"Grok API exception: {str(e)}")
@@ -89,6 +117,33 @@ class GrokClient:
             max_tokens: 最大 token 数
             temperature: 温度参数
 
+        Yields:
+            生成的文本片段
+        """
+        async for content in self.stream_chat(
+            [{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+        ):
+            yield content
+
+    async def stream_chat(
+        self,
+        messages: list,
+        max_tokens: int = 500,
+        temperature: float = 0.7
+    ):
+        """
+        使用messages格式流式对话
+
+        消息原样发送（保留 system/assistant 轮次），稳定的前缀可命中
+        提供商的提示词缓存；命中的 token 数记录在日志中。
+
+        Args:
+            messages: 消息列表
+            max_tokens: 最大 token 数
+            temperature: 温度参数
+
         Yields:
             生成的文本片段
         """
@@ -97,40 +152,45 @@ class GrokClient:
             return
 
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": "grok-3",
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ],
-                        "max_tokens": max_tokens,
-                        "temperature": temperature,
-                        "stream": True,
-                    }
-                ) as response:
-                    async for line in response.aiter_lines():
-                        if line.startswith("data: "):
-                            data_str = line[6:]  # Remove "data: " prefix
-                            if data_str == "[DONE]":
-                                break
-                            try:
-                                import json
-                                data = json.loads(data_str)
-                                if "choices" in data and len(data["choices"]) > 0:
-                                    delta = data["choices"][0].get("delta", {})
-                                    content = delta.get("content", "")
-                                    if content:
-                                        yield content
-                            except Exception as e:
-                                logger.debug(f"Failed to parse SSE line: {e}")
-                                continue
+            async with self._http.stream(
+                "POST",
+                "/chat/completions",
+                json={
+                    "model": self.model,
+                    "messages": messages,
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                    "stream": True,
+                },
+                timeout=60.0,
+            ) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    logger.error(f"Grok API error: {response.status_code} - {body[:500]!r}")
+                    return
+                async for line in response.aiter_lines():
+                    if line.startswith("data: "):
+                        data_str = line[6:]  # Remove "data: " prefix
+                        if data_str == "[DONE]":
+                            break
+                        try:
+                            data = json.loads(data_str)
+                            if "choices" in data and len(data["choices"]) > 0:
+                                delta = data["choices"][0].get("delta", {})
+                                content = delta.get("content", "")
+                                if content:
+                                    yield content
+                            usage = data.get("usage")
+                            if usage:
+                                details = usage.get("prompt_tokens_details") or {}
+                                logger.info(
+                                    f"Grok stream usage: prompt={usage.get('prompt_tokens')}, "
+                                    f"cached={details.get('cached_tokens', 0)}, "
+                                    f"completion={usage.get('completion_tokens')}"
+                                )
+                        except Exception as e:
+                            logger.debug(f"Failed to parse SSE line: {e}")
+                            continue
 
         except Exception as e:
             logger.error(f"Grok streaming exception: {str(e)}")
@@ -157,27 +217,23 @@ class GrokClient:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": "grok-3",
-                        "messages": messages,
-                        "max_tokens": max_tokens,
-                        "temperature": temperature,
-                    }
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    return data["choices"][0]["message"]["content"]
-                else:
-                    logger.error(f"Grok API error: {response.status_code} - {response.text}")
-                    return None
+            response = await self._http.post(
+                "/chat/completions",
+                json={
+                    "model": self.model,
+                    "messages": messages,
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                },
+                timeout=60.0,
+            )
+
+            if response.status_code == 200:
+                data = response.json()
+                return data["choices"][0]["message"]["content"]
+            else:
+                logger.error(f"Grok API error: {response.status_code} - {response.text}")
+                return None
 
         except Exception as e:
             logger.error(f"Grok chat exception: {str(e)}")
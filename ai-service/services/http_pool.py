@@ -0,0 +1,257 @@
+"""
+共享 HTTP 连接池 - 长连接复用、HTTP/2 与连接池统计
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from loguru import logger
+
+from utils.deadline import request_timeout
+from utils.env import env_bool, env_float, env_int
+
+
+@dataclass
+class HTTPPoolConfig:
+    """连接池配置"""
+
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 60.0
+    max_concurrent_requests: int = 64
+    connect_timeout: float = 10.0
+    http2: bool = True
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "HTTPPoolConfig":
+        """
+        从环境变量读取配置，例如 GROK_HTTP_MAX_CONNECTIONS
+
+        Args:
+            prefix: 环境变量前缀
+
+        Returns:
+            连接池配置
+        """
+        defaults = cls()
+        return cls(
+            max_connections=env_int(f"{prefix}_MAX_CONNECTIONS", defaults.max_connections),
+            max_keepalive_connections=env_int(
+                f"{prefix}_MAX_KEEPALIVE", defaults.max_keepalive_connections
+            ),
+            keepalive_expiry=env_float(f"{prefix}_KEEPALIVE_EXPIRY", defaults.keepalive_expiry),
+            max_concurrent_requests=env_int(
+                f"{prefix}_MAX_CONCURRENT_REQUESTS", defaults.max_concurrent_requests
+            ),
+            connect_timeout=env_float(f"{prefix}_CONNECT_TIMEOUT", defaults.connect_timeout),
+            http2=env_bool(f"{prefix}_HTTP2", defaults.http2),
+        )
+
+
+class PooledHTTPClient:
+    """
+    长生命周期的 httpx.AsyncClient 封装
+
+    应用启动时 start()，关闭时 aclose()；请求并发由信号量限制，
+    超出 max_concurrent_requests 的请求会排队等待并计入 waits。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        headers: Optional[Dict[str, str]] = None,
+        config: Optional[HTTPPoolConfig] = None,
+    ):
+        """
+        初始化连接池
+
+        Args:
+            name: 连接池名称（用于日志与统计）
+            base_url: 基础 URL
+            headers: 默认请求头
+            config: 连接池配置
+        """
+        self.name = name
+        self.base_url = base_url
+        self.headers = headers or {}
+        self.config = config or HTTPPoolConfig()
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._start_lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(max(1, self.config.max_concurrent_requests))
+
+        # 统计
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._requests_total = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._http2_enabled = False
+
+    @property
+    def started(self) -> bool:
+        """连接池是否已打开"""
+        return self._client is not None and not self._client.is_closed
+
+    async def start(self):
+        """打开连接池（幂等）"""
+        async with self._start_lock:
+            if self.started:
+                return
+
+            http2 = self.config.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning(f"{self.name}: h2 not installed, falling back to HTTP/1.1")
+                    http2 = False
+
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=self.config.max_connections,
+                    max_keepalive_connections=self.config.max_keepalive_connections,
+                    keepalive_expiry=self.config.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(60.0, connect=self.config.connect_timeout),
+            )
+            self._http2_enabled = http2
+            logger.info(
+                f"{self.name} HTTP pool started (http2={http2}, "
+                f"max_connections={self.config.max_connections}, "
+                f"max_keepalive={self.config.max_keepalive_connections})"
+            )
+
+    async def aclose(self):
+        """关闭连接池"""
+        async with self._start_lock:
+            if self._client is not None:
+                await self._client.aclose()
+                self._client = None
+                logger.info(f"{self.name} HTTP pool closed")
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        if not self.started:
+            # 未经过 FastAPI 生命周期（如脚本调用）时按需打开
+            await self.start()
+        return self._client
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        if self._semaphore.locked():
+            self._waits += 1
+            wait_started = time.monotonic()
+            await self._semaphore.acquire()
+            self._wait_time_total += time.monotonic() - wait_started
+        else:
+            await self._semaphore.acquire()
+
+        self._requests_total += 1
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    async def post(
+        self,
+        url: str,
+        *,
+        json: Any = None,
+        timeout: Optional[float] = None,
+    ) -> httpx.Response:
+        """
+        发送 POST 请求
+
+        Args:
+            url: 相对或绝对 URL
+            json: 请求体
+            timeout: 本次请求超时（秒），设置了截止时间时不超过剩余时间
+
+        Returns:
+            响应对象
+        """
+        client = await self._get_client()
+        async with self._slot():
+            return await client.post(
+                url,
+                json=json,
+                timeout=request_timeout(timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT),
+            )
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        method: str,
+        url: str,
+        *,
+        json: Any = None,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[httpx.Response]:
+        """
+        发送流式请求，流结束前一直占用并发槽位
+
+        Args:
+            method: HTTP 方法
+            url: 相对或绝对 URL
+            json: 请求体
+            timeout: 本次请求超时（秒），设置了截止时间时不超过剩余时间
+
+        Yields:
+            流式响应对象
+        """
+        client = await self._get_client()
+        async with self._slot():
+            async with client.stream(
+                method,
+                url,
+                json=json,
+                timeout=request_timeout(timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT),
+            ) as response:
+                yield response
+
+    def _connection_stats(self) -> Dict[str, Optional[int]]:
+        """读取底层 httpcore 连接池状态（内部 API，读取失败时返回 None）"""
+        open_connections = None
+        idle_connections = None
+        try:
+            pool = self._client._transport._pool  # type: ignore[union-attr]
+            connections = list(pool.connections)
+            open_connections = len(connections)
+            idle_connections = sum(1 for conn in connections if conn.is_idle())
+        except Exception:
+            pass
+        return {"open": open_connections, "idle": idle_connections}
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        连接池统计
+
+        Returns:
+            包含 in_use / idle / waits 等字段的字典
+        """
+        connections = self._connection_stats() if self.started else {"open": 0, "idle": 0}
+        return {
+            "name": self.name,
+            "started": self.started,
+            "http2": self._http2_enabled,
+            "in_use": self._in_flight,
+            "peak_in_use": self._peak_in_flight,
+            "idle": connections["idle"],
+            "open_connections": connections["open"],
+            "waits": self._waits,
+            "avg_wait_ms": round(self._wait_time_total / self._waits * 1000, 2) if self._waits else 0.0,
+            "requests_total": self._requests_total,
+            "max_connections": self.config.max_connections,
+            "max_keepalive_connections": self.config.max_keepalive_connections,
+            "max_concurrent_requests": self.config.max_concurrent_requests,
+        }
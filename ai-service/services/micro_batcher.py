@@ -0,0 +1,362 @@
+"""
+单句翻译微批 - 把短时间窗口内到达的同语言单句请求合并成一次带索引的批量调用
+"""
+import asyncio
+import json
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from services.ai_orchestrator import AIOrchestrator
+from services.segment_translation import parse_segment_translations
+from services.token_batching import ITEM_OUTPUT_OVERHEAD, estimate_tokens
+from utils.env import env_bool, env_float, env_int
+
+TARGET_LANGUAGE_NAMES: Dict[str, str] = {
+    "zh-CN": "Simplified Chinese (简体中文)",
+    "zh-TW": "Traditional Chinese (繁體中文)",
+    "en": "English",
+    "ja": "Japanese (日本語)",
+    "ko": "Korean (한국어)",
+    "fr": "French (Français)",
+    "de": "German (Deutsch)",
+    "es": "Spanish (Español)",
+}
+
+
+def target_language_name(target_language: str) -> str:
+    """目标语言代码 -> 提示词中的语言名称"""
+    return TARGET_LANGUAGE_NAMES.get(target_language, target_language)
+
+
+def build_single_prompt(text: str, target_language: str) -> str:
+    """
+    单句翻译提示词
+
+    Args:
+        text: 原文
+        target_language: 目标语言代码
+
+    Returns:
+        提示词
+    """
+    target_lang_name = target_language_name(target_language)
+    return f"""You are a professional translator. Translate the following text to {target_lang_name}.
+
+IMPORTANT RULES:
+1. Detect the source language automatically
+2. Translate to {target_lang_name} regardless of source language
+3. If the text is already in {target_lang_name}, keep it as is
+4. Only return the translation, no explanations or notes
+5. Preserve the original meaning and tone
+
+Text to translate:
+{text}
+
+Translation:"""
+
+
+def build_batch_prompt(texts: List[str], target_language: str) -> str:
+    """
+    多句合并翻译提示词（输入为 {索引: 原文} 的 JSON 对象，返回 JSON 数组）
+
+    原文以 JSON 字符串传入，其中的换行或形如 "3: " 的开头不会打乱索引。
+
+    Args:
+        texts: 原文列表
+        target_language: 目标语言代码
+
+    Returns:
+        提示词
+    """
+    target_lang_name = target_language_name(target_language)
+    indexed = json.dumps(
+        {str(index): text for index, text in enumerate(texts)}, ensure_ascii=False, indent=1
+    )
+    return f"""You are a professional translator. Translate each text in the JSON object below to {target_lang_name}.
+The object maps each zero-based index to one text.
+
+IMPORTANT RULES:
+1. Detect the source language of each text automatically
+2. Translate to {target_lang_name} regardless of source language
+3. If a text is already in {target_lang_name}, keep it as is
+4. Preserve the original meaning and tone; texts are independent of each other
+5. Return a JSON array where each element has the form {{"index": number, "translation": "..."}}, using the index from the object key
+6. Keep the same number of items as the input and output valid JSON only
+
+Texts:
+{indexed}
+
+JSON:"""
+
+
+@dataclass
+class MicroBatchConfig:
+    """微批配置"""
+
+    enabled: bool = True
+    # 合并窗口（毫秒）：首个请求到达后最多等待这么久再发出
+    window_ms: float = 15.0
+    # 单批最多句子数，达到即立即发出
+    max_items: int = 16
+    # 请求未声明延迟预算时，允许的最大排队等待（毫秒）
+    max_wait_ms: float = 50.0
+
+    @classmethod
+    def from_env(cls, prefix: str = "AI_MICROBATCH") -> "MicroBatchConfig":
+        """
+        从环境变量读取配置，例如 AI_MICROBATCH_WINDOW_MS
+
+        Args:
+            prefix: 环境变量前缀
+
+        Returns:
+            微批配置
+        """
+        defaults = cls()
+        return cls(
+            enabled=env_bool(f"{prefix}_ENABLED", defaults.enabled),
+            window_ms=env_float(f"{prefix}_WINDOW_MS", defaults.window_ms),
+            max_items=env_int(f"{prefix}_MAX_ITEMS", defaults.max_items),
+            max_wait_ms=env_float(f"{prefix}_MAX_WAIT_MS", defaults.max_wait_ms),
+        )
+
+
+@dataclass
+class _Group:
+    """同一 (目标语言, 偏好提供商, 是否缓存) 的待发请求"""
+
+    flush_at: float
+    # 原文 -> 等待该译文的调用方（相同原文只翻译一次）
+    waiters: Dict[str, List[asyncio.Future]] = field(default_factory=dict)
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    timer: Optional[asyncio.Task] = None
+
+
+class TranslationMicroBatcher:
+    """
+    单句翻译微批器
+
+    同一目标语言的并发请求在窗口内合并为一次带索引的调用，再按索引拆分
+    给各调用方；每个请求的延迟预算（max_wait）会把整批的发出时间提前，
+    因此排队等待不会超过任何一个成员的预算。批量响应缺失的句子单独重试。
+    """
+
+    def __init__(self, orch: AIOrchestrator, config: Optional[MicroBatchConfig] = None):
+        """
+        初始化微批器
+
+        Args:
+            orch: AI 编排器
+            config: 微批配置
+        """
+        self.orch = orch
+        self.config = config or MicroBatchConfig()
+        self._groups: Dict[Tuple[str, Optional[str], bool], _Group] = {}
+        self._tasks: set = set()
+
+        self._requests = 0
+        self._batches = 0
+        self._batched_items = 0
+        self._single_calls = 0
+        self._retried_items = 0
+
+    async def translate(
+        self,
+        text: str,
+        target_language: str,
+        preferred: Optional[str] = None,
+        use_cache: bool = True,
+        max_wait_ms: Optional[float] = None,
+    ) -> Tuple[Optional[str], str]:
+        """
+        翻译一个句子（可能与其他并发请求合并）
+
+        Args:
+            text: 原文
+            target_language: 目标语言代码
+            preferred: 偏好的提供商
+            use_cache: 是否使用响应缓存
+            max_wait_ms: 本请求可接受的最大排队等待（毫秒）
+
+        Returns:
+            (译文, 模型名称)，失败时译文为 None
+        """
+        self._requests += 1
+        if not self.config.enabled or self.config.max_items <= 1:
+            return await self._translate_one(text, target_language, preferred, use_cache)
+
+        budget = self.config.max_wait_ms if max_wait_ms is None else max(0.0, max_wait_ms)
+        deadline = time.monotonic() + min(self.config.window_ms, budget) / 1000
+
+        key = (target_language, preferred, use_cache)
+        group = self._groups.get(key)
+        if group is None:
+            group = _Group(flush_at=deadline)
+            self._groups[key] = group
+            group.timer = self._spawn(self._flush_when_due(key, group))
+        elif deadline < group.flush_at:
+            # 更紧的延迟预算：提前整批的发出时间
+            group.flush_at = deadline
+            group.wakeup.set()
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        group.waiters.setdefault(text, []).append(future)
+        if len(group.waiters) >= self.config.max_items:
+            # 批已满：立即发出，后续请求进入新批
+            if self._groups.get(key) is group:
+                del self._groups[key]
+            group.flush_at = 0.0
+            group.wakeup.set()
+
+        return await future
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush_when_due(self, key: Tuple[str, Optional[str], bool], group: _Group):
+        while True:
+            delay = group.flush_at - time.monotonic()
+            if delay <= 0:
+                break
+            group.wakeup.clear()
+            try:
+                await asyncio.wait_for(group.wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+        if self._groups.get(key) is group:
+            del self._groups[key]
+        target_language, preferred, use_cache = key
+        try:
+            await self._dispatch(group, target_language, preferred, use_cache)
+        except Exception as e:
+            logger.error(f"Micro-batch dispatch failed: {e}")
+            for futures in group.waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_result((None, "none"))
+
+    async def _dispatch(
+        self,
+        group: _Group,
+        target_language: str,
+        preferred: Optional[str],
+        use_cache: bool,
+    ):
+        # 跳过所有调用方都已取消的句子
+        texts = [
+            text for text, futures in group.waiters.items()
+            if any(not future.done() for future in futures)
+        ]
+        if not texts:
+            return
+
+        if len(texts) == 1:
+            results = {texts[0]: await self._translate_one(texts[0], target_language, preferred, use_cache)}
+        else:
+            results = await self._translate_many(texts, target_language, preferred, use_cache)
+
+        for text, futures in group.waiters.items():
+            outcome = results.get(text, (None, "none"))
+            for future in futures:
+                if not future.done():
+                    future.set_result(outcome)
+
+    async def _translate_one(
+        self,
+        text: str,
+        target_language: str,
+        preferred: Optional[str],
+        use_cache: bool,
+    ) -> Tuple[Optional[str], str]:
+        self._single_calls += 1
+        result, model = await self.orch.generate_completion(
+            build_single_prompt(text, target_language),
+            max_tokens=200,
+            temperature=0.2,
+            preferred=preferred,
+            endpoint="translate-single",
+            use_cache=use_cache,
+        )
+        return (result.strip() if result else None), model
+
+    async def _translate_many(
+        self,
+        texts: List[str],
+        target_language: str,
+        preferred: Optional[str],
+        use_cache: bool,
+    ) -> Dict[str, Tuple[Optional[str], str]]:
+        self._batches += 1
+        self._batched_items += len(texts)
+        max_tokens = min(
+            4096,
+            64 + sum(ITEM_OUTPUT_OVERHEAD + math.ceil(estimate_tokens(text) * 2) for text in texts),
+        )
+        result, model = await self.orch.generate_completion(
+            build_batch_prompt(texts, target_language),
+            max_tokens=max_tokens,
+            temperature=0.2,
+            preferred=preferred,
+            endpoint="translate-single",
+            use_cache=use_cache,
+        )
+
+        parsed: Dict[int, str] = {}
+        if result is not None:
+            try:
+                parsed = parse_segment_translations(result)
+            except ValueError as e:
+                logger.warning(f"Failed to parse micro-batch response: {e}")
+
+        results: Dict[str, Tuple[Optional[str], str]] = {}
+        missing: List[str] = []
+        for index, text in enumerate(texts):
+            if index in parsed:
+                results[text] = (parsed[index], model)
+            else:
+                missing.append(text)
+
+        if missing and result is not None:
+            # 批量响应不完整：缺失的句子按单句方式并发重试
+            self._retried_items += len(missing)
+            outcomes = await asyncio.gather(
+                *(self._translate_one(text, target_language, preferred, use_cache) for text in missing)
+            )
+            results.update(zip(missing, outcomes))
+        return results
+
+    async def aclose(self):
+        """立即发出所有待发批次并等待完成"""
+        for group in self._groups.values():
+            group.flush_at = 0.0
+            group.wakeup.set()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        微批统计
+
+        Returns:
+            请求数、批次数、平均批大小等
+        """
+        return {
+            "enabled": self.config.enabled,
+            "window_ms": self.config.window_ms,
+            "max_items": self.config.max_items,
+            "requests": self._requests,
+            "batches": self._batches,
+            "batched_items": self._batched_items,
+            "avg_batch_size": round(self._batched_items / self._batches, 2) if self._batches else 0.0,
+            "single_calls": self._single_calls,
+            "retried_items": self._retried_items,
+            "pending_groups": len(self._groups),
+        }
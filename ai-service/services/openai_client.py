@@ -3,7 +3,8 @@ OpenAI API 客户端
 """
 from typing import Optional
 from loguru import logger
-from openai import AsyncOpenAI
+from openai import NOT_GIVEN, AsyncOpenAI
+from utils.deadline import request_timeout
 
 
 class OpenAIClient:
@@ -17,6 +18,7 @@ class OpenAIClient:
             api_key: OpenAI API 密钥
         """
         self.api_key = api_key
+        self.model = "gpt-4o-mini"  # 使用 GPT-4o-mini 性价比更高
         self.available = bool(api_key)
 
         if not self.available:
@@ -48,12 +50,13 @@ class OpenAIClient:
 
         try:
             response = await self.client.chat.completions.create(
-                model="gpt-4o-mini",  # 使用 GPT-4o-mini 性价比更高
+                model=self.model,
                 messages=[
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=max_tokens,
                 temperature=temperature,
+                timeout=request_timeout(NOT_GIVEN),
             )
 
             return response.choices[0].message.content
@@ -76,6 +79,33 @@ class OpenAIClient:
             max_tokens: 最大 token 数
             temperature: 温度参数
 
+        Yields:
+            生成的文本片段
+        """
+        async for content in self.stream_chat(
+            [{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+        ):
+            yield content
+
+    async def stream_chat(
+        self,
+        messages: list,
+        max_tokens: int = 500,
+        temperature: float = 0.7
+    ):
+        """
+        使用messages格式流式对话
+
+        消息原样发送（保留 system/assistant 轮次），稳定的前缀可命中
+        提供商的提示词缓存；命中的 token 数记录在日志中。
+
+        Args:
+            messages: 消息列表
+            max_tokens: 最大 token 数
+            temperature: 温度参数
+
         Yields:
             生成的文本片段
         """
@@ -85,18 +115,25 @@ class OpenAIClient:
 
         try:
             stream = await self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+                model=self.model,
+                messages=messages,
                 max_tokens=max_tokens,
                 temperature=temperature,
                 stream=True,
+                stream_options={"include_usage": True},
+                timeout=request_timeout(NOT_GIVEN),
             )
 
             async for chunk in stream:
-                if chunk.choices[0].delta.content:
+                if chunk.choices and chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
+                if chunk.usage is not None:
+                    details = getattr(chunk.usage, "prompt_tokens_details", None)
+                    cached = getattr(details, "cached_tokens", None) or 0
+                    logger.info(
+                        f"OpenAI stream usage: prompt={chunk.usage.prompt_tokens}, "
+                        f"cached={cached}, completion={chunk.usage.completion_tokens}"
+                    )
 
         except Exception as e:
             logger.error(f"OpenAI streaming exception: {str(e)}")
@@ -130,6 +167,7 @@ class OpenAIClient:
                 messages=messages,
                 max_tokens=max_tokens,
                 temperature=temperature,
+                timeout=request_timeout(NOT_GIVEN),
             )
 
             return response.choices[0].message.content
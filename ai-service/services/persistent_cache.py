@@ -0,0 +1,310 @@
+"""
+持久化补全缓存 - SQLite (WAL) 二级缓存，重启后仍可命中
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from utils.env import env_bool, env_float, env_int
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent.parent / "data" / "ai_cache.sqlite3"
+
+
+@dataclass
+class PersistentCacheConfig:
+    """持久化缓存配置"""
+
+    enabled: bool = True
+    path: str = str(DEFAULT_CACHE_PATH)
+    max_bytes: int = 256 * 1024 * 1024
+    ttl_seconds: float = 7 * 24 * 3600
+    compact_interval_seconds: float = 3600.0
+
+    @classmethod
+    def from_env(cls, prefix: str = "AI_DISK_CACHE") -> "PersistentCacheConfig":
+        """
+        从环境变量读取配置，例如 AI_DISK_CACHE_PATH
+
+        Args:
+            prefix: 环境变量前缀
+
+        Returns:
+            缓存配置
+        """
+        defaults = cls()
+        return cls(
+            enabled=env_bool(f"{prefix}_ENABLED", defaults.enabled),
+            path=os.getenv(f"{prefix}_PATH") or defaults.path,
+            max_bytes=env_int(f"{prefix}_MAX_BYTES", defaults.max_bytes),
+            ttl_seconds=env_float(f"{prefix}_TTL_SECONDS", defaults.ttl_seconds),
+            compact_interval_seconds=env_float(
+                f"{prefix}_COMPACT_INTERVAL", defaults.compact_interval_seconds
+            ),
+        )
+
+
+class PersistentCache:
+    """
+    SQLite 二级缓存
+
+    所有数据库操作都在线程池中执行（asyncio.to_thread），不阻塞事件循环；
+    写入为后台任务（set_nowait），超出容量时按最近访问时间淘汰并定期压缩。
+    """
+
+    def __init__(self, config: Optional[PersistentCacheConfig] = None):
+        """
+        初始化持久化缓存
+
+        Args:
+            config: 缓存配置
+        """
+        self.config = config or PersistentCacheConfig()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._bytes = 0
+        self._pending_writes: Set[asyncio.Task] = set()
+        self._compact_task: Optional[asyncio.Task] = None
+        self._compacting = False
+
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._evictions = 0
+        self._errors = 0
+
+    @property
+    def is_open(self) -> bool:
+        """缓存是否可用"""
+        return self._conn is not None
+
+    async def open(self):
+        """打开数据库并启动定期压缩"""
+        if not self.config.enabled or self.is_open:
+            return
+        try:
+            await asyncio.to_thread(self._open_sync)
+        except Exception as e:
+            logger.error(f"Failed to open persistent cache at {self.config.path}: {e}")
+            self._conn = None
+            return
+
+        self._compact_task = asyncio.create_task(self._compact_loop())
+        logger.info(f"Persistent cache opened: {self.config.path} ({self._bytes} bytes)")
+
+    def _open_sync(self):
+        path = Path(self.config.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_accessed ON completions(accessed_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_expires ON completions(expires_at)")
+        row = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()
+        self._bytes = int(row[0])
+        self._conn = conn
+
+    async def close(self):
+        """等待未完成的写入并关闭数据库"""
+        if self._compact_task:
+            self._compact_task.cancel()
+            self._compact_task = None
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+        if self._conn is not None:
+            conn = self._conn
+            self._conn = None
+            await asyncio.to_thread(self._close_sync, conn)
+            logger.info("Persistent cache closed")
+
+    def _close_sync(self, conn: sqlite3.Connection):
+        with self._db_lock:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.close()
+
+    async def lookup(self, keys: List[str]) -> Optional[Tuple[str, str]]:
+        """
+        按顺序查找多个候选键
+
+        Args:
+            keys: 候选缓存键
+
+        Returns:
+            (命中的键, 缓存值)，未命中返回 None
+        """
+        if not self.is_open or not keys:
+            return None
+        try:
+            found = await asyncio.to_thread(self._lookup_sync, keys)
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"Persistent cache read failed: {e}")
+            return None
+
+        if found is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        return found
+
+    def _lookup_sync(self, keys: List[str]) -> Optional[Tuple[str, str]]:
+        now = time.time()
+        placeholders = ",".join("?" for _ in keys)
+        with self._db_lock:
+            conn = self._conn
+            if conn is None:
+                return None
+            rows = conn.execute(
+                f"SELECT key, value FROM completions WHERE key IN ({placeholders}) AND expires_at > ?",
+                (*keys, now),
+            ).fetchall()
+            if not rows:
+                return None
+            values: Dict[str, bytes] = dict(rows)
+            key = next(k for k in keys if k in values)
+            conn.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+        return key, zlib.decompress(values[key]).decode("utf-8")
+
+    def set_nowait(self, key: str, value: str):
+        """
+        后台写入（不阻塞调用方）
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+        """
+        if not self.is_open:
+            return
+        task = asyncio.create_task(self.set(key, value))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+
+    async def set(self, key: str, value: str):
+        """
+        写入缓存，超出容量时触发淘汰
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+        """
+        if not self.is_open:
+            return
+        try:
+            await asyncio.to_thread(self._set_sync, key, value)
+            self._writes += 1
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"Persistent cache write failed: {e}")
+            return
+
+        if self._bytes > self.config.max_bytes and not self._compacting:
+            await self.compact()
+
+    def _set_sync(self, key: str, value: str):
+        blob = zlib.compress(value.encode("utf-8"))
+        now = time.time()
+        with self._db_lock:
+            conn = self._conn
+            if conn is None:
+                return
+            row = conn.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO completions (key, value, size, created_at, expires_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, blob, len(blob), now, now + self.config.ttl_seconds, now),
+            )
+            self._bytes += len(blob) - (row[0] if row else 0)
+
+    async def compact(self):
+        """删除过期条目、按最近访问时间淘汰到容量的 90%，并回收文件空间"""
+        if not self.is_open or self._compacting:
+            return
+        self._compacting = True
+        try:
+            evicted = await asyncio.to_thread(self._compact_sync)
+            self._evictions += evicted
+            if evicted:
+                logger.info(f"Persistent cache compacted: {evicted} entries removed")
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"Persistent cache compaction failed: {e}")
+        finally:
+            self._compacting = False
+
+    def _compact_sync(self) -> int:
+        target = int(self.config.max_bytes * 0.9)
+        with self._db_lock:
+            conn = self._conn
+            if conn is None:
+                return 0
+            removed = conn.execute(
+                "DELETE FROM completions WHERE expires_at <= ?", (time.time(),)
+            ).rowcount
+
+            total = int(conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0])
+            if total > target:
+                # 按最近访问时间从旧到新累计，删除超出部分
+                rows = conn.execute("SELECT key, size FROM completions ORDER BY accessed_at ASC").fetchall()
+                victims = []
+                for key, size in rows:
+                    if total <= target:
+                        break
+                    victims.append((key,))
+                    total -= size
+                conn.executemany("DELETE FROM completions WHERE key = ?", victims)
+                removed += len(victims)
+
+            self._bytes = total
+            conn.execute("PRAGMA incremental_vacuum")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+    async def _compact_loop(self):
+        while True:
+            await asyncio.sleep(self.config.compact_interval_seconds)
+            await self.compact()
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        缓存统计
+
+        Returns:
+            命中率、容量、淘汰次数等
+        """
+        lookups = self._hits + self._misses
+        return {
+            "enabled": self.config.enabled,
+            "open": self.is_open,
+            "path": self.config.path,
+            "bytes": self._bytes,
+            "max_bytes": self.config.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            "writes": self._writes,
+            "pending_writes": len(self._pending_writes),
+            "evictions": self._evictions,
+            "errors": self._errors,
+        }
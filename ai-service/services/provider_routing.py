@@ -0,0 +1,346 @@
+"""
+提供商路由策略 - 基于滚动延迟与错误率选择更快的健康提供商
+"""
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from utils.env import env_float, env_int, env_mapping
+
+# 未指定端点的调用记录在这个端点下
+DEFAULT_ENDPOINT = "default"
+
+
+@dataclass
+class ProviderStats:
+    """单个 (提供商, 模型[, 端点]) 的滚动统计"""
+
+    samples: int
+    p50: Optional[float]
+    p95: Optional[float]
+    error_rate: float
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "samples": self.samples,
+            "p50_ms": round(self.p50 * 1000, 1) if self.p50 is not None else None,
+            "p95_ms": round(self.p95 * 1000, 1) if self.p95 is not None else None,
+            "error_rate": round(self.error_rate, 3),
+        }
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class LatencyTracker:
+    """
+    按 (提供商, 模型, 端点) 记录最近的调用延迟与成功/失败
+
+    不同端点的输出长度相差很大（单句翻译几百 token，报告几千 token），
+    分端点统计才能得到有意义的分位数；查询时不指定端点则汇总所有端点。
+    """
+
+    def __init__(
+        self,
+        max_samples: int = 200,
+        window_seconds: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        初始化延迟统计
+
+        Args:
+            max_samples: 每个 (提供商, 模型, 端点) 最多保留的样本数
+            window_seconds: 样本有效时间窗口（秒）
+            clock: 时钟函数（便于测试）
+        """
+        self.max_samples = max_samples
+        self.window_seconds = window_seconds
+        self._clock = clock
+        self._samples: Dict[Tuple[str, str, str], Deque[Tuple[float, float, bool]]] = {}
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        latency: float,
+        ok: bool,
+        endpoint: Optional[str] = None,
+    ):
+        """
+        记录一次调用
+
+        Args:
+            provider: 提供商名称
+            model: 模型名称
+            latency: 耗时（秒）
+            ok: 是否成功
+            endpoint: 端点名称
+        """
+        key = (provider, model, endpoint or DEFAULT_ENDPOINT)
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.max_samples)
+        samples.append((self._clock(), latency, ok))
+
+    def _recent(
+        self,
+        provider: str,
+        model: str,
+        endpoint: Optional[str] = None,
+    ) -> List[Tuple[float, float, bool]]:
+        cutoff = self._clock() - self.window_seconds
+        recent: List[Tuple[float, float, bool]] = []
+        for key, samples in list(self._samples.items()):
+            if key[:2] != (provider, model) or (endpoint is not None and key[2] != endpoint):
+                continue
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+            recent.extend(samples)
+        return recent
+
+    def stats(self, provider: str, model: str, endpoint: Optional[str] = None) -> ProviderStats:
+        """
+        获取滚动统计（延迟分位数只统计成功调用）
+
+        Args:
+            provider: 提供商名称
+            model: 模型名称
+            endpoint: 端点名称，None 表示汇总所有端点
+
+        Returns:
+            统计结果
+        """
+        recent = self._recent(provider, model, endpoint)
+        latencies = sorted(latency for _, latency, ok in recent if ok)
+        errors = sum(1 for _, _, ok in recent if not ok)
+        return ProviderStats(
+            samples=len(recent),
+            p50=_percentile(latencies, 0.5),
+            p95=_percentile(latencies, 0.95),
+            error_rate=errors / len(recent) if recent else 0.0,
+        )
+
+    def percentile(
+        self,
+        provider: str,
+        model: str,
+        q: float,
+        endpoint: Optional[str] = None,
+    ) -> Optional[float]:
+        """
+        成功调用延迟的任意分位数
+
+        Args:
+            provider: 提供商名称
+            model: 模型名称
+            q: 分位数（0-1）
+            endpoint: 端点名称，None 表示汇总所有端点
+
+        Returns:
+            延迟（秒），样本不足时为 None
+        """
+        recent = self._recent(provider, model, endpoint)
+        return _percentile(sorted(latency for _, latency, ok in recent if ok), q)
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """所有键的统计快照"""
+        return {
+            f"{provider}:{model}:{endpoint}": self.stats(provider, model, endpoint).to_dict()
+            for provider, model, endpoint in list(self._samples.keys())
+        }
+
+
+class RoutingPolicy(ABC):
+    """路由策略接口：给定候选提供商，返回尝试顺序"""
+
+    name = "base"
+
+    @abstractmethod
+    def rank(
+        self,
+        candidates: List[Tuple[str, str]],
+        *,
+        preferred: Optional[str] = None,
+        endpoint: Optional[str] = None,
+    ) -> List[str]:
+        """
+        对候选提供商排序
+
+        Args:
+            candidates: (提供商, 模型) 列表，已按默认偏好排列
+            preferred: 请求偏好的提供商
+            endpoint: 端点名称（如 summary、translate-single）
+
+        Returns:
+            提供商名称列表，按尝试顺序排列
+        """
+
+
+class StaticPreferencePolicy(RoutingPolicy):
+    """固定偏好：请求偏好的提供商优先，其余按默认顺序"""
+
+    name = "static"
+
+    def rank(self, candidates, *, preferred=None, endpoint=None):
+        names = [provider for provider, _ in candidates]
+        if preferred in names:
+            names.remove(preferred)
+            names.insert(0, preferred)
+        return names
+
+
+class LatencyAwarePolicy(RoutingPolicy):
+    """
+    延迟感知路由
+
+    以该端点的 p95 延迟与错误率计算得分（越低越好）并除以权重，端点样本
+    不足时退回到所有端点的汇总统计；偏好的提供商
+    只有在明显更慢（超出 switch_tolerance）时才会被让位，避免来回抖动。
+    少量流量（explore_ratio）会被派往样本最少的提供商以保持统计新鲜。
+    """
+
+    name = "latency"
+
+    def __init__(
+        self,
+        tracker: LatencyTracker,
+        weights: Optional[Dict[str, float]] = None,
+        endpoint_overrides: Optional[Dict[str, List[str]]] = None,
+        min_samples: int = 5,
+        error_penalty: float = 4.0,
+        switch_tolerance: float = 0.2,
+        explore_ratio: float = 0.05,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        初始化策略
+
+        Args:
+            tracker: 延迟统计
+            weights: 提供商权重（越大越倾向），默认 1.0
+            endpoint_overrides: 端点 -> 固定提供商顺序
+            min_samples: 参与比较所需的最少样本数
+            error_penalty: 错误率惩罚系数
+            switch_tolerance: 偏好提供商的容忍度
+            explore_ratio: 探索流量比例
+            rng: 随机数生成器（便于测试）
+        """
+        self.tracker = tracker
+        self.weights = weights or {}
+        self.endpoint_overrides = endpoint_overrides or {}
+        self.min_samples = min_samples
+        self.error_penalty = error_penalty
+        self.switch_tolerance = switch_tolerance
+        self.explore_ratio = explore_ratio
+        self._rng = rng or random.Random()
+
+    def score(self, provider: str, model: str, endpoint: Optional[str] = None) -> Optional[float]:
+        """
+        计算得分（越低越好），样本不足时返回 None
+
+        Args:
+            provider: 提供商名称
+            model: 模型名称
+            endpoint: 端点名称
+
+        Returns:
+            得分
+        """
+        stats = self.tracker.stats(provider, model, endpoint or DEFAULT_ENDPOINT)
+        if stats.samples < self.min_samples:
+            stats = self.tracker.stats(provider, model)
+        if stats.samples < self.min_samples:
+            return None
+        # 全部失败时没有延迟样本，视为极慢
+        p95 = stats.p95 if stats.p95 is not None else 60.0
+        weight = max(self.weights.get(provider, 1.0), 1e-6)
+        return p95 * (1 + self.error_penalty * stats.error_rate) / weight
+
+    def rank(self, candidates, *, preferred=None, endpoint=None):
+        names = StaticPreferencePolicy().rank(candidates, preferred=preferred)
+
+        override = self.endpoint_overrides.get(endpoint or "")
+        if override:
+            ordered = [name for name in override if name in names]
+            return ordered + [name for name in names if name not in ordered]
+
+        if len(names) < 2:
+            return names
+
+        models = dict(candidates)
+        scores = {name: self.score(name, models[name], endpoint) for name in names}
+
+        # 探索：偶尔把样本不足的提供商放到最前面
+        unknown = [name for name in names if scores[name] is None]
+        if unknown and self._rng.random() < self.explore_ratio:
+            explore = unknown[0]
+            return [explore] + [name for name in names if name != explore]
+
+        head = names[0]
+        known = [name for name in names if scores[name] is not None]
+        if scores[head] is None or not known:
+            return names
+
+        best = min(known, key=lambda name: scores[name])
+        if best != head and scores[best] * (1 + self.switch_tolerance) < scores[head]:
+            logger.debug(
+                f"Routing {endpoint or 'default'}: {best} faster than {head} "
+                f"({scores[best]:.2f} vs {scores[head]:.2f})"
+            )
+            rest = sorted(
+                (name for name in names if name != best),
+                key=lambda name: scores[name] if scores[name] is not None else float("inf"),
+            )
+            return [best] + rest
+        return names
+
+
+def build_routing_policy(tracker: LatencyTracker) -> RoutingPolicy:
+    """
+    根据环境变量构建路由策略
+
+    AI_ROUTING_POLICY: latency（默认）或 static
+    AI_ROUTING_WEIGHTS: 例如 "grok=1.0,openai=0.8"
+    AI_ROUTING_OVERRIDES: 例如 "summary=openai|grok,translate-single=grok"
+
+    Args:
+        tracker: 延迟统计
+
+    Returns:
+        路由策略
+    """
+    policy_name = os.getenv("AI_ROUTING_POLICY", "latency").strip().lower()
+    if policy_name == "static":
+        return StaticPreferencePolicy()
+
+    weights: Dict[str, float] = {}
+    for provider, value in env_mapping("AI_ROUTING_WEIGHTS").items():
+        try:
+            weights[provider] = float(value)
+        except ValueError:
+            logger.warning(f"Invalid routing weight for {provider}: {value}")
+
+    overrides = {
+        endpoint: [name.strip() for name in value.split("|") if name.strip()]
+        for endpoint, value in env_mapping("AI_ROUTING_OVERRIDES").items()
+    }
+
+    return LatencyAwarePolicy(
+        tracker,
+        weights=weights,
+        endpoint_overrides=overrides,
+        min_samples=env_int("AI_ROUTING_MIN_SAMPLES", 5),
+        switch_tolerance=env_float("AI_ROUTING_SWITCH_TOLERANCE", 0.2),
+        explore_ratio=env_float("AI_ROUTING_EXPLORE_RATIO", 0.05),
+    )
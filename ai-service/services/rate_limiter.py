@@ -0,0 +1,155 @@
+"""
+提供商限流 - 按提供商的令牌桶，平滑批量任务对上游的请求速率
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+from loguru import logger
+
+from utils.env import env_mapping
+
+
+def _parse_rates(key: str) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for provider, value in env_mapping(key).items():
+        try:
+            rates[provider] = float(value)
+        except ValueError:
+            logger.warning(f"Invalid rate for {provider} in {key}: {value}")
+    return rates
+
+
+@dataclass
+class RateLimitConfig:
+    """限流配置"""
+
+    # 提供商 -> 每秒请求数；未配置或 <= 0 表示不限流
+    rates: Dict[str, float] = field(default_factory=dict)
+    # 提供商 -> 突发容量（默认等于每秒请求数，至少为 1）
+    bursts: Dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls, prefix: str = "AI_RATE_LIMIT") -> "RateLimitConfig":
+        """
+        从环境变量读取配置，例如 AI_RATE_LIMIT_RPS=grok=5,openai=10
+
+        Args:
+            prefix: 环境变量前缀
+
+        Returns:
+            限流配置
+        """
+        return cls(
+            rates=_parse_rates(f"{prefix}_RPS"),
+            bursts=_parse_rates(f"{prefix}_BURST"),
+        )
+
+
+class TokenBucket:
+    """异步令牌桶（等待者按到达顺序获得令牌）"""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        初始化令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数
+            burst: 桶容量
+            clock: 时钟函数（便于测试）
+        """
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """
+        获取一个令牌，不足时等待
+
+        Returns:
+            等待时间（秒）
+        """
+        started = self._clock()
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1.0:
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1.0
+        return self._clock() - started
+
+    @property
+    def tokens(self) -> float:
+        """当前可用令牌数"""
+        self._refill()
+        return self._tokens
+
+
+class ProviderRateLimiter:
+    """每个提供商一个令牌桶；未配置速率的提供商不限流"""
+
+    def __init__(self, config: Optional[RateLimitConfig] = None):
+        """
+        初始化限流器
+
+        Args:
+            config: 限流配置
+        """
+        self.config = config or RateLimitConfig()
+        self._buckets: Dict[str, TokenBucket] = {
+            provider: TokenBucket(rate, self.config.bursts.get(provider, rate))
+            for provider, rate in self.config.rates.items()
+            if rate > 0
+        }
+        self._acquired: Dict[str, int] = {}
+        self._throttled: Dict[str, int] = {}
+        self._wait_seconds: Dict[str, float] = {}
+
+    async def acquire(self, provider: str):
+        """
+        在调用提供商前获取配额
+
+        Args:
+            provider: 提供商名称
+        """
+        bucket = self._buckets.get(provider)
+        if bucket is None:
+            return
+        waited = await bucket.acquire()
+        self._acquired[provider] = self._acquired.get(provider, 0) + 1
+        if waited > 0.001:
+            self._throttled[provider] = self._throttled.get(provider, 0) + 1
+            self._wait_seconds[provider] = self._wait_seconds.get(provider, 0.0) + waited
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """
+        限流统计
+
+        Returns:
+            每个受限提供商的速率、可用令牌、被限流次数与累计等待时间
+        """
+        return {
+            provider: {
+                "rate_per_second": bucket.rate,
+                "burst": bucket.burst,
+                "tokens": round(bucket.tokens, 2),
+                "acquired": self._acquired.get(provider, 0),
+                "throttled": self._throttled.get(provider, 0),
+                "wait_seconds": round(self._wait_seconds.get(provider, 0.0), 3),
+            }
+            for provider, bucket in self._buckets.items()
+        }
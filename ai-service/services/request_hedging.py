@@ -0,0 +1,148 @@
+"""
+请求对冲 - 主提供商迟迟未响应时向备用提供商发出同样的请求
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from utils.env import env_float, env_list
+
+
+@dataclass
+class HedgingConfig:
+    """对冲配置"""
+
+    # 启用对冲的端点（opt-in），例如 ["summary", "translate-single"]
+    endpoints: List[str] = field(default_factory=list)
+    # 以主提供商最近延迟的该分位数作为对冲等待时间
+    delay_percentile: float = 0.9
+    # 样本不足时的默认等待时间（秒）
+    default_delay: float = 3.0
+    # 等待时间下限（秒），避免过早对冲
+    min_delay: float = 0.2
+    # 额外请求预算：对冲请求数不超过总请求数的该比例
+    budget_ratio: float = 0.1
+    # 预算令牌上限
+    budget_burst: float = 10.0
+
+    @classmethod
+    def from_env(cls, prefix: str = "AI_HEDGE") -> "HedgingConfig":
+        """
+        从环境变量读取配置，例如 AI_HEDGE_ENDPOINTS=summary,translate-single
+
+        Args:
+            prefix: 环境变量前缀
+
+        Returns:
+            对冲配置
+        """
+        defaults = cls()
+        return cls(
+            endpoints=env_list(f"{prefix}_ENDPOINTS"),
+            delay_percentile=env_float(f"{prefix}_PERCENTILE", defaults.delay_percentile),
+            default_delay=env_float(f"{prefix}_DEFAULT_DELAY", defaults.default_delay),
+            min_delay=env_float(f"{prefix}_MIN_DELAY", defaults.min_delay),
+            budget_ratio=env_float(f"{prefix}_BUDGET_RATIO", defaults.budget_ratio),
+            budget_burst=env_float(f"{prefix}_BUDGET_BURST", defaults.budget_burst),
+        )
+
+
+class RequestHedger:
+    """
+    对冲决策与统计
+
+    预算采用令牌桶：每个可对冲请求存入 budget_ratio 个令牌，每次对冲消耗 1 个，
+    因此对冲请求总数始终不超过 budget_ratio × 请求总数。
+    """
+
+    def __init__(self, config: Optional[HedgingConfig] = None):
+        """
+        初始化对冲器
+
+        Args:
+            config: 对冲配置
+        """
+        self.config = config or HedgingConfig()
+        self._tokens = 0.0
+
+        self._eligible = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._primary_wins = 0
+        self._budget_rejections = 0
+
+    def is_enabled(self, endpoint: Optional[str]) -> bool:
+        """
+        端点是否启用对冲
+
+        Args:
+            endpoint: 端点名称
+
+        Returns:
+            是否启用
+        """
+        return bool(endpoint) and endpoint in self.config.endpoints
+
+    def record_request(self):
+        """记录一次可对冲请求，并为预算存入令牌"""
+        self._eligible += 1
+        self._tokens = min(self.config.budget_burst, self._tokens + self.config.budget_ratio)
+
+    def try_acquire(self) -> bool:
+        """
+        尝试消耗一次对冲预算
+
+        Returns:
+            是否允许发出对冲请求
+        """
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            self._hedged += 1
+            return True
+        self._budget_rejections += 1
+        return False
+
+    def hedge_delay(self, observed: Optional[float]) -> float:
+        """
+        计算对冲等待时间
+
+        Args:
+            observed: 主提供商最近延迟的 delay_percentile 分位数（秒）
+
+        Returns:
+            等待时间（秒）
+        """
+        if observed is None:
+            return self.config.default_delay
+        return max(self.config.min_delay, observed)
+
+    def record_winner(self, hedge_won: bool):
+        """
+        记录已对冲请求的胜者
+
+        Args:
+            hedge_won: 是否由对冲（备用）请求先返回
+        """
+        if hedge_won:
+            self._hedge_wins += 1
+        else:
+            self._primary_wins += 1
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        对冲统计
+
+        Returns:
+            对冲次数、胜率、预算等信息
+        """
+        decided = self._hedge_wins + self._primary_wins
+        return {
+            "endpoints": list(self.config.endpoints),
+            "eligible_requests": self._eligible,
+            "hedged_requests": self._hedged,
+            "hedge_ratio": round(self._hedged / self._eligible, 3) if self._eligible else 0.0,
+            "hedge_wins": self._hedge_wins,
+            "primary_wins": self._primary_wins,
+            "hedge_win_rate": round(self._hedge_wins / decided, 3) if decided else 0.0,
+            "budget_rejections": self._budget_rejections,
+            "budget_tokens": round(self._tokens, 2),
+        }
@@ -0,0 +1,231 @@
+"""
+LLM 响应缓存 - 按 (模型, 消息, 温度, max_tokens) 内容寻址，LRU + TTL 淘汰
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.env import env_float, env_int
+
+
+def build_cache_key(
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    max_tokens: int,
+) -> str:
+    """
+    计算请求的内容哈希
+
+    Args:
+        model: 模型名称
+        messages: 消息列表
+        temperature: 温度参数
+        max_tokens: 最大 token 数
+
+    Returns:
+        sha256 十六进制摘要
+    """
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "temperature": round(float(temperature), 3),
+            "max_tokens": int(max_tokens),
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ResponseCacheConfig:
+    """响应缓存配置"""
+
+    max_entries: int = 2048
+    max_bytes: int = 32 * 1024 * 1024
+    ttl_seconds: float = 24 * 3600
+    # 温度高于该值的请求默认不缓存（输出随机性大）
+    max_temperature: float = 0.5
+
+    @classmethod
+    def from_env(cls, prefix: str = "AI_CACHE") -> "ResponseCacheConfig":
+        """
+        从环境变量读取配置，例如 AI_CACHE_MAX_ENTRIES
+
+        Args:
+            prefix: 环境变量前缀
+
+        Returns:
+            缓存配置
+        """
+        defaults = cls()
+        return cls(
+            max_entries=env_int(f"{prefix}_MAX_ENTRIES", defaults.max_entries),
+            max_bytes=env_int(f"{prefix}_MAX_BYTES", defaults.max_bytes),
+            ttl_seconds=env_float(f"{prefix}_TTL_SECONDS", defaults.ttl_seconds),
+            max_temperature=env_float(f"{prefix}_MAX_TEMPERATURE", defaults.max_temperature),
+        )
+
+
+class ResponseCache:
+    """内存中的有界 LRU + TTL 缓存"""
+
+    def __init__(
+        self,
+        config: Optional[ResponseCacheConfig] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        初始化缓存
+
+        Args:
+            config: 缓存配置
+            clock: 时钟函数（便于测试）
+        """
+        self.config = config or ResponseCacheConfig()
+        self._clock = clock
+        # key -> (value, expires_at, size)
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._bytes = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._lru_evictions = 0
+        self._ttl_evictions = 0
+        self._skipped_temperature = 0
+        self._bypassed = 0
+
+    def is_cacheable(self, temperature: float, allow_high_temperature: bool = False) -> bool:
+        """
+        判断请求是否可缓存
+
+        Args:
+            temperature: 温度参数
+            allow_high_temperature: 是否显式允许缓存高温度请求
+
+        Returns:
+            是否可缓存
+        """
+        if allow_high_temperature or temperature <= self.config.max_temperature:
+            return True
+        self._skipped_temperature += 1
+        return False
+
+    def record_bypass(self):
+        """记录一次调用方主动绕过缓存"""
+        self._bypassed += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取缓存（命中时刷新 LRU 位置）
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存值，未命中或已过期返回 None
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+
+        value, expires_at, _ = entry
+        if expires_at <= self._clock():
+            self._remove(key)
+            self._ttl_evictions += 1
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return value
+
+    def lookup(self, keys: List[str]) -> Optional[Tuple[str, str]]:
+        """
+        按顺序查找多个候选键（如同一请求在不同提供商模型下的键），只计一次命中/未命中
+
+        Args:
+            keys: 候选缓存键
+
+        Returns:
+            (命中的键, 缓存值)，均未命中返回 None
+        """
+        now = self._clock()
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry[1] <= now:
+                self._remove(key)
+                self._ttl_evictions += 1
+                continue
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return key, entry[0]
+
+        self._misses += 1
+        return None
+
+    def set(self, key: str, value: str, ttl_seconds: Optional[float] = None):
+        """
+        写入缓存，超出条目数或字节上限时按 LRU 淘汰
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            ttl_seconds: 自定义过期时间（秒）
+        """
+        size = len(value.encode("utf-8"))
+        if size > self.config.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        ttl = ttl_seconds if ttl_seconds is not None else self.config.ttl_seconds
+        self._entries[key] = (value, self._clock() + ttl, size)
+        self._bytes += size
+
+        while (
+            len(self._entries) > self.config.max_entries
+            or self._bytes > self.config.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._lru_evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        缓存统计
+
+        Returns:
+            命中率、条目数、淘汰次数等
+        """
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            "lru_evictions": self._lru_evictions,
+            "ttl_evictions": self._ttl_evictions,
+            "skipped_high_temperature": self._skipped_temperature,
+            "bypassed": self._bypassed,
+        }
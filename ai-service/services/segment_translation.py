@@ -0,0 +1,494 @@
+"""
+字幕逐句翻译 - 分批并发翻译，保持索引对应，仅重试缺失的索引，支持流式输出
+"""
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from services.ai_orchestrator import AIOrchestrator
+from services.token_batching import TokenBudgetBatcher
+from services.translation_memory import (
+    MemoryMatch,
+    TranslationMemory,
+    format_references,
+    normalize_source,
+)
+from utils.env import env_int
+from utils.json_stream import JsonArrayStreamParser
+
+# 同一请求内并发翻译的批次数
+SEGMENT_CONCURRENCY = env_int("AI_TRANSLATE_CONCURRENCY", 4)
+# 单个批次的最大尝试次数（首次 + 仅针对缺失索引的重试）
+SEGMENT_MAX_ATTEMPTS = env_int("AI_TRANSLATE_MAX_ATTEMPTS", 3)
+# 未使用 token 预算分批时的固定批大小
+DEFAULT_BATCH_SIZE = 40
+
+
+def build_segments_prompt(
+    lines: Sequence[Tuple[int, str]],
+    target_language: str,
+    references: Sequence[MemoryMatch] = (),
+) -> str:
+    """
+    逐句翻译提示词
+
+    Args:
+        lines: (索引, 原文) 列表
+        target_language: 目标语言
+        references: 翻译记忆中相似句子的译文（只作参考）
+
+    Returns:
+        提示词
+    """
+    numbered_lines = "\n".join(f"{index}: {segment}" for index, segment in lines)
+    return f"""You are a professional translator. Translate each caption line into {target_language}.
+Return a JSON array where each element has the form {{"index": number, "translation": "..."}}.
+- The index must match the zero-based index shown before each caption.
+- Keep the same number of items as the input.
+- Do not merge or split lines.
+- Preserve punctuation and speaker labels.
+- Use double quotes for strings and output valid JSON only.
+
+{format_references(references)}Captions:
+{numbered_lines}
+
+JSON:"""
+
+
+def _segment_item(item: object) -> Optional[Tuple[int, str]]:
+    """校验单个 {"index", "translation"} 元素"""
+    if not isinstance(item, dict):
+        return None
+    idx = item.get("index")
+    translation = item.get("translation")
+    if isinstance(idx, int) and isinstance(translation, str) and translation.strip():
+        return idx, translation.strip()
+    return None
+
+
+def parse_segment_translations(result: str) -> Dict[int, str]:
+    """
+    解析模型返回的 [{"index", "translation"}] 数组
+
+    Args:
+        result: 模型输出
+
+    Returns:
+        索引 -> 译文
+
+    Raises:
+        ValueError: 输出不是合法的 JSON 数组
+    """
+    cleaned = result.strip()
+    if "```" in cleaned:
+        parts = cleaned.split("```", 2)
+        if len(parts) >= 2:
+            cleaned = parts[1]
+
+    cleaned = cleaned.strip()
+    if cleaned.lower().startswith("json"):
+        cleaned = cleaned[4:].strip(": \n\r\t")
+
+    try:
+        parsed = json.loads(cleaned)
+    except json.JSONDecodeError:
+        # 尝试从文本中提取 JSON 数组
+        start_idx = cleaned.find("[")
+        end_idx = cleaned.rfind("]")
+        if start_idx == -1 or end_idx == -1 or end_idx <= start_idx:
+            raise ValueError("no JSON array in translation response")
+        parsed = json.loads(cleaned[start_idx:end_idx + 1])
+
+    if not isinstance(parsed, list):
+        raise ValueError("translation response is not an array")
+
+    translations: Dict[int, str] = {}
+    for item in parsed:
+        pair = _segment_item(item)
+        if pair:
+            translations[pair[0]] = pair[1]
+    return translations
+
+
+class SegmentTranslator:
+    """
+    分批并发的逐句翻译器
+
+    批次之间通过信号量限制并发；每个批次解析失败或缺少索引时，
+    只把缺失的索引重新发给模型，不影响其他批次。规范化后相同的段落
+    只翻译一次，译文回填到所有出现位置；提供翻译记忆时，命中的段落
+    直接复用，只有未命中的段落参与分批；提供分批器时，按 token 预算
+    打包并据此设置 max_tokens。
+    """
+
+    def __init__(
+        self,
+        orch: AIOrchestrator,
+        target_language: str,
+        preferred: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        use_cache: bool = True,
+        endpoint: str = "translate-segments",
+        memory: Optional[TranslationMemory] = None,
+        batcher: Optional[TokenBudgetBatcher] = None,
+    ):
+        """
+        初始化翻译器
+
+        Args:
+            orch: AI 编排器
+            target_language: 目标语言
+            preferred: 偏好的提供商
+            concurrency: 并发批次数（默认 AI_TRANSLATE_CONCURRENCY）
+            max_attempts: 单批次最大尝试次数（默认 AI_TRANSLATE_MAX_ATTEMPTS）
+            use_cache: 是否使用响应缓存（为 False 时也不查询翻译记忆）
+            endpoint: 端点名称（用于路由与对冲）
+            memory: 翻译记忆
+            batcher: token 预算分批器（为空时按固定段落数分批）
+        """
+        self.orch = orch
+        self.target_language = target_language
+        self.preferred = preferred
+        self.max_attempts = max(1, max_attempts or SEGMENT_MAX_ATTEMPTS)
+        self.use_cache = use_cache
+        self.endpoint = endpoint
+        self.memory = memory
+        self.batcher = batcher
+        self._pair = f"latin->{target_language}"
+        self._semaphore = asyncio.Semaphore(max(1, concurrency or SEGMENT_CONCURRENCY))
+
+        # 代表索引 -> 与其相同的其他索引
+        self._duplicates: Dict[int, List[int]] = {}
+
+        self.memory_hits = 0
+        self._references: Dict[int, MemoryMatch] = {}
+        self.duplicates_collapsed = 0
+        self.provider_failures = 0
+        self.models_used: Dict[str, int] = {}
+
+    async def translate_batch(self, lines: Sequence[Tuple[int, str]]) -> Dict[int, str]:
+        """
+        翻译一个批次，缺失的索引单独重试
+
+        Args:
+            lines: (索引, 原文) 列表
+
+        Returns:
+            索引 -> 译文（重试后仍缺失的索引不在结果中）
+        """
+        async with self._semaphore:
+            return await self._complete(lines, first_attempt=0)
+
+    async def _complete(self, lines: Sequence[Tuple[int, str]], first_attempt: int) -> Dict[int, str]:
+        translations: Dict[int, str] = {}
+        remaining = list(lines)
+
+        for attempt in range(first_attempt, self.max_attempts):
+            if not remaining:
+                break
+            if attempt > 0:
+                logger.info(f"Retrying {len(remaining)} missing segment(s)")
+            result, model = await self.orch.generate_completion(
+                build_segments_prompt(remaining, self.target_language, self._references_for(remaining)),
+                max_tokens=self._max_tokens(remaining),
+                temperature=0.2,
+                preferred=self.preferred,
+                endpoint=self.endpoint,
+                # 重试时绕过缓存，避免再次拿到同一个不完整的响应
+                use_cache=self.use_cache and attempt == 0,
+            )
+            if result is None:
+                self.provider_failures += 1
+                logger.warning(
+                    f"Segment batch [{remaining[0][0]}..{remaining[-1][0]}] "
+                    f"attempt {attempt + 1} failed: no provider response"
+                )
+                continue
+
+            self.models_used[model] = self.models_used.get(model, 0) + 1
+            try:
+                parsed = parse_segment_translations(result)
+            except ValueError as e:
+                logger.warning(f"Failed to parse translation JSON (attempt {attempt + 1}): {e}")
+                logger.debug(f"Translation response: {result[:200]}")
+                continue
+
+            wanted = {index for index, _ in remaining}
+            for index, translation in parsed.items():
+                if index in wanted:
+                    translations[index] = translation
+            self._observe(remaining, translations)
+            remaining = [(index, text) for index, text in remaining if index not in translations]
+            if remaining and self.batcher is not None:
+                self.batcher.record_truncation()
+
+        if remaining:
+            logger.warning(f"{len(remaining)} segment(s) left untranslated after {self.max_attempts} attempts")
+        return translations
+
+    def _target_model(self, provider: Optional[str] = None) -> Optional[str]:
+        """分批预算所依据的模型名称"""
+        provider = provider or self._stream_provider()
+        return self.orch.provider_model(provider) if provider else None
+
+    def _max_tokens(self, lines: Sequence[Tuple[int, str]], provider: Optional[str] = None) -> int:
+        if self.batcher is None:
+            return min(4096, 200 + len(lines) * 40)
+        return self.batcher.max_tokens(lines, self._pair, self._target_model(provider))
+
+    def _observe(self, lines: Sequence[Tuple[int, str]], translations: Dict[int, str]):
+        if self.batcher is None:
+            return
+        done = [(text, translations[index]) for index, text in lines if index in translations]
+        if done:
+            self.batcher.observe(self._pair, [text for text, _ in done], [text for _, text in done])
+
+    def _stream_provider(self) -> Optional[str]:
+        """流式首次尝试使用的提供商（路由顺序中第一个健康的）"""
+        ranked = self.orch.rank_providers(preferred=self.preferred, endpoint=self.endpoint)
+        healthy = [name for name in ranked if self.orch.is_provider_healthy(name)]
+        return (healthy or ranked or [None])[0]
+
+    async def stream_batch(self, lines: Sequence[Tuple[int, str]]) -> AsyncIterator[Tuple[int, str]]:
+        """
+        流式翻译一个批次：边接收模型输出边解析，每完成一个元素立即产出
+
+        首次尝试走流式；流中断或缺少索引时，缺失部分按非流式方式重试。
+
+        Args:
+            lines: (索引, 原文) 列表
+
+        Yields:
+            (索引, 译文)
+        """
+        async with self._semaphore:
+            wanted = {index for index, _ in lines}
+            streamed: Dict[int, str] = {}
+            provider = self._stream_provider()
+            if provider is not None:
+                parser = JsonArrayStreamParser()
+                try:
+                    async for chunk in self.orch.stream_completion(
+                        provider,
+                        build_segments_prompt(lines, self.target_language, self._references_for(lines)),
+                        max_tokens=self._max_tokens(lines, provider),
+                        temperature=0.2,
+                    ):
+                        for item in parser.feed(chunk):
+                            pair = _segment_item(item)
+                            if pair and pair[0] in wanted and pair[0] not in streamed:
+                                streamed[pair[0]] = pair[1]
+                                yield pair
+                except Exception as e:
+                    logger.warning(f"Segment stream from {provider} failed: {e}")
+                if streamed:
+                    self.models_used[provider] = self.models_used.get(provider, 0) + 1
+                    self._observe(lines, streamed)
+
+            remaining = [(index, text) for index, text in lines if index not in streamed]
+            if remaining and streamed and self.batcher is not None:
+                self.batcher.record_truncation()
+            if remaining:
+                retried = await self._complete(remaining, first_attempt=1)
+                for index, text in remaining:
+                    if index in retried:
+                        yield index, retried[index]
+
+    def _plan(
+        self,
+        segments: Sequence[str],
+        batch_size: Optional[int],
+    ) -> Tuple[Dict[int, str], List[List[Tuple[int, str]]]]:
+        """
+        去重后先查翻译记忆，再把未命中的段落按 token 预算（或固定段落数）分批
+
+        只有精确命中直接复用；未命中段落的近似匹配作为参考译文放进提示词。
+        空白段落不发给模型，原样返回（模型对空行只会给出空译文，被当作缺失反复重试）。
+        """
+        unique = self._dedupe(segments)
+        blanks = {
+            index: segment for index, segment in enumerate(segments) if not normalize_source(segment)
+        }
+
+        hits: Dict[int, str] = {}
+        self._references = {}
+        if self.memory is not None and self.use_cache:
+            for index, segment in unique:
+                match = self.memory.lookup(segment, self.target_language)
+                if match is not None:
+                    hits[index] = match.translation
+                    continue
+                suggestion = self.memory.suggest(segment, self.target_language)
+                if suggestion is not None:
+                    self._references[index] = suggestion
+            hits = self._expand(hits)
+            self.memory_hits += len(hits)
+
+        misses = [(index, segment) for index, segment in unique if index not in hits]
+        if self.batcher is not None:
+            self._pair = self.batcher.language_pair(segments, self.target_language)
+            batches = self.batcher.pack(misses, self._pair, self._target_model(), max_items=batch_size)
+        else:
+            size = batch_size or DEFAULT_BATCH_SIZE
+            batches = [misses[start:start + size] for start in range(0, len(misses), size)]
+        if hits:
+            logger.info(f"Translation memory: {len(hits)}/{len(segments)} segment(s) reused")
+        hits.update(blanks)
+        return hits, batches
+
+    def _references_for(self, lines: Sequence[Tuple[int, str]]) -> List[MemoryMatch]:
+        return [self._references[index] for index, _ in lines if index in self._references]
+
+    def _dedupe(self, segments: Sequence[str]) -> List[Tuple[int, str]]:
+        """合并规范化后相同的段落（跳过空白段落），返回 (代表索引, 原文) 列表"""
+        representatives: Dict[str, int] = {}
+        unique: List[Tuple[int, str]] = []
+        self._duplicates = {}
+        blank = 0
+        for index, segment in enumerate(segments):
+            key = normalize_source(segment)
+            if not key:
+                blank += 1
+                continue
+            first = representatives.get(key)
+            if first is None:
+                representatives[key] = index
+                unique.append((index, segment))
+            else:
+                self._duplicates.setdefault(first, []).append(index)
+
+        self.duplicates_collapsed = len(segments) - blank - len(unique)
+        if self.duplicates_collapsed:
+            logger.info(
+                f"Deduplicated {self.duplicates_collapsed}/{len(segments)} repeated segment(s)"
+            )
+        return unique
+
+    def _fan_out(self, index: int, translation: str) -> List[Tuple[int, str]]:
+        """把代表索引的译文回填到所有相同段落"""
+        return [(index, translation)] + [
+            (duplicate, translation) for duplicate in self._duplicates.get(index, [])
+        ]
+
+    def _expand(self, translations: Dict[int, str]) -> Dict[int, str]:
+        expanded: Dict[int, str] = {}
+        for index, translation in translations.items():
+            expanded.update(self._fan_out(index, translation))
+        return expanded
+
+    def _remember(self, lines: Sequence[Tuple[int, str]], translations: Dict[int, str]):
+        if self.memory is None or not translations:
+            return
+        self.memory.store_many(
+            ((text, translations[index]) for index, text in lines if index in translations),
+            self.target_language,
+        )
+
+    async def _translate_and_remember(self, lines: Sequence[Tuple[int, str]]) -> Dict[int, str]:
+        translations = await self.translate_batch(lines)
+        self._remember(lines, translations)
+        return translations
+
+    async def iter_batches(
+        self,
+        segments: Sequence[str],
+        batch_size: Optional[int] = None,
+    ) -> AsyncIterator[Dict[int, str]]:
+        """
+        并发翻译所有批次，按完成顺序产出每个批次的结果
+
+        调用方停止迭代时取消尚未完成的批次。
+
+        Args:
+            segments: 原文列表
+            batch_size: 每批段落数上限（使用分批器时为可选上限）
+
+        Yields:
+            索引 -> 译文（翻译记忆命中的段落最先产出）
+        """
+        hits, batches = self._plan(segments, batch_size)
+        if hits:
+            yield hits
+        tasks = [asyncio.create_task(self._translate_and_remember(batch)) for batch in batches]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield self._expand(await next_done)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def iter_segments(
+        self,
+        segments: Sequence[str],
+        batch_size: Optional[int] = None,
+    ) -> AsyncIterator[Tuple[int, str]]:
+        """
+        并发流式翻译所有批次，按到达顺序逐句产出
+
+        调用方停止迭代（如客户端断开）时取消所有批次。
+
+        Args:
+            segments: 原文列表
+            batch_size: 每批段落数上限（使用分批器时为可选上限）
+
+        Yields:
+            (索引, 译文)（翻译记忆命中的段落最先产出）
+        """
+        hits, batches = self._plan(segments, batch_size)
+        for pair in hits.items():
+            yield pair
+        queue: "asyncio.Queue[Optional[Tuple[int, str]]]" = asyncio.Queue()
+
+        async def pump(batch: List[Tuple[int, str]]):
+            translated: Dict[int, str] = {}
+            try:
+                async for index, translation in self.stream_batch(batch):
+                    translated[index] = translation
+                    for pair in self._fan_out(index, translation):
+                        await queue.put(pair)
+            except Exception as e:
+                logger.error(f"Segment batch [{batch[0][0]}..{batch[-1][0]}] failed: {e}")
+            finally:
+                self._remember(batch, translated)
+                await queue.put(None)
+
+        tasks = [asyncio.create_task(pump(batch)) for batch in batches]
+        try:
+            pending = len(tasks)
+            while pending:
+                pair = await queue.get()
+                if pair is None:
+                    pending -= 1
+                    continue
+                yield pair
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def translate(self, segments: Sequence[str], batch_size: Optional[int] = None) -> Dict[int, str]:
+        """
+        翻译全部段落
+
+        Args:
+            segments: 原文列表
+            batch_size: 每批段落数上限（使用分批器时为可选上限）
+
+        Returns:
+            索引 -> 译文（未翻译成功的索引不在结果中）
+        """
+        translations: Dict[int, str] = {}
+        async for batch in self.iter_batches(segments, batch_size):
+            translations.update(batch)
+        return translations
+
+    @property
+    def model_used(self) -> Optional[str]:
+        """实际使用最多的模型"""
+        if not self.models_used:
+            return None
+        return max(self.models_used.items(), key=lambda item: item[1])[0]
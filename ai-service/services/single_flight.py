@@ -0,0 +1,218 @@
+"""
+请求合并（single-flight）- 并发的相同请求共享一次提供商调用
+"""
+import asyncio
+import weakref
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from loguru import logger
+
+T = TypeVar("T")
+
+
+class StreamAbandoned(Exception):
+    """共享的上游流在结束前被取消（所有订阅者都已离开）"""
+
+
+class StreamBroadcast:
+    """
+    把一个上游流分发给多个订阅者
+
+    已产生的片段会被保留，后加入的订阅者先回放再接收新片段；
+    上游流在第一个订阅者开始迭代时才创建，所有订阅者都离开后取消；
+    被取消的流以 StreamAbandoned 结束，不会被当作完整的流回放。
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], AsyncIterator[str]],
+        on_close: Optional[Callable[[], None]] = None,
+    ):
+        """
+        初始化（不立即读取上游流）
+
+        Args:
+            factory: 创建上游异步片段迭代器的函数
+            on_close: 流结束（完成、失败或被取消）时同步回调一次
+        """
+        self._factory = factory
+        self._on_close = on_close
+        self._chunks: List[str] = []
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._changed = asyncio.Condition()
+        self._subscribers = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        """上游是否已结束（被取消时立即为 True）"""
+        return self._done
+
+    def _start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._pump(self._factory()))
+
+    def _close(self, error: Optional[BaseException] = None):
+        """同步标记结束，使后续相同请求不再加入这个流"""
+        if self._done:
+            return
+        self._done = True
+        if self._error is None:
+            self._error = error
+        if self._on_close is not None:
+            self._on_close()
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self._chunks.append(chunk)
+                async with self._changed:
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            self._close(StreamAbandoned("upstream stream was cancelled"))
+            raise
+        except Exception as e:
+            self._close(e)
+        finally:
+            self._close()
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """
+        订阅流
+
+        Yields:
+            文本片段（从第一个片段开始）
+        """
+        index = 0
+        self._subscribers += 1
+        # 在首次迭代时才启动上游：从未开始迭代的订阅者（例如响应体发送前
+        # 客户端已断开）不会留下一个无人消费却持续计费的上游流
+        self._start()
+        try:
+            while True:
+                if index < len(self._chunks):
+                    chunk = self._chunks[index]
+                    index += 1
+                    yield chunk
+                    continue
+                if self._done:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                async with self._changed:
+                    await self._changed.wait_for(
+                        lambda: index < len(self._chunks) or self._done
+                    )
+        finally:
+            self._subscribers -= 1
+            if self._subscribers == 0 and not self._done:
+                # 没有订阅者了，停止上游以免继续计费；立即标记结束，
+                # 上游退出前到达的相同请求会新开一个流而不是拿到截断的结果
+                self._close(StreamAbandoned("all subscribers left"))
+                self._task.cancel()
+
+
+class SingleFlight:
+    """按键合并进行中的调用与流"""
+
+    def __init__(self):
+        """初始化"""
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        # 弱引用：尚未启动且订阅者已被丢弃的广播随之回收
+        self._streams: "weakref.WeakValueDictionary[str, StreamBroadcast]" = (
+            weakref.WeakValueDictionary()
+        )
+
+        self._calls_led = 0
+        self._calls_shared = 0
+        self._streams_led = 0
+        self._streams_shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行调用；若相同键的调用正在进行，则等待其结果
+
+        单个等待者被取消不会影响其他等待者；所有等待者都取消后才取消共享调用。
+
+        Args:
+            key: 规范化后的请求键
+            fn: 实际调用（仅由首个请求执行）
+
+        Returns:
+            调用结果
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            self._waiters[task] = 0
+            self._calls_led += 1
+
+            def _cleanup(finished: asyncio.Task, key: str = key):
+                if self._calls.get(key) is finished:
+                    del self._calls[key]
+                self._waiters.pop(finished, None)
+
+            task.add_done_callback(_cleanup)
+        else:
+            self._calls_shared += 1
+            logger.debug(f"Single-flight: joined in-flight call {key[:12]}")
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            remaining = self._waiters.get(task, 1) - 1
+            self._waiters[task] = remaining
+            if remaining <= 0 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            if task.done():
+                self._waiters.pop(task, None)
+
+    def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        订阅流；若相同键的流正在进行，则共享同一个上游流
+
+        Args:
+            key: 规范化后的请求键
+            factory: 创建上游流的函数（仅由首个订阅者调用）
+
+        Returns:
+            片段迭代器
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None or broadcast.done:
+            def _cleanup(key: str = key):
+                if self._streams.get(key) is broadcast:
+                    del self._streams[key]
+
+            broadcast = StreamBroadcast(factory, on_close=_cleanup)
+            self._streams[key] = broadcast
+            self._streams_led += 1
+        else:
+            self._streams_shared += 1
+            logger.debug(f"Single-flight: joined in-flight stream {key[:12]}")
+
+        return broadcast.subscribe()
+
+    def snapshot(self) -> Dict[str, int]:
+        """
+        合并统计
+
+        Returns:
+            发起/共享次数与进行中数量
+        """
+        return {
+            "calls_led": self._calls_led,
+            "calls_shared": self._calls_shared,
+            "calls_in_flight": len(self._calls),
+            "streams_led": self._streams_led,
+            "streams_shared": self._streams_shared,
+            "streams_in_flight": len(self._streams),
+        }
@@ -0,0 +1,331 @@
+"""
+SSE 流式中继 - 合并细碎片段为帧、发送心跳、客户端断开时取消上游，并统计首 token 延迟与吞吐
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+from loguru import logger
+
+from services.token_batching import estimate_tokens
+from utils.env import env_float, env_int
+
+# SSE 响应头（禁止代理缓冲，保证帧即时送达）
+SSE_HEADERS: Dict[str, str] = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+_END = object()
+
+
+@dataclass
+class StreamRelayConfig:
+    """流式中继配置"""
+
+    # 缓冲文本达到该字符数立即发出一帧
+    flush_chars: int = 64
+    # 首个缓冲片段最多等待这么久（毫秒）就发出，保证输出连贯
+    flush_interval_ms: float = 40.0
+    # 无输出时发送心跳注释的间隔（秒）
+    heartbeat_seconds: float = 15.0
+    # 上游最多预读的片段数；客户端读得慢时上游随之暂停（背压）
+    max_pending_chunks: int = 64
+
+    @classmethod
+    def from_env(cls, prefix: str = "AI_SSE") -> "StreamRelayConfig":
+        """
+        从环境变量读取配置，例如 AI_SSE_FLUSH_CHARS
+
+        Args:
+            prefix: 环境变量前缀
+
+        Returns:
+            流式中继配置
+        """
+        defaults = cls()
+        return cls(
+            flush_chars=env_int(f"{prefix}_FLUSH_CHARS", defaults.flush_chars),
+            flush_interval_ms=env_float(f"{prefix}_FLUSH_INTERVAL_MS", defaults.flush_interval_ms),
+            heartbeat_seconds=env_float(f"{prefix}_HEARTBEAT_SECONDS", defaults.heartbeat_seconds),
+            max_pending_chunks=env_int(f"{prefix}_MAX_PENDING_CHUNKS", defaults.max_pending_chunks),
+        )
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class StreamMetrics:
+    """按端点统计流式响应：首 token 延迟、token/秒、断开与错误次数"""
+
+    def __init__(self, max_samples: int = 200):
+        """
+        初始化统计
+
+        Args:
+            max_samples: 每个端点保留的最近样本数
+        """
+        self.max_samples = max_samples
+        self._endpoints: Dict[str, Dict[str, Any]] = {}
+
+    def _entry(self, endpoint: str) -> Dict[str, Any]:
+        entry = self._endpoints.get(endpoint)
+        if entry is None:
+            entry = self._endpoints[endpoint] = {
+                "streams": 0,
+                "completed": 0,
+                "disconnected": 0,
+                "errors": 0,
+                "chunks": 0,
+                "frames": 0,
+                "heartbeats": 0,
+                "ttft": deque(maxlen=self.max_samples),
+                "tps": deque(maxlen=self.max_samples),
+            }
+        return entry
+
+    def record(
+        self,
+        endpoint: str,
+        outcome: str,
+        ttft: Optional[float],
+        tokens: int,
+        generation_seconds: float,
+        chunks: int,
+        frames: int,
+        heartbeats: int,
+    ):
+        """
+        记录一次流式响应
+
+        Args:
+            endpoint: 端点名称
+            outcome: completed、disconnected 或 errors
+            ttft: 首 token 延迟（秒），没有输出时为 None
+            tokens: 估算的输出 token 数
+            generation_seconds: 首 token 到结束的耗时（秒）
+            chunks: 上游片段数
+            frames: 发出的帧数
+            heartbeats: 发出的心跳数
+        """
+        entry = self._entry(endpoint)
+        entry["streams"] += 1
+        entry[outcome] += 1
+        entry["chunks"] += chunks
+        entry["frames"] += frames
+        entry["heartbeats"] += heartbeats
+        if ttft is not None:
+            entry["ttft"].append(ttft)
+        if tokens and generation_seconds > 0:
+            entry["tps"].append(tokens / generation_seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """
+        各端点的流式统计
+
+        Returns:
+            端点 -> 统计
+        """
+        result: Dict[str, Dict[str, object]] = {}
+        for endpoint, entry in self._endpoints.items():
+            ttft: Deque[float] = entry["ttft"]
+            tps: Deque[float] = entry["tps"]
+            ordered = sorted(ttft)
+            p50, p95 = _percentile(ordered, 0.5), _percentile(ordered, 0.95)
+            result[endpoint] = {
+                "streams": entry["streams"],
+                "completed": entry["completed"],
+                "disconnected": entry["disconnected"],
+                "errors": entry["errors"],
+                "ttft_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "ttft_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "avg_tokens_per_second": round(sum(tps) / len(tps), 1) if tps else None,
+                "chunks_per_frame": round(entry["chunks"] / entry["frames"], 2) if entry["frames"] else None,
+                "heartbeats": entry["heartbeats"],
+            }
+        return result
+
+
+# 进程内共享的流式统计（/ai/metrics 中展示）
+stream_metrics = StreamMetrics()
+
+
+class _Failure:
+    """上游异常（由预读任务转交给发送方）"""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class SSERelay:
+    """
+    把上游文本片段中继为 SSE 帧
+
+    上游由独立任务预读到有界队列，队列满时暂停读取（背压）；发送方把
+    细碎片段合并为帧，在缓冲达到 flush_chars 或最早的片段等待超过
+    flush_interval_ms 时发出，空闲时发送心跳注释。客户端断开（生成器被
+    关闭或 is_disconnected 返回 True）时立即取消上游，不再继续计费。
+
+    帧格式为 data: {"content": "...", **extra}，结束时发送 data: [DONE]，
+    上游出错时发送 data: {"error": "..."}。
+    """
+
+    def __init__(
+        self,
+        source: AsyncIterator[str],
+        endpoint: str,
+        extra: Optional[Dict[str, Any]] = None,
+        config: Optional[StreamRelayConfig] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        metrics: Optional[StreamMetrics] = None,
+    ):
+        """
+        初始化中继
+
+        Args:
+            source: 上游文本片段迭代器
+            endpoint: 端点名称（用于统计与日志）
+            extra: 每个内容帧附带的固定字段（如 model）
+            config: 流式中继配置
+            is_disconnected: 检查客户端是否已断开（如 Request.is_disconnected）
+            metrics: 统计对象（默认使用进程内共享的 stream_metrics）
+        """
+        self.source = source
+        self.endpoint = endpoint
+        self.config = config or StreamRelayConfig()
+        self.is_disconnected = is_disconnected
+        self.metrics = metrics or stream_metrics
+        # 固定字段只编码一次，每帧只需编码文本
+        self._extra_json = ""
+        if extra:
+            self._extra_json = ", " + json.dumps(extra, ensure_ascii=False)[1:-1]
+
+    def _frame(self, text: str) -> str:
+        return f'data: {{"content": {json.dumps(text, ensure_ascii=False)}{self._extra_json}}}\n\n'
+
+    async def _pump(self, queue: "asyncio.Queue[Any]"):
+        try:
+            async for chunk in self.source:
+                if chunk:
+                    await queue.put(chunk)
+            await queue.put(_END)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(_Failure(e))
+        finally:
+            aclose = getattr(self.source, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception:
+                    pass
+
+    async def stream(self) -> AsyncIterator[str]:
+        """
+        生成 SSE 文本
+
+        Yields:
+            SSE 帧、心跳注释或结束标记
+        """
+        config = self.config
+        flush_interval = max(0.0, config.flush_interval_ms) / 1000
+        queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=max(1, config.max_pending_chunks))
+        producer = asyncio.create_task(self._pump(queue))
+        getter: Optional[asyncio.Future] = None
+
+        started = time.monotonic()
+        first_token_at: Optional[float] = None
+        last_sent = started
+        buffer: List[str] = []
+        buffered_chars = 0
+        buffered_since = 0.0
+        chunks = frames = heartbeats = tokens = 0
+        outcome = "disconnected"
+
+        try:
+            while True:
+                now = time.monotonic()
+                deadline = last_sent + config.heartbeat_seconds
+                if buffer:
+                    deadline = min(deadline, buffered_since + flush_interval)
+
+                if getter is None:
+                    getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter}, timeout=max(0.0, deadline - now))
+                item = getter.result() if done else None
+                if done:
+                    getter = None
+
+                if item is None:
+                    if buffer:
+                        text = "".join(buffer)
+                        buffer, buffered_chars = [], 0
+                        tokens += estimate_tokens(text)
+                        frames += 1
+                        last_sent = time.monotonic()
+                        yield self._frame(text)
+                    elif time.monotonic() >= last_sent + config.heartbeat_seconds:
+                        if self.is_disconnected is not None and await self.is_disconnected():
+                            logger.info(f"{self.endpoint}: client disconnected, cancelling upstream")
+                            return
+                        heartbeats += 1
+                        last_sent = time.monotonic()
+                        yield ": keep-alive\n\n"
+                    continue
+
+                if item is _END or isinstance(item, _Failure):
+                    if buffer:
+                        text = "".join(buffer)
+                        buffer, buffered_chars = [], 0
+                        tokens += estimate_tokens(text)
+                        frames += 1
+                        yield self._frame(text)
+                    if item is _END:
+                        outcome = "completed"
+                        yield "data: [DONE]\n\n"
+                    else:
+                        outcome = "errors"
+                        logger.error(f"{self.endpoint}: streaming error: {item.error}")
+                        yield f"data: {json.dumps({'error': str(item.error)}, ensure_ascii=False)}\n\n"
+                    return
+
+                chunks += 1
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                if not buffer:
+                    buffered_since = time.monotonic()
+                buffer.append(item)
+                buffered_chars += len(item)
+                if buffered_chars >= config.flush_chars:
+                    text = "".join(buffer)
+                    buffer, buffered_chars = [], 0
+                    tokens += estimate_tokens(text)
+                    frames += 1
+                    last_sent = time.monotonic()
+                    yield self._frame(text)
+        finally:
+            if getter is not None:
+                getter.cancel()
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+            finished = time.monotonic()
+            ttft = first_token_at - started if first_token_at is not None else None
+            generation = finished - first_token_at if first_token_at is not None else 0.0
+            self.metrics.record(
+                self.endpoint, outcome, ttft, tokens, generation, chunks, frames, heartbeats
+            )
+            logger.info(
+                f"{self.endpoint}: stream {outcome}, "
+                f"ttft={round(ttft * 1000) if ttft is not None else '-'}ms, "
+                f"{chunks} chunk(s) in {frames} frame(s), ~{tokens} token(s)"
+            )
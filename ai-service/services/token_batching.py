@@ -0,0 +1,272 @@
+"""
+按 token 预算分批 - 依据输入/输出 token 估算打包字幕段落，并学习各语言对的输出/输入比
+"""
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from utils.env import env_float, env_int, env_mapping
+
+_CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+
+# 每个段落在提示词中的额外开销（"123: " 前缀与换行）
+LINE_INPUT_OVERHEAD = 4
+# 每个段落在输出中的额外开销（{"index": 123, "translation": ""},）
+ITEM_OUTPUT_OVERHEAD = 14
+# 提示词固定部分（说明文字）
+PROMPT_OVERHEAD = 160
+
+# 常见模型的上下文与输出上限（token）
+DEFAULT_CONTEXT_LIMITS: Dict[str, int] = {
+    "grok-3": 131072,
+    "gpt-4o-mini": 128000,
+}
+DEFAULT_OUTPUT_LIMITS: Dict[str, int] = {
+    "grok-3": 16384,
+    "gpt-4o-mini": 16384,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算 token 数（CJK 字符约 1 token/字，其余约 4 字符/token）
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的 token 数
+    """
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def source_script(texts: Sequence[str]) -> str:
+    """
+    判断原文主要书写系统（用于区分语言对）
+
+    Args:
+        texts: 原文列表
+
+    Returns:
+        cjk 或 latin
+    """
+    sample = "".join(texts[:50])
+    if not sample:
+        return "latin"
+    return "cjk" if len(_CJK.findall(sample)) * 3 >= len(sample) else "latin"
+
+
+def _int_mapping(key: str) -> Dict[str, int]:
+    limits: Dict[str, int] = {}
+    for model, value in env_mapping(key).items():
+        try:
+            limits[model] = int(value)
+        except ValueError:
+            logger.warning(f"Invalid token limit for {model} in {key}: {value}")
+    return limits
+
+
+@dataclass
+class TokenBatchingConfig:
+    """分批配置"""
+
+    # 单批输出 token 上限（同时受模型输出上限约束）
+    max_output_tokens: int = 4096
+    # 单批输入 token 上限（同时受模型上下文约束）
+    max_input_tokens: int = 8000
+    # 单批最多段落数
+    max_items: int = 150
+    # 未学到比值时的输出/输入比先验
+    default_ratio: float = 1.2
+    # 输出 token 估算的安全系数（max_tokens 留出余量以免截断）
+    safety_factor: float = 1.25
+    # 比值的指数移动平均系数
+    ewma_alpha: float = 0.2
+    context_limits: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_CONTEXT_LIMITS))
+    output_limits: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_OUTPUT_LIMITS))
+
+    @classmethod
+    def from_env(cls, prefix: str = "AI_BATCH") -> "TokenBatchingConfig":
+        """
+        从环境变量读取配置，例如 AI_BATCH_MAX_OUTPUT_TOKENS
+
+        AI_BATCH_CONTEXT_LIMITS / AI_BATCH_OUTPUT_LIMITS: 例如 "grok-3=131072"
+
+        Args:
+            prefix: 环境变量前缀
+
+        Returns:
+            分批配置
+        """
+        defaults = cls()
+        return cls(
+            max_output_tokens=env_int(f"{prefix}_MAX_OUTPUT_TOKENS", defaults.max_output_tokens),
+            max_input_tokens=env_int(f"{prefix}_MAX_INPUT_TOKENS", defaults.max_input_tokens),
+            max_items=env_int(f"{prefix}_MAX_ITEMS", defaults.max_items),
+            default_ratio=env_float(f"{prefix}_DEFAULT_RATIO", defaults.default_ratio),
+            safety_factor=env_float(f"{prefix}_SAFETY_FACTOR", defaults.safety_factor),
+            ewma_alpha=env_float(f"{prefix}_EWMA_ALPHA", defaults.ewma_alpha),
+            context_limits={**defaults.context_limits, **_int_mapping(f"{prefix}_CONTEXT_LIMITS")},
+            output_limits={**defaults.output_limits, **_int_mapping(f"{prefix}_OUTPUT_LIMITS")},
+        )
+
+
+class TokenBudgetBatcher:
+    """
+    按 token 预算打包段落
+
+    每批在输入预算与（按学到的输出/输入比估算的）输出预算内尽量多装段落，
+    减少往返次数，同时给 max_tokens 留出余量以避免输出被截断。
+    """
+
+    def __init__(self, config: Optional[TokenBatchingConfig] = None):
+        """
+        初始化分批器
+
+        Args:
+            config: 分批配置
+        """
+        self.config = config or TokenBatchingConfig()
+        # 语言对 -> (输出/输入比, 样本数)
+        self._ratios: Dict[str, Tuple[float, int]] = {}
+        self._batches = 0
+        self._truncations = 0
+
+    @staticmethod
+    def language_pair(texts: Sequence[str], target_language: str) -> str:
+        """语言对键，例如 latin->zh-CN"""
+        return f"{source_script(texts)}->{target_language}"
+
+    def ratio(self, pair: str) -> float:
+        """语言对当前的输出/输入比"""
+        learned = self._ratios.get(pair)
+        return learned[0] if learned else self.config.default_ratio
+
+    def budgets(self, model: Optional[str]) -> Tuple[int, int]:
+        """
+        模型的单批 (输入, 输出) token 预算
+
+        Args:
+            model: 模型名称
+
+        Returns:
+            (输入预算, 输出预算)
+        """
+        output_budget = min(
+            self.config.max_output_tokens,
+            self.config.output_limits.get(model or "", self.config.max_output_tokens),
+        )
+        context = self.config.context_limits.get(model or "")
+        input_budget = self.config.max_input_tokens
+        if context:
+            input_budget = min(input_budget, context - output_budget - PROMPT_OVERHEAD)
+        return max(1, input_budget), max(1, output_budget)
+
+    def _estimate_output(self, text_tokens: int, items: int, ratio: float) -> int:
+        return math.ceil(ratio * text_tokens + ITEM_OUTPUT_OVERHEAD * items)
+
+    def pack(
+        self,
+        lines: Sequence[Tuple[int, str]],
+        pair: str,
+        model: Optional[str] = None,
+        max_items: Optional[int] = None,
+    ) -> List[List[Tuple[int, str]]]:
+        """
+        把段落打包成批次（保持原顺序）
+
+        Args:
+            lines: (索引, 原文) 列表
+            pair: 语言对
+            model: 目标模型名称
+            max_items: 单批段落数上限（默认使用配置）
+
+        Returns:
+            批次列表
+        """
+        input_budget, output_budget = self.budgets(model)
+        ratio = self.ratio(pair)
+        item_cap = max(1, min(max_items or self.config.max_items, self.config.max_items))
+
+        batches: List[List[Tuple[int, str]]] = []
+        current: List[Tuple[int, str]] = []
+        text_tokens = 0
+        for index, text in lines:
+            tokens = estimate_tokens(text)
+            candidate_text = text_tokens + tokens
+            items = len(current) + 1
+            fits = (
+                items <= item_cap
+                and PROMPT_OVERHEAD + candidate_text + LINE_INPUT_OVERHEAD * items <= input_budget
+                and self._estimate_output(candidate_text, items, ratio) * self.config.safety_factor
+                <= output_budget
+            )
+            if current and not fits:
+                batches.append(current)
+                current, text_tokens = [], 0
+            current.append((index, text))
+            text_tokens += tokens
+        if current:
+            batches.append(current)
+
+        self._batches += len(batches)
+        return batches
+
+    def max_tokens(self, lines: Sequence[Tuple[int, str]], pair: str, model: Optional[str] = None) -> int:
+        """
+        批次的 max_tokens（估算输出 × 安全系数，不超过输出预算）
+
+        Args:
+            lines: (索引, 原文) 列表
+            pair: 语言对
+            model: 模型名称
+
+        Returns:
+            max_tokens
+        """
+        _, output_budget = self.budgets(model)
+        text_tokens = sum(estimate_tokens(text) for _, text in lines)
+        estimate = self._estimate_output(text_tokens, len(lines), self.ratio(pair))
+        return min(output_budget, math.ceil(estimate * self.config.safety_factor) + 64)
+
+    def observe(self, pair: str, sources: Sequence[str], translations: Sequence[str]):
+        """
+        记录一批成功翻译的输入与输出，更新语言对的输出/输入比
+
+        Args:
+            pair: 语言对
+            sources: 原文
+            translations: 对应译文
+        """
+        input_tokens = sum(estimate_tokens(text) for text in sources)
+        output_tokens = sum(estimate_tokens(text) for text in translations)
+        if input_tokens <= 0 or output_tokens <= 0:
+            return
+        observed = output_tokens / input_tokens
+        current, samples = self._ratios.get(pair, (observed, 0))
+        alpha = self.config.ewma_alpha if samples else 1.0
+        self._ratios[pair] = (current + alpha * (observed - current), samples + 1)
+
+    def record_truncation(self):
+        """记录一次疑似截断（响应缺少索引或无法解析）"""
+        self._truncations += 1
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        分批统计
+
+        Returns:
+            各语言对的输出/输入比、批次数与截断次数
+        """
+        return {
+            "ratios": {
+                pair: {"ratio": round(ratio, 3), "samples": samples}
+                for pair, (ratio, samples) in self._ratios.items()
+            },
+            "batches": self._batches,
+            "truncations": self._truncations,
+        }
@@ -0,0 +1,509 @@
+"""
+长字幕摘要 - 按时间与语义切块，并发生成分块笔记（按块哈希缓存），再分层归并
+"""
+import asyncio
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from models.schemas import TranscriptSegment
+from services.ai_orchestrator import AIOrchestrator
+from services.token_batching import estimate_tokens
+from services.translation_memory import normalize_source
+from utils.env import env_float, env_int
+
+# 分块笔记提示词版本（修改提示词时递增，使旧的块缓存失效）
+CHUNK_PROMPT_VERSION = "1"
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？…])\s+")
+_BOUNDARY_CHARS = tuple(".!?。！？…\"'”’)")
+
+
+def format_timestamp(seconds: float) -> str:
+    """
+    秒数 -> mm:ss 或 h:mm:ss
+
+    Args:
+        seconds: 秒数
+
+    Returns:
+        时间戳文本
+    """
+    total = max(0, int(seconds))
+    hours, rest = divmod(total, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+
+@dataclass
+class TranscriptChunk:
+    """字幕块"""
+
+    index: int
+    text: str
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+    @property
+    def label(self) -> str:
+        """块标签，有时间轴时为时间范围，否则为序号"""
+        if self.start is not None and self.end is not None:
+            return f"{format_timestamp(self.start)}-{format_timestamp(self.end)}"
+        return f"Part {self.index + 1}"
+
+
+@dataclass
+class _Unit:
+    """切块的最小单位（一句话或一条字幕）"""
+
+    text: str
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+    @property
+    def is_boundary(self) -> bool:
+        return self.text.rstrip().endswith(_BOUNDARY_CHARS)
+
+
+@dataclass
+class SummarizationConfig:
+    """长字幕摘要配置"""
+
+    # 单块输入 token 上限
+    chunk_tokens: int = 2000
+    # 单块最长时间跨度（秒），仅在有时间轴时生效
+    chunk_seconds: float = 600.0
+    # 相邻字幕停顿超过该秒数视为话题边界（块已过半预算时在此切分）
+    pause_seconds: float = 3.0
+    # 同一请求内并发生成的块数
+    concurrency: int = 4
+    # 每次归并的笔记数；笔记总数超过该值时分层归并
+    fan_in: int = 6
+    # 分块笔记与中间归并的 max_tokens
+    chunk_max_tokens: int = 400
+    reduce_max_tokens: int = 800
+
+    @classmethod
+    def from_env(cls, prefix: str = "AI_TRANSCRIPT") -> "SummarizationConfig":
+        """
+        从环境变量读取配置，例如 AI_TRANSCRIPT_CHUNK_TOKENS
+
+        Args:
+            prefix: 环境变量前缀
+
+        Returns:
+            长字幕摘要配置
+        """
+        defaults = cls()
+        return cls(
+            chunk_tokens=env_int(f"{prefix}_CHUNK_TOKENS", defaults.chunk_tokens),
+            chunk_seconds=env_float(f"{prefix}_CHUNK_SECONDS", defaults.chunk_seconds),
+            pause_seconds=env_float(f"{prefix}_PAUSE_SECONDS", defaults.pause_seconds),
+            concurrency=env_int(f"{prefix}_CONCURRENCY", defaults.concurrency),
+            fan_in=env_int(f"{prefix}_FAN_IN", defaults.fan_in),
+            chunk_max_tokens=env_int(f"{prefix}_CHUNK_MAX_TOKENS", defaults.chunk_max_tokens),
+            reduce_max_tokens=env_int(f"{prefix}_REDUCE_MAX_TOKENS", defaults.reduce_max_tokens),
+        )
+
+
+def _split_oversized(unit: _Unit, max_tokens: int) -> List[_Unit]:
+    """把超过单块预算的单位（如无标点的自动字幕）按词切开，时间按长度比例分配"""
+    if estimate_tokens(unit.text) <= max_tokens:
+        return [unit]
+    words = unit.text.split()
+    if len(words) <= 1:
+        # 无空白分隔的文本（如中文）按字符切
+        step = max(1, max_tokens)
+        words = [unit.text[i:i + step] for i in range(0, len(unit.text), step)]
+        joiner = ""
+    else:
+        joiner = " "
+
+    pieces: List[str] = []
+    current: List[str] = []
+    tokens = 0
+    for word in words:
+        word_tokens = estimate_tokens(word) + 1
+        if current and tokens + word_tokens > max_tokens:
+            pieces.append(joiner.join(current))
+            current, tokens = [], 0
+        current.append(word)
+        tokens += word_tokens
+    if current:
+        pieces.append(joiner.join(current))
+
+    if unit.start is None or unit.end is None:
+        return [_Unit(piece) for piece in pieces]
+    total = sum(len(piece) for piece in pieces) or 1
+    span = unit.end - unit.start
+    units: List[_Unit] = []
+    cursor = unit.start
+    for piece in pieces:
+        end = cursor + span * len(piece) / total
+        units.append(_Unit(piece, cursor, end))
+        cursor = end
+    return units
+
+
+def _units_from_text(transcript: str) -> List[_Unit]:
+    units: List[_Unit] = []
+    for line in transcript.splitlines():
+        for sentence in _SENTENCE_END.split(line):
+            sentence = sentence.strip()
+            if sentence:
+                units.append(_Unit(sentence))
+    return units
+
+
+def _units_from_segments(segments: Sequence[TranscriptSegment]) -> List[_Unit]:
+    units: List[_Unit] = []
+    for segment in segments:
+        text = " ".join(segment.text.split())
+        if not text:
+            continue
+        end = None
+        if segment.start is not None:
+            end = segment.start + (segment.duration or 0.0)
+        units.append(_Unit(text, segment.start, end))
+    return units
+
+
+def split_transcript_sentences(
+    transcript: str = "",
+    segments: Optional[Sequence[TranscriptSegment]] = None,
+    max_tokens: int = 60,
+) -> List[str]:
+    """
+    把字幕切成句子（用于逐句对照翻译）
+
+    带时间轴的字幕行会合并到句末为止；没有标点的长句按 max_tokens 切开。
+
+    Args:
+        transcript: 字幕全文（没有 segments 时使用）
+        segments: 带时间轴的字幕片段
+        max_tokens: 单句 token 上限
+
+    Returns:
+        句子列表
+    """
+    if not segments:
+        units = _units_from_text(transcript)
+    else:
+        units = []
+        pending: List[str] = []
+        tokens = 0
+        for unit in _units_from_segments(segments):
+            pending.append(unit.text)
+            tokens += estimate_tokens(unit.text)
+            if unit.is_boundary or tokens >= max_tokens:
+                units.append(_Unit(" ".join(pending)))
+                pending, tokens = [], 0
+        if pending:
+            units.append(_Unit(" ".join(pending)))
+    return [piece.text for unit in units for piece in _split_oversized(unit, max_tokens)]
+
+
+def chunk_transcript(
+    transcript: str = "",
+    segments: Optional[Sequence[TranscriptSegment]] = None,
+    config: Optional[SummarizationConfig] = None,
+) -> List[TranscriptChunk]:
+    """
+    把字幕切成块（保持原顺序）
+
+    块在 token 预算或时间跨度用尽时结束，并尽量回退到最近的句末；
+    有时间轴时，块过半预算后遇到较长停顿即提前切分。
+
+    Args:
+        transcript: 字幕全文（没有 segments 时使用）
+        segments: 带时间轴的字幕片段
+        config: 长字幕摘要配置
+
+    Returns:
+        字幕块列表
+    """
+    config = config or SummarizationConfig()
+    budget = max(1, config.chunk_tokens)
+    raw_units = _units_from_segments(segments) if segments else _units_from_text(transcript)
+    units = [piece for unit in raw_units for piece in _split_oversized(unit, budget)]
+
+    groups: List[List[_Unit]] = []
+    current: List[_Unit] = []
+    tokens = 0
+    for unit in units:
+        unit_tokens = estimate_tokens(unit.text)
+        if current:
+            over_budget = tokens + unit_tokens > budget
+            start = current[0].start
+            over_span = (
+                start is not None and unit.end is not None
+                and unit.end - start > config.chunk_seconds
+            )
+            previous_end = current[-1].end
+            at_pause = (
+                tokens >= budget / 2 and unit.start is not None and previous_end is not None
+                and unit.start - previous_end >= config.pause_seconds
+            )
+            if over_budget or over_span:
+                cut = _semantic_cut(current)
+                groups.append(current[:cut])
+                current = current[cut:]
+                tokens = sum(estimate_tokens(item.text) for item in current)
+                if current and tokens + unit_tokens > budget:
+                    groups.append(current)
+                    current, tokens = [], 0
+            elif at_pause:
+                groups.append(current)
+                current, tokens = [], 0
+        current.append(unit)
+        tokens += unit_tokens
+    if current:
+        groups.append(current)
+
+    return [
+        TranscriptChunk(
+            index=index,
+            text=" ".join(unit.text for unit in group),
+            start=group[0].start,
+            end=group[-1].end,
+        )
+        for index, group in enumerate(groups)
+    ]
+
+
+def _semantic_cut(units: List[_Unit]) -> int:
+    """在块的后半部分找最后一个句末，返回切分位置（找不到则整块切出）"""
+    for position in range(len(units) - 1, len(units) // 2 - 1, -1):
+        if units[position].is_boundary:
+            return position + 1
+    return len(units)
+
+
+def build_chunk_prompt(chunk: TranscriptChunk) -> str:
+    """
+    分块笔记提示词（与报告模板无关，因此换模板时可复用缓存）
+
+    Args:
+        chunk: 字幕块
+
+    Returns:
+        提示词
+    """
+    return f"""You are taking notes on one section ({chunk.label}) of a longer video transcript.
+Write concise notes for this section only:
+- Main topics discussed and the key claims or arguments
+- Important facts, numbers, names and examples (keep them exact)
+- Conclusions or recommendations made by the speaker
+Use 3-8 bullet points and write in the same language as the transcript. Do not add an introduction.
+
+Transcript section ({chunk.label}):
+{chunk.text}
+
+Notes:"""
+
+
+def build_reduce_prompt(notes: Sequence[str]) -> str:
+    """
+    中间归并提示词：把相邻几段笔记合并为一份
+
+    Args:
+        notes: 按时间顺序排列的笔记
+
+    Returns:
+        提示词
+    """
+    joined = "\n\n".join(notes)
+    return f"""Below are notes on consecutive sections of a video transcript, in chronological order.
+Merge them into one set of concise notes that covers all sections:
+- Keep the section time ranges as headings where useful
+- Remove repetition but keep every distinct topic, fact, number and name
+- Write in the same language as the notes; do not add an introduction
+
+Notes:
+{joined}
+
+Merged notes:"""
+
+
+def chunk_cache_key(prompt: str) -> str:
+    """分块笔记的缓存键（块内容哈希，与提供商和报告模板无关）"""
+    digest = hashlib.sha256(f"{CHUNK_PROMPT_VERSION}\n{normalize_source(prompt)}".encode("utf-8"))
+    return f"transcript-chunk:{digest.hexdigest()}"
+
+
+@dataclass
+class TranscriptDigest:
+    """长字幕归并结果"""
+
+    # notes 为归并后的笔记，transcript 为（足够短的）字幕原文
+    kind: str
+    text: str
+    chunks: int
+    cached_chunks: int
+    failed_chunks: int
+    levels: int
+    model: Optional[str] = None
+
+    @property
+    def heading(self) -> str:
+        """报告提示词中引用该内容时使用的标题"""
+        if self.kind == "notes":
+            return "Section notes (chronological, condensed from the full transcript)"
+        return "Transcript"
+
+
+class TranscriptSummarizer:
+    """
+    长字幕 map-reduce 摘要器
+
+    map 阶段并发为每个块生成笔记，结果按块内容哈希写入编排器的缓存
+    （内存 + SQLite），换报告模板或重新生成时直接复用；reduce 阶段每次
+    合并 fan_in 段相邻笔记，逐层归并直到能放进最终的报告提示词。
+    只有一个块的短字幕不经过 map-reduce，直接返回原文。
+    """
+
+    def __init__(
+        self,
+        orch: AIOrchestrator,
+        config: Optional[SummarizationConfig] = None,
+        preferred: Optional[str] = None,
+        use_cache: bool = True,
+        endpoint: str = "youtube-report",
+    ):
+        """
+        初始化摘要器
+
+        Args:
+            orch: AI 编排器
+            config: 长字幕摘要配置
+            preferred: 偏好的提供商
+            use_cache: 是否使用块缓存与响应缓存
+            endpoint: 端点名称（用于路由与统计）
+        """
+        self.orch = orch
+        self.config = config or SummarizationConfig()
+        self.preferred = preferred
+        self.use_cache = use_cache
+        self.endpoint = endpoint
+        self._semaphore = asyncio.Semaphore(max(1, self.config.concurrency))
+        self.models_used: Dict[str, int] = {}
+
+    async def digest(
+        self,
+        transcript: str = "",
+        segments: Optional[Sequence[TranscriptSegment]] = None,
+    ) -> Optional[TranscriptDigest]:
+        """
+        把字幕归并为可放进单个报告提示词的内容
+
+        Args:
+            transcript: 字幕全文
+            segments: 带时间轴的字幕片段（优先使用）
+
+        Returns:
+            归并结果，所有块都失败时返回 None
+        """
+        chunks = chunk_transcript(transcript, segments, self.config)
+        if not chunks:
+            return None
+        if len(chunks) == 1:
+            return TranscriptDigest("transcript", chunks[0].text, 1, 0, 0, 0)
+
+        outcomes = await asyncio.gather(*(self._summarize_chunk(chunk) for chunk in chunks))
+        notes = [note for note, _ in outcomes if note is not None]
+        cached = sum(1 for _, hit in outcomes if hit)
+        failed = len(chunks) - len(notes)
+        if not notes:
+            logger.error(f"Transcript map phase failed for all {len(chunks)} chunk(s)")
+            return None
+        logger.info(
+            f"Transcript map phase: {len(chunks)} chunk(s), {cached} cached, {failed} failed"
+        )
+
+        levels = 0
+        while len(notes) > max(2, self.config.fan_in):
+            notes = await self._reduce_level(notes)
+            levels += 1
+        logger.info(f"Transcript reduce phase: {levels} level(s), {len(notes)} note(s) left")
+
+        return TranscriptDigest(
+            kind="notes",
+            text="\n\n".join(notes),
+            chunks=len(chunks),
+            cached_chunks=cached,
+            failed_chunks=failed,
+            levels=levels,
+            model=self.model_used,
+        )
+
+    async def _summarize_chunk(self, chunk: TranscriptChunk) -> Tuple[Optional[str], bool]:
+        """生成单个块的笔记，返回 (笔记, 是否命中块缓存)"""
+        prompt = build_chunk_prompt(chunk)
+        key = chunk_cache_key(prompt)
+        if self.use_cache:
+            cached = self.orch.cache.get(key)
+            if cached is None:
+                hit = await self.orch.disk_cache.lookup([key])
+                if hit is not None:
+                    cached = hit[1]
+                    self.orch.cache.set(key, cached)
+            if cached is not None:
+                return cached, True
+
+        async with self._semaphore:
+            result, model = await self.orch.generate_completion(
+                prompt,
+                max_tokens=self.config.chunk_max_tokens,
+                temperature=0.3,
+                preferred=self.preferred,
+                endpoint=self.endpoint,
+                use_cache=self.use_cache,
+            )
+        if result is None or not result.strip():
+            logger.warning(f"Transcript chunk {chunk.label} failed: no provider response")
+            return None, False
+
+        self.models_used[model] = self.models_used.get(model, 0) + 1
+        note = f"[{chunk.label}]\n{result.strip()}"
+        self.orch.cache.set(key, note)
+        self.orch.disk_cache.set_nowait(key, note)
+        return note, False
+
+    async def _reduce_level(self, notes: List[str]) -> List[str]:
+        """把笔记按 fan_in 分组并发归并，失败的组保留原笔记"""
+        fan_in = max(2, self.config.fan_in)
+        groups = [notes[start:start + fan_in] for start in range(0, len(notes), fan_in)]
+
+        async def merge(group: List[str]) -> List[str]:
+            if len(group) == 1:
+                return group
+            async with self._semaphore:
+                result, model = await self.orch.generate_completion(
+                    build_reduce_prompt(group),
+                    max_tokens=self.config.reduce_max_tokens,
+                    temperature=0.3,
+                    preferred=self.preferred,
+                    endpoint=self.endpoint,
+                    use_cache=self.use_cache,
+                )
+            if result is None or not result.strip():
+                # 归并失败时截短原笔记以保证层数收敛
+                logger.warning(f"Transcript reduce of {len(group)} note(s) failed, keeping notes")
+                return ["\n\n".join(note[:800] for note in group)]
+            self.models_used[model] = self.models_used.get(model, 0) + 1
+            return [result.strip()]
+
+        merged = await asyncio.gather(*(merge(group) for group in groups))
+        return [note for group in merged for note in group]
+
+    @property
+    def model_used(self) -> Optional[str]:
+        """实际使用最多的模型"""
+        if not self.models_used:
+            return None
+        return max(self.models_used.items(), key=lambda item: item[1])[0]
@@ -0,0 +1,486 @@
+"""
+翻译记忆 - 按 (规范化原文, 目标语言) 复用译文，支持 n-gram 近似匹配与 SQLite 持久化
+"""
+import asyncio
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from utils.env import env_bool, env_float, env_int
+
+DEFAULT_TM_PATH = Path(__file__).resolve().parent.parent / "data" / "translation_memory.sqlite3"
+
+_HORIZONTAL_SPACE = re.compile(r"[^\S\n]+")
+_DIGITS = re.compile(r"\d+")
+
+
+def normalize_source(text: str) -> str:
+    """
+    规范化原文（NFKC、合并行内空白、去掉空行），作为精确匹配的键
+
+    保留换行，使整段翻译的结构与原文一致。
+
+    Args:
+        text: 原文
+
+    Returns:
+        规范化后的文本
+    """
+    lines = unicodedata.normalize("NFKC", text).replace("\r\n", "\n").split("\n")
+    return "\n".join(
+        collapsed for collapsed in (_HORIZONTAL_SPACE.sub(" ", line).strip() for line in lines) if collapsed
+    )
+
+
+def _ngrams(text: str, n: int) -> FrozenSet[str]:
+    folded = f" {text.casefold()} "
+    if len(folded) <= n:
+        return frozenset({folded})
+    return frozenset(folded[i:i + n] for i in range(len(folded) - n + 1))
+
+
+@dataclass
+class TranslationMemoryConfig:
+    """翻译记忆配置"""
+
+    enabled: bool = True
+    path: str = str(DEFAULT_TM_PATH)
+    # 内存与磁盘中保留的最大条目数（按最近使用淘汰）
+    max_entries: int = 50000
+    # 近似匹配阈值（字符 n-gram Jaccard 相似度），>= 1 表示关闭近似匹配
+    fuzzy_threshold: float = 0.9
+    # 参与近似匹配的最长原文（字符）
+    fuzzy_max_chars: int = 500
+    ngram_size: int = 3
+    # 单次近似查询最多校验的候选数，超出时放弃近似匹配（保证查询耗时有界）
+    fuzzy_max_candidates: int = 2000
+    # 访问时间回写与磁盘淘汰的间隔（秒）
+    flush_interval_seconds: float = 60.0
+
+    @classmethod
+    def from_env(cls, prefix: str = "AI_TM") -> "TranslationMemoryConfig":
+        """
+        从环境变量读取配置，例如 AI_TM_FUZZY_THRESHOLD
+
+        Args:
+            prefix: 环境变量前缀
+
+        Returns:
+            翻译记忆配置
+        """
+        defaults = cls()
+        return cls(
+            enabled=env_bool(f"{prefix}_ENABLED", defaults.enabled),
+            path=os.getenv(f"{prefix}_PATH") or defaults.path,
+            max_entries=env_int(f"{prefix}_MAX_ENTRIES", defaults.max_entries),
+            fuzzy_threshold=env_float(f"{prefix}_FUZZY_THRESHOLD", defaults.fuzzy_threshold),
+            fuzzy_max_chars=env_int(f"{prefix}_FUZZY_MAX_CHARS", defaults.fuzzy_max_chars),
+            ngram_size=env_int(f"{prefix}_NGRAM_SIZE", defaults.ngram_size),
+            fuzzy_max_candidates=env_int(
+                f"{prefix}_FUZZY_MAX_CANDIDATES", defaults.fuzzy_max_candidates
+            ),
+            flush_interval_seconds=env_float(
+                f"{prefix}_FLUSH_INTERVAL", defaults.flush_interval_seconds
+            ),
+        )
+
+
+@dataclass
+class MemoryMatch:
+    """翻译记忆命中结果"""
+
+    translation: str
+    # exact 或 fuzzy
+    kind: str
+    score: float
+    source: str
+
+
+@dataclass
+class _Entry:
+    translation: str
+    grams: FrozenSet[str]
+    digits: Tuple[str, ...]
+
+
+class TranslationMemory:
+    """
+    翻译记忆
+
+    精确匹配与 n-gram 倒排索引都在内存中，查询不访问磁盘；SQLite 只用于
+    启动时加载与后台写入。近似匹配要求原文中的数字完全一致，避免把
+    "第 1 章" 的译文复用到 "第 2 章"。
+
+    只有精确命中可以直接作为译文返回；近似匹配只改动一个词也可能意思相反
+    （如 does / does not），因此只通过 suggest 作为参考译文提供。
+    """
+
+    def __init__(self, config: Optional[TranslationMemoryConfig] = None):
+        """
+        初始化翻译记忆
+
+        Args:
+            config: 翻译记忆配置
+        """
+        self.config = config or TranslationMemoryConfig()
+        # (目标语言, 规范化原文) -> 条目，按最近使用排序
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        # (目标语言, n-gram) -> 原文集合
+        self._index: Dict[Tuple[str, str], Set[str]] = {}
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._touched: Set[Tuple[str, str]] = set()
+        self._pending_writes: Set[asyncio.Task] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self._hits = 0
+        self._suggestions = 0
+        self._misses = 0
+        self._stored = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        """是否启用"""
+        return self.config.enabled
+
+    async def open(self):
+        """打开数据库并把最近使用的条目加载到内存"""
+        if not self.config.enabled or self._conn is not None:
+            return
+        try:
+            rows = await asyncio.to_thread(self._open_sync)
+        except Exception as e:
+            logger.error(f"Failed to open translation memory at {self.config.path}: {e}")
+            self._conn = None
+            return
+
+        # 按访问时间从旧到新插入，保持 LRU 顺序
+        for target_lang, source, translation in rows:
+            self._insert(target_lang, source, translation)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Translation memory opened: {self.config.path} ({len(self._entries)} entries)")
+
+    def _open_sync(self) -> List[Tuple[str, str, str]]:
+        path = Path(self.config.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS translation_memory (
+                target_lang TEXT NOT NULL,
+                source TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (target_lang, source)
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tm_accessed ON translation_memory(accessed_at)"
+        )
+        rows = conn.execute(
+            """
+            SELECT target_lang, source, translation FROM (
+                SELECT target_lang, source, translation, accessed_at FROM translation_memory
+                ORDER BY accessed_at DESC LIMIT ?
+            ) ORDER BY accessed_at ASC
+            """,
+            (self.config.max_entries,),
+        ).fetchall()
+        self._conn = conn
+        return rows
+
+    async def close(self):
+        """回写访问时间、等待未完成的写入并关闭数据库"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+        if self._conn is not None:
+            await self.flush()
+            conn = self._conn
+            self._conn = None
+            await asyncio.to_thread(self._close_sync, conn)
+            logger.info("Translation memory closed")
+
+    def _close_sync(self, conn: sqlite3.Connection):
+        with self._db_lock:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.close()
+
+    def lookup(self, text: str, target_lang: str) -> Optional[MemoryMatch]:
+        """
+        查找译文（只返回精确命中；近似匹配见 suggest）
+
+        Args:
+            text: 原文
+            target_lang: 目标语言
+
+        Returns:
+            命中结果，未命中返回 None
+        """
+        if not self.config.enabled:
+            return None
+        source = normalize_source(text)
+        if not source:
+            return None
+
+        key = (target_lang, source)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._touched.add(key)
+        self._hits += 1
+        return MemoryMatch(entry.translation, "exact", 1.0, source)
+
+    def suggest(self, text: str, target_lang: str) -> Optional[MemoryMatch]:
+        """
+        查找相似原文的译文，作为参考提供给模型或调用方（不计入命中）
+
+        Args:
+            text: 原文
+            target_lang: 目标语言
+
+        Returns:
+            近似匹配结果，没有足够相似的条目时返回 None
+        """
+        if not self.config.enabled:
+            return None
+        source = normalize_source(text)
+        if not source or (target_lang, source) in self._entries:
+            return None
+        match = self._fuzzy_lookup(source, target_lang)
+        if match is not None:
+            self._suggestions += 1
+        return match
+
+    def _fuzzy_lookup(self, source: str, target_lang: str) -> Optional[MemoryMatch]:
+        threshold = self.config.fuzzy_threshold
+        if threshold >= 1.0 or len(source) > self.config.fuzzy_max_chars:
+            return None
+
+        grams = _ngrams(source, self.config.ngram_size)
+        digits = tuple(_DIGITS.findall(source))
+        # 前缀过滤：Jaccard >= t 意味着至少共享 ceil(t*|A|) 个 n-gram，
+        # 因此只需在最稀有的 |A| - ceil(t*|A|) + 1 个 n-gram 中寻找候选
+        prefix_size = len(grams) - math.ceil(threshold * len(grams)) + 1
+        postings = sorted(
+            (self._index.get((target_lang, gram), set()) for gram in grams),
+            key=len,
+        )
+        prefix = postings[:prefix_size]
+        if sum(len(posting) for posting in prefix) > self.config.fuzzy_max_candidates:
+            return None
+        candidates: Set[str] = set()
+        for posting in prefix:
+            candidates.update(posting)
+
+        # 长度过滤：Jaccard >= t 要求 t*|A| <= |B| <= |A|/t
+        min_size, max_size = threshold * len(grams), len(grams) / threshold
+        best: Optional[Tuple[float, str]] = None
+        for candidate in candidates:
+            entry = self._entries.get((target_lang, candidate))
+            if entry is None or entry.digits != digits:
+                continue
+            if not min_size <= len(entry.grams) <= max_size:
+                continue
+            shared = len(grams & entry.grams)
+            score = shared / (len(grams) + len(entry.grams) - shared)
+            if score >= threshold and (best is None or score > best[0]):
+                best = (score, candidate)
+
+        if best is None:
+            return None
+        score, candidate = best
+        key = (target_lang, candidate)
+        self._entries.move_to_end(key)
+        self._touched.add(key)
+        return MemoryMatch(self._entries[key].translation, "fuzzy", round(score, 3), candidate)
+
+    def store(self, text: str, target_lang: str, translation: str):
+        """
+        写入一条译文（内存立即生效，磁盘后台写入）
+
+        Args:
+            text: 原文
+            target_lang: 目标语言
+            translation: 译文
+        """
+        self.store_many([(text, translation)], target_lang)
+
+    def store_many(self, pairs: Iterable[Tuple[str, str]], target_lang: str):
+        """
+        批量写入译文
+
+        Args:
+            pairs: (原文, 译文) 列表
+            target_lang: 目标语言
+        """
+        if not self.config.enabled:
+            return
+        rows: List[Tuple[str, str, str]] = []
+        for text, translation in pairs:
+            source = normalize_source(text)
+            translation = translation.strip()
+            if not source or not translation:
+                continue
+            self._insert(target_lang, source, translation)
+            rows.append((target_lang, source, translation))
+
+        self._stored += len(rows)
+        if rows and self._conn is not None:
+            task = asyncio.create_task(self._write(rows))
+            self._pending_writes.add(task)
+            task.add_done_callback(self._pending_writes.discard)
+
+    def _insert(self, target_lang: str, source: str, translation: str):
+        key = (target_lang, source)
+        if key in self._entries:
+            self._unindex(key)
+            del self._entries[key]
+
+        # 超长原文只参与精确匹配，不建立 n-gram 索引
+        indexed = len(source) <= self.config.fuzzy_max_chars
+        entry = _Entry(
+            translation=translation,
+            grams=_ngrams(source, self.config.ngram_size) if indexed else frozenset(),
+            digits=tuple(_DIGITS.findall(source)),
+        )
+        self._entries[key] = entry
+        for gram in entry.grams:
+            self._index.setdefault((target_lang, gram), set()).add(source)
+
+        while len(self._entries) > self.config.max_entries:
+            oldest = next(iter(self._entries))
+            self._unindex(oldest)
+            del self._entries[oldest]
+            self._touched.discard(oldest)
+            self._evictions += 1
+
+    def _unindex(self, key: Tuple[str, str]):
+        target_lang, source = key
+        for gram in self._entries[key].grams:
+            posting = self._index.get((target_lang, gram))
+            if posting is not None:
+                posting.discard(source)
+                if not posting:
+                    del self._index[(target_lang, gram)]
+
+    async def _write(self, rows: List[Tuple[str, str, str]]):
+        try:
+            await asyncio.to_thread(self._write_sync, rows)
+        except Exception as e:
+            logger.warning(f"Translation memory write failed: {e}")
+
+    def _write_sync(self, rows: List[Tuple[str, str, str]]):
+        now = time.time()
+        with self._db_lock:
+            conn = self._conn
+            if conn is None:
+                return
+            conn.executemany(
+                """
+                INSERT INTO translation_memory (target_lang, source, translation, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(target_lang, source)
+                DO UPDATE SET translation = excluded.translation, accessed_at = excluded.accessed_at
+                """,
+                [(lang, source, translation, now, now) for lang, source, translation in rows],
+            )
+
+    async def flush(self):
+        """回写命中条目的访问时间，并按最近使用淘汰超出上限的磁盘条目"""
+        if self._conn is None:
+            return
+        touched, self._touched = self._touched, set()
+        try:
+            await asyncio.to_thread(self._flush_sync, touched)
+        except Exception as e:
+            logger.warning(f"Translation memory flush failed: {e}")
+
+    def _flush_sync(self, touched: Set[Tuple[str, str]]):
+        now = time.time()
+        with self._db_lock:
+            conn = self._conn
+            if conn is None:
+                return
+            if touched:
+                conn.executemany(
+                    "UPDATE translation_memory SET accessed_at = ? WHERE target_lang = ? AND source = ?",
+                    [(now, lang, source) for lang, source in touched],
+                )
+            conn.execute(
+                """
+                DELETE FROM translation_memory WHERE rowid IN (
+                    SELECT rowid FROM translation_memory
+                    ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.config.max_entries,),
+            )
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.config.flush_interval_seconds)
+            await self.flush()
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        翻译记忆统计
+
+        Returns:
+            条目数、命中率等
+        """
+        lookups = self._hits + self._misses
+        return {
+            "enabled": self.config.enabled,
+            "persistent": self._conn is not None,
+            "entries": len(self._entries),
+            "max_entries": self.config.max_entries,
+            "indexed_ngrams": len(self._index),
+            "hits": self._hits,
+            "suggestions": self._suggestions,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            "stored": self._stored,
+            "evictions": self._evictions,
+        }
+
+
+def format_references(matches: Iterable[MemoryMatch]) -> str:
+    """
+    把近似匹配格式化为提示词中的参考译文段落
+
+    Args:
+        matches: 近似匹配结果
+
+    Returns:
+        提示词段落，没有参考时为空字符串
+    """
+    lines = [f"- {match.source} => {match.translation}" for match in matches]
+    if not lines:
+        return ""
+    return (
+        "Reference translations of similar earlier text (use them only for terminology and style; "
+        "the text below may differ in meaning, so translate it from its own wording):\n"
+        + "\n".join(lines)
+        + "\n\n"
+    )
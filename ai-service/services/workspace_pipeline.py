@@ -6,11 +6,12 @@ while preserving the future integration surface.
 from __future__ import annotations
 
 from datetime import datetime
-from typing import TYPE_CHECKING, Any, Dict, List
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 from pydantic import BaseModel
 
 from services.template_loader import template_repository
+from utils.deadline import deadline_scope
 
 if TYPE_CHECKING:
     from services.workspace_task_manager import WorkspaceTaskPayload
@@ -21,13 +22,43 @@ class WorkspacePipelineResult(BaseModel):
     metadata: Dict[str, Any]
 
 
+class PipelineReporter:
+    """
+    Receives progress while the pipeline runs. The default ignores everything;
+    the task manager forwards it to the task's event subscribers.
+    """
+
+    def stage(self, name: str, completed: int, total: int):
+        pass
+
+    def section(self, index: int, section: Dict[str, Any]):
+        pass
+
+
 class WorkspacePipeline:
     """
     Generates structured report data from a workspace task payload.
     Later revisions can delegate to real AI orchestrators; currently it aggregates resources.
     """
 
-    async def run(self, payload: "WorkspaceTaskPayload") -> WorkspacePipelineResult:
+    async def run(
+        self,
+        payload: "WorkspaceTaskPayload",
+        reporter: Optional[PipelineReporter] = None,
+        deadline: Optional[float] = None,
+    ) -> WorkspacePipelineResult:
+        """
+        Build the report. `deadline` (a time.monotonic() instant) is installed as
+        the request deadline, so every provider call made inside inherits it.
+        """
+        with deadline_scope(deadline):
+            return await self._build(payload, reporter or PipelineReporter())
+
+    async def _build(
+        self,
+        payload: "WorkspaceTaskPayload",
+        reporter: PipelineReporter,
+    ) -> WorkspacePipelineResult:
         template = template_repository.get(payload.template_id)
 
         if not template:
@@ -37,6 +68,7 @@ class WorkspacePipeline:
         summary_lines: List[str] = []
         detail_lines: List[str] = []
 
+        reporter.stage("resources", 0, len(resources))
         for index, item in enumerate(resources, start=1):
             res = item.get("resource", {})
             title = res.get("title") or "未命名资源"
@@ -51,6 +83,7 @@ class WorkspacePipeline:
                 + (f"\n- 分类：{primary_category}" if primary_category else "")
                 + f"\n- 摘要：{summary}\n"
             )
+            reporter.stage("resources", index, len(resources))
 
         question_prompt = payload.question or "未提供额外问题"
         overview = "\n".join(summary_lines) if summary_lines else "暂无资源"
@@ -76,6 +109,11 @@ class WorkspacePipeline:
             },
         ]
 
+        reporter.stage("sections", 0, len(sections))
+        for index, section in enumerate(sections):
+            reporter.section(index, section)
+            reporter.stage("sections", index + 1, len(sections))
+
         result = {
             "summary": summary_text,
             "sections": sections,
@@ -0,0 +1,71 @@
+"""
+Per-task event channels for pushing workspace task progress over SSE.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+def encode_event(event: str, data: Dict[str, Any]) -> str:
+    """Encode one SSE frame with a named event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class TaskEventChannel:
+    """
+    Append-only event log of one task, shared by all of its subscribers.
+
+    Each event is encoded once when published and every subscriber reads the
+    same frames by index, so publishing costs the same for one listener or a
+    hundred. Subscribers that join late replay the log from the start, which
+    gives them the sections produced so far.
+    """
+
+    def __init__(self):
+        self._frames: List[str] = []
+        self._wakeup = asyncio.Event()
+        self.closed = False
+        self.subscribers = 0
+
+    def publish(self, event: str, data: Dict[str, Any]):
+        if self.closed:
+            return
+        self._frames.append(encode_event(event, data))
+        self._notify()
+
+    def close(self):
+        """Stop the channel; subscribers drain the remaining frames and finish."""
+        if not self.closed:
+            self.closed = True
+            self._notify()
+
+    def _notify(self):
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    async def frames(
+        self,
+        heartbeat_seconds: float = 15.0,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> AsyncIterator[str]:
+        """Yield the log from the start, then new frames until the channel closes."""
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(self._frames):
+                    yield self._frames[index]
+                    index += 1
+                if self.closed:
+                    return
+                wakeup = self._wakeup
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+        finally:
+            self.subscribers -= 1
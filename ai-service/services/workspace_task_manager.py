@@ -1,18 +1,80 @@
 """
-Workspace task manager (MVP in-memory implementation).
+Workspace task manager (bounded worker pool over a durable task store).
 """
 from __future__ import annotations
 
 import asyncio
+import heapq
+import json
+import math
+import time
 import uuid
+import zlib
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
-from datetime import datetime
-from typing import Any, Dict, Optional
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Literal, Optional
 
+from loguru import logger
 from pydantic import BaseModel
 
 from services.template_loader import template_repository
-from services.workspace_pipeline import WorkspacePipeline, WorkspacePipelineResult
+from services.workspace_pipeline import PipelineReporter, WorkspacePipeline, WorkspacePipelineResult
+from services.workspace_task_events import TaskEventChannel, encode_event
+from services.workspace_task_store import WorkspaceTaskRecord, WorkspaceTaskStore, create_task_store
+from utils.deadline import DeadlineExceeded
+from utils.env import env_float, env_int
+
+TaskPriority = Literal["high", "normal", "low"]
+
+# Dispatch order: a class is only served once every class before it has no runnable task.
+PRIORITY_CLASSES: tuple[str, ...] = ("high", "normal", "low")
+
+FINISHED_STATUSES: tuple[str, ...] = ("success", "failed")
+
+
+@dataclass
+class WorkspaceQueueConfig:
+    """Worker pool and retention settings for workspace tasks."""
+
+    # Tasks running at the same time across all workspaces
+    workers: int = 4
+    # Tasks running at the same time for a single workspace
+    per_workspace: int = 2
+    # Duration estimate (seconds) before any task of a template has finished
+    default_duration_seconds: float = 30.0
+    # Weight of the latest observed duration in the moving average
+    duration_smoothing: float = 0.3
+    # Finished tasks are evicted after this many seconds...
+    retention_seconds: float = 3600.0
+    # ...or earlier, oldest first, once more than this many are kept
+    max_finished: int = 1000
+    # Results whose JSON is at least this many bytes are kept zlib-compressed
+    compress_min_bytes: int = 4096
+    # Dispatches before a task interrupted by restarts is marked failed
+    max_attempts: int = 3
+    # Default per-task deadline in seconds from creation (0 disables); requests may override it
+    deadline_seconds: float = 600.0
+
+    @classmethod
+    def from_env(cls, prefix: str = "WORKSPACE_TASK") -> "WorkspaceQueueConfig":
+        """Read settings such as WORKSPACE_TASK_WORKERS from the environment."""
+        defaults = cls()
+        return cls(
+            workers=max(1, env_int(f"{prefix}_WORKERS", defaults.workers)),
+            per_workspace=max(1, env_int(f"{prefix}_PER_WORKSPACE", defaults.per_workspace)),
+            default_duration_seconds=env_float(
+                f"{prefix}_DEFAULT_DURATION_SECONDS", defaults.default_duration_seconds
+            ),
+            duration_smoothing=env_float(
+                f"{prefix}_DURATION_SMOOTHING", defaults.duration_smoothing
+            ),
+            retention_seconds=env_float(f"{prefix}_RETENTION_SECONDS", defaults.retention_seconds),
+            max_finished=max(0, env_int(f"{prefix}_MAX_FINISHED", defaults.max_finished)),
+            compress_min_bytes=env_int(f"{prefix}_COMPRESS_MIN_BYTES", defaults.compress_min_bytes),
+            max_attempts=max(1, env_int(f"{prefix}_MAX_ATTEMPTS", defaults.max_attempts)),
+            deadline_seconds=env_float(f"{prefix}_DEADLINE_SECONDS", defaults.deadline_seconds),
+        )
 
 
 class WorkspaceTaskPayload(BaseModel):
@@ -23,6 +85,8 @@ class WorkspaceTaskPayload(BaseModel):
     question: Optional[str] = None
     overrides: Optional[dict[str, Any]] = None
     resource_ids: Optional[list[str]] = None
+    priority: TaskPriority = "normal"
+    deadline_seconds: Optional[float] = None
 
 
 class WorkspaceTaskStatus(BaseModel):
@@ -39,8 +103,15 @@ class WorkspaceTaskStatus(BaseModel):
 
 @dataclass
 class InMemoryTask:
-    payload: WorkspaceTaskPayload
+    # Dropped once the task finishes; the scheduling fields below outlive it.
+    payload: Optional[WorkspaceTaskPayload]
+    workspace_id: str
+    template_id: str
+    priority: str = "normal"
     status: str = "pending"
+    attempts: int = 0
+    # Wall-clock time after which the task is failed with deadline_exceeded
+    deadline: Optional[float] = None
     created_at: datetime = field(default_factory=datetime.utcnow)
     updated_at: datetime = field(default_factory=datetime.utcnow)
     queue_position: Optional[int] = None
@@ -48,6 +119,88 @@ class InMemoryTask:
     result: Optional[dict[str, Any]] = None
     error: Optional[dict[str, Any]] = None
     metadata: dict[str, Any] = field(default_factory=dict)
+    compressed_result: Optional[bytes] = None
+    payload_bytes: int = 0
+    result_bytes: int = 0
+
+    @classmethod
+    def from_payload(cls, payload: WorkspaceTaskPayload, payload_json: str) -> "InMemoryTask":
+        return cls(
+            payload=payload,
+            workspace_id=payload.workspace_id,
+            template_id=payload.template_id,
+            priority=payload.priority,
+            deadline=time.time() + payload.deadline_seconds if payload.deadline_seconds else None,
+            payload_bytes=len(payload_json),
+        )
+
+    @classmethod
+    def from_record(cls, record: WorkspaceTaskRecord) -> "InMemoryTask":
+        payload = WorkspaceTaskPayload.model_validate_json(record.payload) if record.payload else None
+        created_at = datetime.fromisoformat(record.created_at)
+        deadline = None
+        if payload is not None and payload.deadline_seconds:
+            deadline = created_at.replace(tzinfo=timezone.utc).timestamp() + payload.deadline_seconds
+        return cls(
+            payload=payload,
+            workspace_id=record.workspace_id,
+            template_id=record.template_id,
+            priority=record.priority,
+            status=record.status,
+            attempts=record.attempts,
+            deadline=deadline,
+            created_at=created_at,
+            updated_at=datetime.fromisoformat(record.updated_at),
+            error=json.loads(record.error) if record.error else None,
+            metadata=json.loads(record.metadata) if record.metadata else {},
+            compressed_result=record.result,
+            payload_bytes=len(record.payload or ""),
+            result_bytes=len(record.result or b""),
+        )
+
+    def to_record(self, task_id: str, payload_json: Optional[str] = None) -> WorkspaceTaskRecord:
+        result = self.compressed_result
+        if result is None and self.result is not None:
+            result = zlib.compress(json.dumps(self.result, ensure_ascii=False).encode("utf-8"))
+        return WorkspaceTaskRecord(
+            id=task_id,
+            status=self.status,
+            workspace_id=self.workspace_id,
+            template_id=self.template_id,
+            priority=self.priority,
+            attempts=self.attempts,
+            created_at=self.created_at.isoformat(),
+            updated_at=self.updated_at.isoformat(),
+            payload=payload_json,
+            result=result,
+            error=json.dumps(self.error, ensure_ascii=False) if self.error is not None else None,
+            metadata=json.dumps(self.metadata, ensure_ascii=False),
+            finished_at=time.time() if self.status in FINISHED_STATUSES else None,
+        )
+
+    @property
+    def resident_bytes(self) -> int:
+        """Approximate size of the payload and result held in memory."""
+        return self.payload_bytes + self.result_bytes
+
+    def finish(self, compress_min_bytes: int):
+        """Release the payload and compress a large result."""
+        self.payload = None
+        self.payload_bytes = 0
+        if self.result is None:
+            return
+        encoded = json.dumps(self.result, ensure_ascii=False).encode("utf-8")
+        if len(encoded) >= compress_min_bytes:
+            self.compressed_result = zlib.compress(encoded)
+            self.result = None
+            self.result_bytes = len(self.compressed_result)
+        else:
+            self.result_bytes = len(encoded)
+
+    def result_value(self) -> Optional[dict[str, Any]]:
+        if self.compressed_result is not None:
+            return json.loads(zlib.decompress(self.compressed_result))
+        return self.result
 
     def to_status(self, task_id: str) -> WorkspaceTaskStatus:
         return WorkspaceTaskStatus(
@@ -57,51 +210,251 @@ class InMemoryTask:
             updated_at=self.updated_at,
             queue_position=self.queue_position,
             estimated_time=self.estimated_time,
-            result=self.result,
+            result=self.result_value(),
             error=self.error,
             metadata=self.metadata,
         )
 
 
+class ChannelReporter(PipelineReporter):
+    """Forwards pipeline progress and finished sections to a task's event channel."""
+
+    def __init__(self, channel: Optional[TaskEventChannel]):
+        self._channel = channel
+
+    def stage(self, name: str, completed: int, total: int):
+        if self._channel is not None:
+            self._channel.publish("progress", {"stage": name, "completed": completed, "total": total})
+
+    def section(self, index: int, section: Dict[str, Any]):
+        if self._channel is not None:
+            self._channel.publish("section", {"index": index, **section})
+
+
+async def _single_frame(frame: str) -> AsyncIterator[str]:
+    yield frame
+
+
 class WorkspaceTaskManager:
     """
-    MVP task manager backed by in-memory storage.
-
-    Later revisions can replace this with Redis/Celery queues while exposing
-    the same interface.
+    Task manager backed by in-memory storage and a bounded worker pool.
+
+    Pending tasks wait in one FIFO queue per priority class. Workers take the
+    oldest task of the highest class whose workspace is below its concurrency
+    cap, so a burst from one workspace cannot starve the others. Queue position
+    and estimated time are derived from the live queue and from a moving average
+    of observed durations per template. Finished tasks drop their payload,
+    keep large results compressed and are evicted from memory by age and count.
+
+    Every change is also written to the task store, so status reads for tasks
+    evicted from memory fall through to it, and `open` re-enqueues tasks that a
+    restart interrupted. Reads and updates never await while touching the
+    in-memory state, so they need no lock.
+
+    Unfinished tasks also own an event channel: status transitions, pipeline
+    progress and sections are published once and fanned out to every
+    `subscribe` stream, which ends with a final "result" event.
+
+    Each dispatched task runs in its own asyncio task bounded by the task's
+    deadline; `cancel_task` or an expired deadline cancels it, which aborts
+    in-flight provider requests and frees the worker for queued work. Both end
+    as "failed" with error code cancelled or deadline_exceeded.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        config: Optional[WorkspaceQueueConfig] = None,
+        store: Optional[WorkspaceTaskStore] = None,
+    ):
+        self.config = config or WorkspaceQueueConfig.from_env()
+        self._store = store if store is not None else create_task_store()
         self._tasks: Dict[str, InMemoryTask] = {}
-        self._lock = asyncio.Lock()
+        self._channels: Dict[str, TaskEventChannel] = {}
+        self._runners: Dict[str, asyncio.Task] = {}
+        self._opened = False
         self._pipeline: Optional[WorkspacePipeline] = None
+        self._queues: Dict[str, Deque[str]] = {priority: deque() for priority in PRIORITY_CLASSES}
+        self._ready = asyncio.Condition()
+        self._running: Dict[str, float] = {}
+        self._finished: "OrderedDict[str, float]" = OrderedDict()
+        self._resident_bytes = 0
+        self._evicted = 0
+        self._janitor: Optional[asyncio.Task] = None
+        self._running_per_workspace: Dict[str, int] = {}
+        self._workers: List[asyncio.Task] = []
+        self._durations: Dict[str, float] = {}
+        self._average_duration: Optional[float] = None
 
     def set_pipeline(self, pipeline: WorkspacePipeline):
         self._pipeline = pipeline
 
-    async def create_task(self, payload: WorkspaceTaskPayload) -> WorkspaceTaskStatus:
-        task_id = str(uuid.uuid4())
-        task = InMemoryTask(payload=payload)
-
-        async with self._lock:
-            self._tasks[task_id] = task
+    async def open(self):
+        """Open the task store, re-enqueue interrupted tasks and start the workers."""
+        if self._opened:
+            return
+        self._opened = True
+        await self._store.open()
+
+        recovered = failed = 0
+        for record in await self._store.load_unfinished():
+            if record.id in self._tasks:
+                continue
+            task = InMemoryTask.from_record(record)
+            self._tasks[record.id] = task
+            self._resident_bytes += task.resident_bytes
+            if task.payload is None or task.attempts >= self.config.max_attempts:
+                self._apply(
+                    record.id,
+                    task,
+                    status="failed",
+                    error={"message": f"interrupted after {task.attempts} attempt(s)"},
+                )
+                failed += 1
+                continue
+            task.status = "pending"
+            self._channels[record.id] = TaskEventChannel()
+            self._queues[task.priority].append(record.id)
+            recovered += 1
+
+        if recovered or failed:
+            logger.info(f"Workspace tasks recovered: {recovered} re-enqueued, {failed} failed")
+        self.start()
+        async with self._ready:
+            self._ready.notify_all()
+
+    def start(self):
+        """Spawn the worker pool (idempotent; also done lazily on the first task)."""
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"workspace-task-worker-{index}")
+            for index in range(self.config.workers)
+        ]
+        if self.config.retention_seconds > 0:
+            self._janitor = asyncio.create_task(self._evict_periodically(), name="workspace-task-janitor")
+        logger.info(
+            f"Workspace task workers started: {self.config.workers} worker(s), "
+            f"{self.config.per_workspace} per workspace"
+        )
 
-        asyncio.create_task(self._run_task(task_id))
+    async def aclose(self):
+        """
+        Stop the worker pool and flush the task store. Tasks still running are
+        cancelled and stay "running" in the store, so the next start re-enqueues them.
+        """
+        workers, self._workers = self._workers, []
+        if self._janitor is not None:
+            workers.append(self._janitor)
+            self._janitor = None
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await self._store.close()
+        self._opened = False
 
-        return task.to_status(task_id)
+    async def create_task(self, payload: WorkspaceTaskPayload) -> WorkspaceTaskStatus:
+        task_id = str(uuid.uuid4())
+        if payload.deadline_seconds is None and self.config.deadline_seconds > 0:
+            payload = payload.model_copy(update={"deadline_seconds": self.config.deadline_seconds})
+        payload_json = payload.model_dump_json()
+        task = InMemoryTask.from_payload(payload, payload_json)
+
+        self._tasks[task_id] = task
+        self._resident_bytes += task.resident_bytes
+        self._store.save(task.to_record(task_id, payload_json))
+        channel = self._channels[task_id] = TaskEventChannel()
+
+        self.start()
+        async with self._ready:
+            self._queues[payload.priority].append(task_id)
+            self._ready.notify()
+            status = self._status(task_id, task)
+            channel.publish("status", self._status_event(status))
+            if payload.priority != PRIORITY_CLASSES[-1]:
+                # Tasks queued behind it in lower classes moved back.
+                self._publish_queue_positions()
+            return status
+
+    async def cancel_task(self, task_id: str) -> WorkspaceTaskStatus:
+        """
+        Cancel a pending or running task. Finished tasks are returned unchanged.
+        Raises KeyError for unknown tasks.
+        """
+        task = self._tasks.get(task_id)
+        if task is None:
+            return await self.get_task(task_id)
+        if task.status in FINISHED_STATUSES:
+            return self._status(task_id, task)
+
+        async with self._ready:
+            queue = self._queues[task.priority]
+            if task_id in queue:
+                queue.remove(task_id)
+        self._fail(task_id, "cancelled", "cancelled by request")
+        runner = self._runners.get(task_id)
+        if runner is not None:
+            runner.cancel()
+        logger.info(f"Workspace task {task_id} cancelled")
+        return self._status(task_id, task)
+
+    async def subscribe(
+        self,
+        task_id: str,
+        heartbeat_seconds: float = 15.0,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        SSE frames for one task: its events so far, then live ones until it
+        finishes. Finished tasks get their final "result" event only.
+        Raises KeyError for unknown tasks before the stream starts.
+        """
+        channel = self._channels.get(task_id)
+        if channel is not None:
+            return channel.frames(heartbeat_seconds, is_disconnected)
+        status = await self.get_task(task_id)
+        return _single_frame(encode_event("result", status.model_dump(mode="json")))
 
     async def get_task(self, task_id: str) -> WorkspaceTaskStatus:
-        async with self._lock:
-            task = self._tasks.get(task_id)
+        task = self._tasks.get(task_id)
+        if task is not None:
+            return self._status(task_id, task)
+
+        record = await self._store.get(task_id)
+        if record is None:
+            raise KeyError(f"task {task_id} not found")
+        return InMemoryTask.from_record(record).to_status(task_id)
 
+    async def update_task(
+        self,
+        task_id: str,
+        *,
+        status: Optional[str] = None,
+        result: Optional[dict[str, Any]] = None,
+        error: Optional[dict[str, Any]] = None,
+        queue_position: Optional[int] = None,
+        estimated_time: Optional[int] = None,
+        metadata: Optional[dict[str, Any]] = None,
+    ) -> WorkspaceTaskStatus:
+        task = self._tasks.get(task_id)
         if not task:
             raise KeyError(f"task {task_id} not found")
 
+        self._apply(
+            task_id,
+            task,
+            status=status,
+            result=result,
+            error=error,
+            queue_position=queue_position,
+            estimated_time=estimated_time,
+            metadata=metadata,
+        )
         return task.to_status(task_id)
 
-    async def update_task(
+    def _apply(
         self,
         task_id: str,
+        task: InMemoryTask,
         *,
         status: Optional[str] = None,
         result: Optional[dict[str, Any]] = None,
@@ -109,44 +462,299 @@ class WorkspaceTaskManager:
         queue_position: Optional[int] = None,
         estimated_time: Optional[int] = None,
         metadata: Optional[dict[str, Any]] = None,
-    ) -> WorkspaceTaskStatus:
-        async with self._lock:
+    ):
+        previous_status = task.status
+        if status is not None:
+            task.status = status
+        if result is not None:
+            task.result = result
+        if error is not None:
+            task.error = error
+        if queue_position is not None:
+            task.queue_position = queue_position
+        if estimated_time is not None:
+            task.estimated_time = estimated_time
+        if metadata is not None:
+            task.metadata = metadata
+        task.updated_at = datetime.utcnow()
+        if task.status in FINISHED_STATUSES and task_id not in self._finished:
+            before = task.resident_bytes
+            task.finish(self.config.compress_min_bytes)
+            self._resident_bytes += task.resident_bytes - before
+            self._finished[task_id] = time.monotonic()
+            self._store.save(task.to_record(task_id))
+            channel = self._channels.pop(task_id, None)
+            if channel is not None:
+                channel.publish("result", self._status(task_id, task).model_dump(mode="json"))
+                channel.close()
+            self._evict_finished()
+        else:
+            self._store.save(task.to_record(task_id))
+            channel = self._channels.get(task_id)
+            if channel is not None and task.status != previous_status:
+                channel.publish("status", self._status_event(self._status(task_id, task)))
+
+    def _fail(self, task_id: str, code: str, message: str):
+        task = self._tasks.get(task_id)
+        if task is not None and task.status not in FINISHED_STATUSES:
+            self._apply(task_id, task, status="failed", error={"code": code, "message": message})
+
+    @staticmethod
+    def _status_event(status: WorkspaceTaskStatus) -> Dict[str, Any]:
+        return {
+            "id": status.id,
+            "status": status.status,
+            "queue_position": status.queue_position,
+            "estimated_time": status.estimated_time,
+        }
+
+    def _publish_queue_positions(self):
+        """Push fresh queue positions to pending tasks that have listeners."""
+        for task_id, channel in self._channels.items():
+            if not channel.subscribers:
+                continue
             task = self._tasks.get(task_id)
-            if not task:
-                raise KeyError(f"task {task_id} not found")
-
-            if status is not None:
-                task.status = status
-            if result is not None:
-                task.result = result
-            if error is not None:
-                task.error = error
-            if queue_position is not None:
-                task.queue_position = queue_position
-            if estimated_time is not None:
-                task.estimated_time = estimated_time
-            if metadata is not None:
-                task.metadata = metadata
-            task.updated_at = datetime.utcnow()
+            if task is None or task.status != "pending":
+                continue
+            if self._queue_position(task_id, task) is not None:
+                channel.publish("status", self._status_event(self._status(task_id, task)))
+
+    def queue_snapshot(self) -> Dict[str, Any]:
+        """Queue depth per priority class, running tasks and duration estimates."""
+        return {
+            "workers": self.config.workers,
+            "running": len(self._running),
+            "pending": {priority: len(queue) for priority, queue in self._queues.items()},
+            "average_duration_seconds": (
+                round(self._average_duration, 2) if self._average_duration is not None else None
+            ),
+            "tasks": len(self._tasks),
+            "finished": len(self._finished),
+            "evicted": self._evicted,
+            "resident_bytes": self._resident_bytes,
+            "store": self._store.snapshot(),
+        }
+
+    def _evict_finished(self):
+        """Drop finished tasks past the retention age or count from memory."""
+        cutoff = time.monotonic() - self.config.retention_seconds
+        while self._finished:
+            task_id, finished_at = next(iter(self._finished.items()))
+            if len(self._finished) <= self.config.max_finished and finished_at > cutoff:
+                break
+            self._finished.popitem(last=False)
+            task = self._tasks.pop(task_id, None)
+            if task is not None:
+                self._resident_bytes -= task.resident_bytes
+            self._evicted += 1
+
+    async def _evict_periodically(self):
+        interval = min(60.0, max(1.0, self.config.retention_seconds / 4))
+        while True:
+            await asyncio.sleep(interval)
+            before = len(self._tasks)
+            self._evict_finished()
+            evicted = before - len(self._tasks)
+            purged = await self._store.purge(time.time() - self.config.retention_seconds)
+            if evicted or purged:
+                logger.info(
+                    f"Evicted {evicted} finished workspace task(s), "
+                    f"{len(self._tasks)} kept, ~{self._resident_bytes} bytes resident, "
+                    f"{purged} purged from the store"
+                )
 
+    def _status(self, task_id: str, task: InMemoryTask) -> WorkspaceTaskStatus:
+        if task.status == "pending":
+            estimate = self._estimate_wait(task_id, task)
+            if estimate is not None:
+                task.queue_position, wait = estimate
+                task.estimated_time = math.ceil(wait)
+        elif task.status == "running":
+            task.queue_position = 0
+            started = self._running.get(task_id)
+            if started is not None:
+                elapsed = time.monotonic() - started
+                expected = self._expected_duration(task.template_id)
+                task.estimated_time = math.ceil(max(0.0, expected - elapsed))
+        else:
+            task.queue_position = None
+            task.estimated_time = None
         return task.to_status(task_id)
 
+    def _queue_position(self, task_id: str, task: InMemoryTask) -> Optional[int]:
+        """1-based position in queue order (higher classes first, FIFO within a class)."""
+        ahead = 0
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues[priority]
+            if priority == task.priority:
+                try:
+                    return ahead + queue.index(task_id) + 1
+                except ValueError:
+                    return None
+            ahead += len(queue)
+        return None
+
+    def _estimate_wait(self, task_id: str, task: InMemoryTask) -> Optional[tuple[int, float]]:
+        """
+        Simulated (position, seconds until finished) for a pending task.
+
+        Replays the dispatch rules over the live queue with each task taking its
+        template's expected duration: a free worker takes the first task in
+        dispatch order whose workspace is below `per_workspace`. The position
+        counts the queued tasks that start before this one, so a task held back
+        by its own workspace's cap is not reported as next in line.
+        """
+        if self._queue_position(task_id, task) is None:
+            return None
+        now = time.monotonic()
+        cap = self.config.per_workspace
+        busy: Dict[str, int] = {}
+        finishing: List[tuple[float, str]] = []
+        for running_id, started in self._running.items():
+            running_task = self._tasks.get(running_id)
+            if running_task is None:
+                continue
+            remaining = self._expected_duration(running_task.template_id) - (now - started)
+            finishing.append((max(0.0, remaining), running_task.workspace_id))
+            busy[running_task.workspace_id] = busy.get(running_task.workspace_id, 0) + 1
+        heapq.heapify(finishing)
+        free = max(0, self.config.workers - len(finishing))
+
+        queued = [
+            (queued_id, self._tasks[queued_id])
+            for queued_id in self._queued_ids()
+            if queued_id in self._tasks
+        ]
+        clock = 0.0
+        started_before = 0
+        while True:
+            while free > 0:
+                pick = next(
+                    (
+                        index
+                        for index, (_, item) in enumerate(queued)
+                        if busy.get(item.workspace_id, 0) < cap
+                    ),
+                    None,
+                )
+                if pick is None:
+                    break
+                picked_id, picked = queued.pop(pick)
+                duration = self._expected_duration(picked.template_id)
+                if picked_id == task_id:
+                    return started_before + 1, clock + duration
+                started_before += 1
+                busy[picked.workspace_id] = busy.get(picked.workspace_id, 0) + 1
+                heapq.heappush(finishing, (clock + duration, picked.workspace_id))
+                free -= 1
+            if not finishing:
+                return started_before + 1, clock + self._expected_duration(task.template_id)
+            clock, workspace_id = heapq.heappop(finishing)
+            busy[workspace_id] -= 1
+            free += 1
+
+    def _queued_ids(self) -> List[str]:
+        return [task_id for priority in PRIORITY_CLASSES for task_id in self._queues[priority]]
+
+    def _expected_duration(self, template_id: str) -> float:
+        duration = self._durations.get(template_id, self._average_duration)
+        return duration if duration is not None else self.config.default_duration_seconds
+
+    def _observe_duration(self, template_id: str, seconds: float):
+        alpha = min(1.0, max(0.0, self.config.duration_smoothing))
+        previous = self._durations.get(template_id)
+        self._durations[template_id] = seconds if previous is None else previous + alpha * (seconds - previous)
+        average = self._average_duration
+        self._average_duration = seconds if average is None else average + alpha * (seconds - average)
+
+    def _take_runnable(self) -> Optional[str]:
+        """Pop the next task whose workspace is below its cap (caller holds _ready)."""
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues[priority]
+            for index, task_id in enumerate(queue):
+                task = self._tasks.get(task_id)
+                if task is None:
+                    del queue[index]
+                    return self._take_runnable()
+                workspace_id = task.workspace_id
+                if self._running_per_workspace.get(workspace_id, 0) >= self.config.per_workspace:
+                    continue
+                del queue[index]
+                task.attempts += 1
+                self._running_per_workspace[workspace_id] = (
+                    self._running_per_workspace.get(workspace_id, 0) + 1
+                )
+                self._running[task_id] = time.monotonic()
+                self._publish_queue_positions()
+                return task_id
+        return None
+
+    async def _release(self, task_id: str, workspace_id: str):
+        async with self._ready:
+            self._running.pop(task_id, None)
+            remaining = self._running_per_workspace.get(workspace_id, 0) - 1
+            if remaining > 0:
+                self._running_per_workspace[workspace_id] = remaining
+            else:
+                self._running_per_workspace.pop(workspace_id, None)
+            # A freed workspace slot may unblock a task another idle worker skipped.
+            self._ready.notify_all()
+
+    async def _worker(self):
+        while True:
+            async with self._ready:
+                task_id = self._take_runnable()
+                while task_id is None:
+                    await self._ready.wait()
+                    task_id = self._take_runnable()
+
+            task = self._tasks.get(task_id)
+            workspace_id = task.workspace_id if task else ""
+            started = time.monotonic()
+            runner = asyncio.create_task(self._run_task(task_id), name=f"workspace-task-{task_id}")
+            self._runners[task_id] = runner
+            try:
+                await self._await_runner(task_id, task, runner)
+            finally:
+                self._runners.pop(task_id, None)
+                if task is not None and runner.done() and not runner.cancelled():
+                    self._observe_duration(task.template_id, time.monotonic() - started)
+                await asyncio.shield(self._release(task_id, workspace_id))
+
+    async def _await_runner(self, task_id: str, task: Optional[InMemoryTask], runner: asyncio.Task):
+        timeout = None
+        if task is not None and task.deadline is not None:
+            timeout = task.deadline - time.time()
+        try:
+            await asyncio.wait_for(runner, timeout)
+        except asyncio.TimeoutError:
+            self._fail(task_id, "deadline_exceeded", "deadline exceeded")
+            logger.warning(f"Workspace task {task_id} exceeded its deadline")
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if current is not None and current.cancelling():
+                # The worker itself is shutting down.
+                raise
+            # Cancelled through cancel_task, which already recorded the status.
+
     async def _run_task(self, task_id: str):
-        await asyncio.sleep(0)
         try:
             await self.update_task(task_id, status="running")
         except KeyError:
             return
 
-        async with self._lock:
-            task = self._tasks.get(task_id)
-
-        if not task:
+        task = self._tasks.get(task_id)
+        if not task or task.payload is None:
             return
 
         try:
             if self._pipeline:
-                result: WorkspacePipelineResult = await self._pipeline.run(task.payload)
+                deadline = None
+                if task.deadline is not None:
+                    deadline = time.monotonic() + (task.deadline - time.time())
+                result: WorkspacePipelineResult = await self._pipeline.run(
+                    task.payload, ChannelReporter(self._channels.get(task_id)), deadline
+                )
                 await self.update_task(
                     task_id,
                     status="success",
@@ -155,6 +763,10 @@ class WorkspaceTaskManager:
                 )
             else:
                 await self._fallback_task(task_id, task)
+        except DeadlineExceeded:
+            # Raised by a provider call once the deadline passed; same outcome as the wait_for timeout.
+            self._fail(task_id, "deadline_exceeded", "deadline exceeded")
+            logger.warning(f"Workspace task {task_id} exceeded its deadline")
         except Exception as exc:
             await self.update_task(
                 task_id,
@@ -163,19 +775,23 @@ class WorkspaceTaskManager:
             )
 
     async def _fallback_task(self, task_id: str, task: InMemoryTask):
+        payload = task.payload
+        reporter = ChannelReporter(self._channels.get(task_id))
         await asyncio.sleep(0.5)
-        template = template_repository.get(task.payload.template_id)
+        template = template_repository.get(payload.template_id)
         summary = f"{template.name if template else 'AI'} 自动生成的报告摘要"
         sections = [
             {
                 "title": "概览",
-                "content": f"共有 {len(task.payload.resources)} 个资源参与分析。",
+                "content": f"共有 {len(payload.resources)} 个资源参与分析。",
             },
             {
                 "title": "提示内容",
-                "content": task.payload.question or "未提供额外问题，使用默认模板分析。",
+                "content": payload.question or "未提供额外问题，使用默认模板分析。",
             },
         ]
+        for index, section in enumerate(sections):
+            reporter.section(index, section)
         await self.update_task(
             task_id,
             status="success",
@@ -184,12 +800,12 @@ class WorkspaceTaskManager:
                 "sections": sections,
             },
             metadata={
-                "templateId": task.payload.template_id,
-                "model": task.payload.model,
-                "resourceIds": task.payload.resource_ids or [],
+                "templateId": payload.template_id,
+                "model": payload.model,
+                "resourceIds": payload.resource_ids or [],
             },
         )
 
 
-# Singleton manager (MVP)
+# Singleton manager
 workspace_task_manager = WorkspaceTaskManager()
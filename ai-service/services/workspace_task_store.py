@@ -0,0 +1,350 @@
+"""
+Durable storage for workspace tasks (pluggable; SQLite WAL by default).
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from utils.env import env_float
+
+DEFAULT_TASK_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "workspace_tasks.sqlite3"
+
+
+@dataclass
+class WorkspaceTaskRecord:
+    """Serialized task row. `payload` is only set when it has to be (re)written."""
+
+    id: str
+    status: str
+    workspace_id: str
+    template_id: str
+    priority: str
+    attempts: int
+    created_at: str
+    updated_at: str
+    payload: Optional[str] = None
+    result: Optional[bytes] = None
+    error: Optional[str] = None
+    metadata: Optional[str] = None
+    # Wall-clock time the task finished; None while pending or running
+    finished_at: Optional[float] = None
+
+
+@dataclass
+class WorkspaceTaskStoreConfig:
+    """Task store settings."""
+
+    # sqlite or memory (memory keeps nothing across restarts)
+    backend: str = "sqlite"
+    path: str = str(DEFAULT_TASK_DB_PATH)
+    # Status writes are buffered and flushed in one transaction at this interval
+    flush_interval_ms: float = 50.0
+
+    @classmethod
+    def from_env(cls, prefix: str = "WORKSPACE_TASK_STORE") -> "WorkspaceTaskStoreConfig":
+        """Read settings such as WORKSPACE_TASK_STORE_PATH from the environment."""
+        defaults = cls()
+        return cls(
+            backend=(os.getenv(prefix) or defaults.backend).strip().lower(),
+            path=os.getenv(f"{prefix}_PATH") or defaults.path,
+            flush_interval_ms=env_float(f"{prefix}_FLUSH_INTERVAL_MS", defaults.flush_interval_ms),
+        )
+
+
+class WorkspaceTaskStore:
+    """
+    Interface between WorkspaceTaskManager and its durable storage.
+
+    `save` must not block the caller; implementations may buffer writes as long
+    as `get` sees buffered records and `close` flushes them.
+    """
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def save(self, record: WorkspaceTaskRecord):
+        pass
+
+    async def get(self, task_id: str) -> Optional[WorkspaceTaskRecord]:
+        return None
+
+    async def load_unfinished(self) -> List[WorkspaceTaskRecord]:
+        """Pending and running tasks, oldest first, with their payload."""
+        return []
+
+    async def purge(self, finished_before: float) -> int:
+        """Delete tasks that finished before the given wall-clock time."""
+        return 0
+
+    def snapshot(self) -> Dict[str, object]:
+        return {"backend": "memory"}
+
+
+class MemoryTaskStore(WorkspaceTaskStore):
+    """Keeps nothing beyond the manager's own memory."""
+
+
+class SQLiteTaskStore(WorkspaceTaskStore):
+    """
+    SQLite (WAL) task store.
+
+    Writes are coalesced per task and flushed in one transaction every
+    flush_interval_ms on a worker thread. Lookups go through the primary key and
+    never touch the manager's state, and recovery uses a partial index over
+    unfinished rows.
+    """
+
+    def __init__(self, config: Optional[WorkspaceTaskStoreConfig] = None):
+        self.config = config or WorkspaceTaskStoreConfig()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._pending: Dict[str, WorkspaceTaskRecord] = {}
+        self._flush_signal = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+
+        self._writes = 0
+        self._flushes = 0
+        self._errors = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._conn is not None
+
+    async def open(self):
+        if self.is_open:
+            return
+        try:
+            await asyncio.to_thread(self._open_sync)
+        except Exception as e:
+            logger.error(f"Failed to open workspace task store at {self.config.path}: {e}")
+            self._conn = None
+            return
+
+        self._flusher = asyncio.create_task(self._flush_loop(), name="workspace-task-store-flush")
+        logger.info(f"Workspace task store opened: {self.config.path}")
+
+    def _open_sync(self):
+        path = Path(self.config.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS workspace_tasks (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                workspace_id TEXT NOT NULL,
+                template_id TEXT NOT NULL,
+                priority TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                payload TEXT,
+                result BLOB,
+                error TEXT,
+                metadata TEXT,
+                finished_at REAL
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_workspace_tasks_unfinished "
+            "ON workspace_tasks(created_at) WHERE finished_at IS NULL"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_workspace_tasks_finished ON workspace_tasks(finished_at)"
+        )
+        self._conn = conn
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self._flush()
+        if self._conn is not None:
+            conn = self._conn
+            self._conn = None
+            await asyncio.to_thread(self._close_sync, conn)
+            logger.info("Workspace task store closed")
+
+    def _close_sync(self, conn: sqlite3.Connection):
+        with self._db_lock:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.close()
+
+    def save(self, record: WorkspaceTaskRecord):
+        if not self.is_open:
+            return
+        previous = self._pending.get(record.id)
+        if previous is not None and record.payload is None and record.finished_at is None:
+            # Keep the payload of a creation that has not been flushed yet.
+            record.payload = previous.payload
+        self._pending[record.id] = record
+        self._flush_signal.set()
+
+    async def get(self, task_id: str) -> Optional[WorkspaceTaskRecord]:
+        pending = self._pending.get(task_id)
+        if pending is not None:
+            return pending
+        if not self.is_open:
+            return None
+        try:
+            return await asyncio.to_thread(self._get_sync, task_id)
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"Workspace task store read failed: {e}")
+            return None
+
+    def _get_sync(self, task_id: str) -> Optional[WorkspaceTaskRecord]:
+        with self._db_lock:
+            conn = self._conn
+            if conn is None:
+                return None
+            row = conn.execute(
+                f"SELECT {_COLUMNS} FROM workspace_tasks WHERE id = ?", (task_id,)
+            ).fetchone()
+        return WorkspaceTaskRecord(*row) if row else None
+
+    async def load_unfinished(self) -> List[WorkspaceTaskRecord]:
+        if not self.is_open:
+            return []
+        try:
+            return await asyncio.to_thread(self._load_unfinished_sync)
+        except Exception as e:
+            self._errors += 1
+            logger.error(f"Workspace task store recovery failed: {e}")
+            return []
+
+    def _load_unfinished_sync(self) -> List[WorkspaceTaskRecord]:
+        with self._db_lock:
+            conn = self._conn
+            if conn is None:
+                return []
+            rows = conn.execute(
+                f"SELECT {_COLUMNS} FROM workspace_tasks "
+                "WHERE finished_at IS NULL ORDER BY created_at"
+            ).fetchall()
+        return [WorkspaceTaskRecord(*row) for row in rows]
+
+    async def purge(self, finished_before: float) -> int:
+        if not self.is_open:
+            return 0
+        try:
+            return await asyncio.to_thread(self._purge_sync, finished_before)
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"Workspace task store purge failed: {e}")
+            return 0
+
+    def _purge_sync(self, finished_before: float) -> int:
+        with self._db_lock:
+            conn = self._conn
+            if conn is None:
+                return 0
+            return conn.execute(
+                "DELETE FROM workspace_tasks WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (finished_before,),
+            ).rowcount
+
+    async def _flush_loop(self):
+        interval = max(0.0, self.config.flush_interval_ms) / 1000
+        while True:
+            await self._flush_signal.wait()
+            # Let further updates pile up so one transaction covers them.
+            await asyncio.sleep(interval)
+            await self._flush()
+
+    async def _flush(self):
+        self._flush_signal.clear()
+        if not self._pending or not self.is_open:
+            return
+        batch, self._pending = list(self._pending.values()), {}
+        try:
+            await asyncio.to_thread(self._write_sync, batch)
+            self._writes += len(batch)
+            self._flushes += 1
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"Workspace task store write of {len(batch)} task(s) failed: {e}")
+            # Retry on the next flush unless a newer version is already queued.
+            for record in batch:
+                self._pending.setdefault(record.id, record)
+
+    def _write_sync(self, batch: List[WorkspaceTaskRecord]):
+        rows = [
+            (
+                record.id, record.status, record.workspace_id, record.template_id,
+                record.priority, record.attempts, record.created_at, record.updated_at,
+                record.payload, record.result, record.error, record.metadata, record.finished_at,
+            )
+            for record in batch
+        ]
+        with self._db_lock:
+            conn = self._conn
+            if conn is None:
+                return
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    f"""
+                    INSERT INTO workspace_tasks ({_COLUMNS})
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        status = excluded.status,
+                        attempts = excluded.attempts,
+                        updated_at = excluded.updated_at,
+                        payload = CASE
+                            WHEN excluded.finished_at IS NOT NULL THEN NULL
+                            ELSE COALESCE(excluded.payload, workspace_tasks.payload)
+                        END,
+                        result = excluded.result,
+                        error = excluded.error,
+                        metadata = excluded.metadata,
+                        finished_at = excluded.finished_at
+                    """,
+                    rows,
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "backend": "sqlite",
+            "open": self.is_open,
+            "path": self.config.path,
+            "pending_writes": len(self._pending),
+            "writes": self._writes,
+            "flushes": self._flushes,
+            "errors": self._errors,
+        }
+
+
+_COLUMNS = (
+    "id, status, workspace_id, template_id, priority, attempts, created_at, updated_at, "
+    "payload, result, error, metadata, finished_at"
+)
+
+
+def create_task_store(config: Optional[WorkspaceTaskStoreConfig] = None) -> WorkspaceTaskStore:
+    """Build the store selected by WORKSPACE_TASK_STORE (sqlite or memory)."""
+    config = config or WorkspaceTaskStoreConfig.from_env()
+    if config.backend == "memory":
+        return MemoryTaskStore()
+    if config.backend != "sqlite":
+        logger.warning(f"Unknown workspace task store {config.backend!r}, using sqlite")
+    return SQLiteTaskStore(config)
@@ -0,0 +1,145 @@
+"""
+熔断器状态机测试
+"""
+from services.circuit_breaker import CircuitBreaker, CircuitBreakerConfig, CircuitState
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_breaker(**overrides):
+    clock = FakeClock()
+    config = CircuitBreakerConfig(
+        window_seconds=60.0,
+        min_requests=4,
+        failure_rate_threshold=0.5,
+        cooldown_seconds=30.0,
+        half_open_max_probes=1,
+        half_open_success_threshold=2,
+    )
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    return CircuitBreaker("grok", config, clock=clock), clock
+
+
+def trip(breaker):
+    for _ in range(breaker.config.min_requests):
+        breaker.record_failure(breaker.allow_request())
+
+
+def test_stays_closed_below_min_requests():
+    breaker, _ = make_breaker()
+    for _ in range(3):
+        breaker.record_failure(breaker.allow_request())
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_opens_at_failure_rate_and_rejects():
+    breaker, _ = make_breaker()
+    breaker.record_success(breaker.allow_request())
+    breaker.record_success(breaker.allow_request())
+    breaker.record_failure(breaker.allow_request())
+    assert breaker.state == CircuitState.CLOSED
+    breaker.record_failure(breaker.allow_request())
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.allow_request() is None
+    assert breaker.snapshot()["rejected"] == 1
+
+
+def test_old_outcomes_leave_the_window():
+    breaker, clock = make_breaker()
+    for _ in range(3):
+        breaker.record_failure(breaker.allow_request())
+    clock.now += 61
+    breaker.record_failure(breaker.allow_request())
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_half_open_after_cooldown_limits_probes():
+    breaker, clock = make_breaker()
+    trip(breaker)
+    clock.now += 29
+    assert breaker.state == CircuitState.OPEN
+    clock.now += 1
+    assert breaker.state == CircuitState.HALF_OPEN
+
+    probe = breaker.allow_request()
+    assert probe and probe.probe
+    assert breaker.allow_request() is None
+
+
+def test_probe_successes_close_the_breaker():
+    breaker, clock = make_breaker()
+    trip(breaker)
+    clock.now += 30
+
+    breaker.record_success(breaker.allow_request())
+    assert breaker.state == CircuitState.HALF_OPEN
+    breaker.record_success(breaker.allow_request())
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.snapshot()["window_requests"] == 0
+
+
+def test_probe_failure_reopens():
+    breaker, clock = make_breaker()
+    trip(breaker)
+    clock.now += 30
+
+    breaker.record_failure(breaker.allow_request())
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.snapshot()["times_opened"] == 2
+
+
+def test_release_returns_the_probe_slot():
+    breaker, clock = make_breaker()
+    trip(breaker)
+    clock.now += 30
+
+    probe = breaker.allow_request()
+    breaker.release(probe)
+    assert breaker.allow_request()
+
+
+def test_call_admitted_while_closed_does_not_free_a_probe_slot():
+    breaker, clock = make_breaker()
+    stale = breaker.allow_request()
+    trip(breaker)
+    clock.now += 30
+    probe = breaker.allow_request()
+    assert probe
+
+    # 熔断前放行的调用现在才结束：既不归还名额，也不影响半开判定
+    breaker.release(stale)
+    assert breaker.allow_request() is None
+    breaker.record_success(stale)
+    breaker.record_failure(stale)
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.snapshot()["probes_in_flight"] == 1
+
+    breaker.record_success(probe)
+    assert breaker.snapshot()["probes_in_flight"] == 0
+
+
+def test_probe_from_previous_half_open_period_is_ignored():
+    breaker, clock = make_breaker(half_open_max_probes=2)
+    trip(breaker)
+    clock.now += 30
+    failed_probe = breaker.allow_request()
+    lingering_probe = breaker.allow_request()
+    breaker.record_failure(failed_probe)
+    assert breaker.state == CircuitState.OPEN
+
+    clock.now += 30
+    assert breaker.state == CircuitState.HALF_OPEN
+    current = breaker.allow_request()
+    breaker.release(lingering_probe)
+    breaker.record_success(lingering_probe)
+    assert breaker.snapshot()["probes_in_flight"] == 1
+
+    breaker.record_success(current)
+    assert breaker.state == CircuitState.HALF_OPEN
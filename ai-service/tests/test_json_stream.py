@@ -0,0 +1,23 @@
+"""
+增量 JSON 数组解析测试
+"""
+from utils.json_stream import JsonArrayStreamParser
+
+
+def test_elements_are_emitted_as_soon_as_complete():
+    parser = JsonArrayStreamParser()
+    assert parser.feed('```json\n[{"index": 0, "trans') == []
+    assert parser.feed('lation": "a, [b]"}, {"index": 1,') == [{"index": 0, "translation": "a, [b]"}]
+    assert parser.feed(' "translation": "c\\"d"}]') == [{"index": 1, "translation": 'c"d'}]
+    assert parser.finished
+
+
+def test_malformed_elements_are_skipped():
+    parser = JsonArrayStreamParser()
+    assert parser.feed('[{"index": 0}, {bad}, 3]') == [{"index": 0}, 3]
+
+
+def test_text_after_the_array_is_ignored():
+    parser = JsonArrayStreamParser()
+    assert parser.feed("[1, 2] trailing [3]") == [1, 2]
+    assert parser.feed("[4]") == []
@@ -0,0 +1,46 @@
+"""
+令牌桶限流测试
+"""
+import asyncio
+
+from services.rate_limiter import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_burst_is_available_immediately_then_refills():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=3, clock=clock)
+
+    async def scenario():
+        for _ in range(3):
+            assert await bucket.acquire() == 0.0
+        assert bucket.tokens < 1.0
+        clock.now += 0.5
+        assert bucket.tokens == 1.0
+        clock.now += 10
+        assert bucket.tokens == 3.0
+
+    asyncio.run(scenario())
+
+
+def test_waiters_are_served_in_arrival_order():
+    bucket = TokenBucket(rate=100.0, burst=1)
+
+    async def scenario():
+        order = []
+
+        async def take(name):
+            await bucket.acquire()
+            order.append(name)
+
+        await asyncio.gather(*(take(name) for name in "abcd"))
+        assert order == list("abcd")
+
+    asyncio.run(scenario())
@@ -0,0 +1,82 @@
+"""
+对冲预算与按端点延迟统计测试
+"""
+from services.provider_routing import LatencyAwarePolicy, LatencyTracker
+from services.request_hedging import HedgingConfig, RequestHedger
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_hedging_is_opt_in_per_endpoint():
+    hedger = RequestHedger(HedgingConfig(endpoints=["translate-single"]))
+    assert hedger.is_enabled("translate-single")
+    assert not hedger.is_enabled("summary")
+    assert not hedger.is_enabled(None)
+
+
+def test_budget_caps_hedges_to_ratio_of_requests():
+    hedger = RequestHedger(HedgingConfig(budget_ratio=0.25, budget_burst=10))
+    granted = 0
+    for _ in range(20):
+        hedger.record_request()
+        if hedger.try_acquire():
+            granted += 1
+    assert granted == 5
+    assert hedger.snapshot()["budget_rejections"] == 15
+
+
+def test_budget_burst_limits_saved_tokens():
+    hedger = RequestHedger(HedgingConfig(budget_ratio=1.0, budget_burst=2))
+    for _ in range(10):
+        hedger.record_request()
+    assert hedger.try_acquire()
+    assert hedger.try_acquire()
+    assert not hedger.try_acquire()
+
+
+def test_hedge_delay_uses_floor_and_default():
+    hedger = RequestHedger(HedgingConfig(default_delay=3.0, min_delay=0.2))
+    assert hedger.hedge_delay(None) == 3.0
+    assert hedger.hedge_delay(0.05) == 0.2
+    assert hedger.hedge_delay(1.5) == 1.5
+
+
+def test_latency_percentiles_are_kept_per_endpoint():
+    tracker = LatencyTracker(clock=FakeClock())
+    for _ in range(10):
+        tracker.record("grok", "grok-3", 0.5, True, endpoint="translate-single")
+        tracker.record("grok", "grok-3", 20.0, True, endpoint="youtube-report")
+
+    assert tracker.percentile("grok", "grok-3", 0.9, endpoint="translate-single") == 0.5
+    assert tracker.percentile("grok", "grok-3", 0.9, endpoint="youtube-report") == 20.0
+    assert tracker.stats("grok", "grok-3").samples == 20
+    assert tracker.percentile("grok", "grok-3", 0.9, endpoint="summary") is None
+
+
+def test_latency_samples_expire_with_the_window():
+    clock = FakeClock()
+    tracker = LatencyTracker(window_seconds=60, clock=clock)
+    tracker.record("grok", "grok-3", 1.0, True)
+    clock.now += 61
+    assert tracker.stats("grok", "grok-3").samples == 0
+
+
+def test_policy_ranks_by_endpoint_latency():
+    tracker = LatencyTracker(clock=FakeClock())
+    for _ in range(5):
+        # grok 的长报告很慢，但短翻译比 openai 快
+        tracker.record("grok", "grok-3", 30.0, True, endpoint="youtube-report")
+        tracker.record("grok", "grok-3", 0.3, True, endpoint="translate-single")
+        tracker.record("openai", "gpt-4o-mini", 1.0, True, endpoint="translate-single")
+        tracker.record("openai", "gpt-4o-mini", 10.0, True, endpoint="youtube-report")
+    policy = LatencyAwarePolicy(tracker, explore_ratio=0.0)
+    candidates = [("grok", "grok-3"), ("openai", "gpt-4o-mini")]
+
+    assert policy.rank(candidates, preferred="grok", endpoint="translate-single") == ["grok", "openai"]
+    assert policy.rank(candidates, preferred="grok", endpoint="youtube-report") == ["openai", "grok"]
@@ -0,0 +1,58 @@
+"""
+内存响应缓存（LRU + TTL）测试
+"""
+from services.response_cache import ResponseCache, ResponseCacheConfig, build_cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(ResponseCacheConfig(ttl_seconds=10), clock=clock)
+    cache.set("k", "v")
+    clock.now += 9
+    assert cache.get("k") == "v"
+    clock.now += 1
+    assert cache.get("k") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(ResponseCacheConfig(max_entries=2), clock=FakeClock())
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_byte_limit_evicts_and_skips_oversized_values():
+    cache = ResponseCache(ResponseCacheConfig(max_bytes=10), clock=FakeClock())
+    cache.set("a", "12345")
+    cache.set("b", "67890")
+    cache.set("c", "x")
+    assert cache.get("a") is None
+    cache.set("huge", "x" * 11)
+    assert cache.get("huge") is None
+
+
+def test_lookup_returns_first_live_candidate():
+    cache = ResponseCache(clock=FakeClock())
+    cache.set("openai-key", "from openai")
+    assert cache.lookup(["grok-key", "openai-key"]) == ("openai-key", "from openai")
+    assert cache.lookup(["missing"]) is None
+
+
+def test_cache_key_depends_on_model_and_sampling():
+    messages = [{"role": "user", "content": "hi"}]
+    key = build_cache_key("grok-3", messages, 0.3, 100)
+    assert key == build_cache_key("grok-3", messages, 0.3, 100)
+    assert key != build_cache_key("gpt-4o-mini", messages, 0.3, 100)
+    assert key != build_cache_key("grok-3", messages, 0.3, 200)
@@ -0,0 +1,164 @@
+"""
+请求合并（single-flight）测试
+"""
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight, StreamAbandoned
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+        release = asyncio.Event()
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "result"
+
+        waiters = [asyncio.create_task(flight.do("k", fn)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        assert await asyncio.gather(*waiters) == ["result"] * 3
+        assert calls == 1
+        snapshot = flight.snapshot()
+        assert (snapshot["calls_led"], snapshot["calls_shared"], snapshot["calls_in_flight"]) == (1, 2, 0)
+
+    run(scenario())
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            return "result"
+
+        first = asyncio.create_task(flight.do("k", fn))
+        second = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await second == "result"
+        assert first.cancelled()
+
+    run(scenario())
+
+
+def test_call_is_cancelled_when_every_waiter_leaves():
+    async def scenario():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fn():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(flight.do("k", fn)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        assert flight.snapshot()["calls_in_flight"] == 0
+
+    run(scenario())
+
+
+async def chunks(started: list, count: int = 3):
+    started.append(1)
+    for index in range(count):
+        yield f"c{index}"
+        await asyncio.sleep(0.01)
+
+
+async def collect(iterator):
+    return [chunk async for chunk in iterator]
+
+
+def test_streams_are_shared_and_replayed():
+    async def scenario():
+        flight = SingleFlight()
+        started: list = []
+        first = flight.stream("k", lambda: chunks(started))
+        second = flight.stream("k", lambda: chunks(started))
+        results = await asyncio.gather(collect(first), collect(second))
+        assert results == [["c0", "c1", "c2"]] * 2
+        assert len(started) == 1
+        assert flight.snapshot()["streams_in_flight"] == 0
+
+    run(scenario())
+
+
+def test_stream_starts_only_when_iterated():
+    async def scenario():
+        flight = SingleFlight()
+        started: list = []
+        iterator = flight.stream("k", lambda: chunks(started))
+        await asyncio.sleep(0.02)
+        assert started == []
+        del iterator
+
+    run(scenario())
+
+
+def test_request_after_abandon_gets_a_fresh_stream():
+    async def scenario():
+        flight = SingleFlight()
+        started: list = []
+        first = flight.stream("k", lambda: chunks(started))
+        assert await first.__anext__() == "c0"
+        await first.aclose()
+
+        # 上游还没退出时到达的相同请求不能拿到截断的流
+        second = flight.stream("k", lambda: chunks(started))
+        assert await collect(second) == ["c0", "c1", "c2"]
+        assert len(started) == 2
+
+    run(scenario())
+
+
+def test_joined_subscriber_of_abandoned_stream_gets_an_error():
+    async def scenario():
+        flight = SingleFlight()
+        started: list = []
+        first = flight.stream("k", lambda: chunks(started))
+        joined = flight.stream("k", lambda: chunks(started))
+        assert await first.__anext__() == "c0"
+        await first.aclose()
+
+        with pytest.raises(StreamAbandoned):
+            await collect(joined)
+
+    run(scenario())
+
+
+def test_upstream_error_reaches_every_subscriber():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def failing():
+            yield "c0"
+            raise RuntimeError("boom")
+
+        first = flight.stream("k", failing)
+        second = flight.stream("k", failing)
+        for iterator in (first, second):
+            with pytest.raises(RuntimeError, match="boom"):
+                await collect(iterator)
+
+    run(scenario())
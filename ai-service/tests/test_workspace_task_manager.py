@@ -0,0 +1,196 @@
+"""
+工作区任务队列测试：优先级与工作区并发上限、取消、截止时间、排队估计
+"""
+import asyncio
+import time
+
+from services.workspace_pipeline import WorkspacePipelineResult
+from services.workspace_task_manager import (
+    InMemoryTask,
+    WorkspaceQueueConfig,
+    WorkspaceTaskManager,
+    WorkspaceTaskPayload,
+)
+from services.workspace_task_store import MemoryTaskStore
+from utils.deadline import DeadlineExceeded
+
+
+class FakePipeline:
+    """按 question 字段决定行为的假流水线，记录开始顺序"""
+
+    def __init__(self):
+        self.started = []
+        self.cancelled = []
+        self.gates = {}
+
+    def gate(self, name: str) -> asyncio.Event:
+        return self.gates.setdefault(name, asyncio.Event())
+
+    async def run(self, payload, reporter=None, deadline=None):
+        name = payload.question
+        self.started.append(name)
+        try:
+            if name.startswith("raise-deadline"):
+                raise DeadlineExceeded("deadline exceeded before the provider call")
+            await self.gate(name).wait()
+        except asyncio.CancelledError:
+            self.cancelled.append(name)
+            raise
+        return WorkspacePipelineResult(result={"summary": name}, metadata={})
+
+
+def make_manager(workers=1, per_workspace=2):
+    manager = WorkspaceTaskManager(
+        WorkspaceQueueConfig(workers=workers, per_workspace=per_workspace),
+        store=MemoryTaskStore(),
+    )
+    pipeline = FakePipeline()
+    manager.set_pipeline(pipeline)
+    return manager, pipeline
+
+
+def payload(name, workspace="ws-1", priority="normal", deadline_seconds=None):
+    return WorkspaceTaskPayload(
+        workspace_id=workspace,
+        template_id="template",
+        model="grok",
+        resources=[],
+        question=name,
+        priority=priority,
+        deadline_seconds=deadline_seconds,
+    )
+
+
+async def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+async def wait_finished(manager, task_id):
+    await wait_until(lambda: manager._tasks[task_id].status in ("success", "failed"))
+    return await manager.get_task(task_id)
+
+
+def test_higher_priority_classes_run_first():
+    async def scenario():
+        manager, pipeline = make_manager(workers=1)
+        blocker = await manager.create_task(payload("blocker"))
+        await wait_until(lambda: pipeline.started == ["blocker"])
+
+        ids = {}
+        for name, priority in [("low", "low"), ("normal-1", "normal"), ("high", "high"), ("normal-2", "normal")]:
+            ids[name] = (await manager.create_task(payload(name, priority=priority))).id
+        assert (await manager.get_task(ids["high"])).queue_position == 1
+        assert (await manager.get_task(ids["low"])).queue_position == 4
+
+        for name in ["blocker", "high", "normal-1", "normal-2", "low"]:
+            pipeline.gate(name).set()
+        await wait_finished(manager, ids["low"])
+        assert pipeline.started == ["blocker", "high", "normal-1", "normal-2", "low"]
+        assert (await manager.get_task(blocker.id)).status == "success"
+        await manager.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_per_workspace_cap_lets_other_workspaces_through():
+    async def scenario():
+        manager, pipeline = make_manager(workers=2, per_workspace=1)
+        await manager.create_task(payload("a1", workspace="a"))
+        a2 = await manager.create_task(payload("a2", workspace="a"))
+        await manager.create_task(payload("b1", workspace="b"))
+        await wait_until(lambda: len(pipeline.started) == 2)
+        assert pipeline.started == ["a1", "b1"]
+        assert (await manager.get_task(a2.id)).status == "pending"
+
+        pipeline.gate("a1").set()
+        await wait_until(lambda: "a2" in pipeline.started)
+        for name in ("a2", "b1"):
+            pipeline.gate(name).set()
+        await wait_finished(manager, a2.id)
+        await manager.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_estimate_accounts_for_workspace_cap():
+    manager, _ = make_manager(workers=2, per_workspace=1)
+    manager.config.default_duration_seconds = 10.0
+    running = InMemoryTask(payload=None, workspace_id="a", template_id="t", status="running")
+    manager._tasks["running"] = running
+    manager._running["running"] = time.monotonic()
+    manager._running_per_workspace["a"] = 1
+    for task_id, workspace in [("a2", "a"), ("b1", "b")]:
+        manager._tasks[task_id] = InMemoryTask(payload=None, workspace_id=workspace, template_id="t")
+        manager._queues["normal"].append(task_id)
+
+    # a2 排在前面，但要等 a 的名额；b1 会先开始
+    position, wait = manager._estimate_wait("a2", manager._tasks["a2"])
+    assert position == 2
+    assert 19 < wait <= 20
+    assert manager._estimate_wait("b1", manager._tasks["b1"]) == (1, 10.0)
+
+
+def test_cancel_pending_task_never_runs():
+    async def scenario():
+        manager, pipeline = make_manager(workers=1)
+        await manager.create_task(payload("blocker"))
+        queued = await manager.create_task(payload("queued"))
+        await wait_until(lambda: pipeline.started == ["blocker"])
+
+        status = await manager.cancel_task(queued.id)
+        assert status.status == "failed"
+        assert status.error["code"] == "cancelled"
+
+        pipeline.gate("blocker").set()
+        await asyncio.sleep(0.05)
+        assert pipeline.started == ["blocker"]
+        await manager.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_cancel_running_task_frees_the_worker():
+    async def scenario():
+        manager, pipeline = make_manager(workers=1)
+        running = await manager.create_task(payload("running"))
+        after = await manager.create_task(payload("after"))
+        await wait_until(lambda: pipeline.started == ["running"])
+
+        status = await manager.cancel_task(running.id)
+        assert status.error["code"] == "cancelled"
+        await wait_until(lambda: pipeline.started == ["running", "after"])
+        assert pipeline.cancelled == ["running"]
+
+        pipeline.gate("after").set()
+        assert (await wait_finished(manager, after.id)).status == "success"
+        await manager.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_deadline_cancels_a_slow_task():
+    async def scenario():
+        manager, pipeline = make_manager(workers=1)
+        task = await manager.create_task(payload("slow", deadline_seconds=0.05))
+        status = await wait_finished(manager, task.id)
+        assert status.status == "failed"
+        assert status.error["code"] == "deadline_exceeded"
+        assert pipeline.cancelled == ["slow"]
+        await manager.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_deadline_raised_by_provider_call_uses_the_same_code():
+    async def scenario():
+        manager, _ = make_manager(workers=1)
+        task = await manager.create_task(payload("raise-deadline"))
+        status = await wait_finished(manager, task.id)
+        assert status.status == "failed"
+        assert status.error["code"] == "deadline_exceeded"
+        await manager.aclose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,75 @@
+"""
+请求截止时间 - 通过 contextvar 传递到每一次提供商调用
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+# 截止时间（time.monotonic() 时刻），None 表示不限
+_deadline: ContextVar[Optional[float]] = ContextVar("ai_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """截止时间已过，不再发起新的提供商调用"""
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]) -> Iterator[None]:
+    """
+    在作用域内设置截止时间（嵌套时取更早者），作用域内创建的任务会继承
+
+    Args:
+        deadline: time.monotonic() 时刻，None 表示沿用外层设置
+    """
+    current = _deadline.get()
+    if deadline is None or (current is not None and current <= deadline):
+        yield
+        return
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """
+    距截止时间的剩余秒数
+
+    Returns:
+        剩余秒数（可能为负），未设置截止时间时为 None
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def deadline_expired() -> bool:
+    """截止时间是否已过"""
+    remaining = remaining_time()
+    return remaining is not None and remaining <= 0
+
+
+def request_timeout(default: Any = None) -> Any:
+    """
+    单次 HTTP 请求的超时：不超过剩余时间
+
+    Args:
+        default: 未设置截止时间时使用的超时（数字时与剩余时间取较小值）
+
+    Returns:
+        超时秒数或原样返回的 default
+
+    Raises:
+        DeadlineExceeded: 截止时间已过
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        raise DeadlineExceeded("deadline exceeded before the provider call")
+    if isinstance(default, (int, float)):
+        return min(float(default), remaining)
+    return remaining
@@ -0,0 +1,61 @@
+"""
+环境变量读取辅助函数
+"""
+import os
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+_TRUTHY_VALUES = {"true", "1", "yes", "on"}
+
+
+def env_int(key: str, default: int) -> int:
+    """读取整数环境变量，缺失或非法时返回默认值"""
+    value = os.getenv(key)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning(f"Invalid integer for {key}: {value}, using {default}")
+        return default
+
+
+def env_float(key: str, default: float) -> float:
+    """读取浮点环境变量，缺失或非法时返回默认值"""
+    value = os.getenv(key)
+    if value is None or not value.strip():
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Invalid number for {key}: {value}, using {default}")
+        return default
+
+
+def env_bool(key: str, default: bool) -> bool:
+    """读取布尔环境变量（true/1/yes/on 为真）"""
+    value = os.getenv(key)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in _TRUTHY_VALUES
+
+
+def env_list(key: str, default: Optional[List[str]] = None) -> List[str]:
+    """读取逗号分隔的列表环境变量"""
+    value = os.getenv(key)
+    if value is None or not value.strip():
+        return list(default or [])
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def env_mapping(key: str) -> Dict[str, str]:
+    """读取 "a=1,b=2" 形式的映射环境变量"""
+    result: Dict[str, str] = {}
+    for item in env_list(key):
+        if "=" not in item:
+            logger.warning(f"Ignoring malformed entry in {key}: {item}")
+            continue
+        name, value = item.split("=", 1)
+        result[name.strip()] = value.strip()
+    return result
@@ -0,0 +1,90 @@
+"""
+增量 JSON 数组解析 - 在模型流式输出过程中逐个取出已完整的数组元素
+"""
+import json
+from typing import Any, List
+
+from loguru import logger
+
+
+class JsonArrayStreamParser:
+    """
+    增量解析顶层 JSON 数组
+
+    逐段喂入模型输出，每当一个顶层元素完整时立即返回；数组之前的
+    任意文本（如 ```json 代码块标记）会被跳过，无法解析的元素会被丢弃。
+    """
+
+    def __init__(self):
+        """初始化解析器"""
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._element: List[str] = []
+
+    @property
+    def finished(self) -> bool:
+        """是否已读到顶层数组的结束符"""
+        return self._finished
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        喂入一段文本
+
+        Args:
+            chunk: 模型输出片段
+
+        Returns:
+            本次新完成的数组元素
+        """
+        items: List[Any] = []
+        for char in chunk:
+            if self._finished:
+                break
+            if not self._started:
+                if char == "[":
+                    self._started = True
+                continue
+
+            if self._in_string:
+                self._element.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if self._depth == 0 and char in ",]":
+                # 顶层分隔符：结束当前元素（标量或空白）
+                self._emit(items)
+                if char == "]":
+                    self._finished = True
+                continue
+
+            if self._depth == 0 and not self._element and char.isspace():
+                continue
+
+            self._element.append(char)
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(items)
+        return items
+
+    def _emit(self, items: List[Any]):
+        text = "".join(self._element).strip()
+        self._element = []
+        if not text:
+            return
+        try:
+            items.append(json.loads(text))
+        except json.JSONDecodeError:
+            logger.debug(f"Skipping malformed array element: {text[:80]}")
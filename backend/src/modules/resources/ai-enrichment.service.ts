@@ -131,6 +131,82 @@ export class AIEnrichmentService {
     }
   }
 
+  /**
+   * 综合增强：一次请求同时获取摘要、洞察和分类
+   * 内容只发送一次，失败时返回 null
+   */
+  async enrichContent(
+    content: string,
+    maxLength = 200,
+    language: "zh" | "en" = "zh",
+  ): Promise<{
+    summary: string | null;
+    insights: any[];
+    classification: {
+      category: string;
+      subcategories: string[];
+      tags: string[];
+      difficultyLevel: string;
+    };
+  } | null> {
+    try {
+      this.logger.log(`Enriching content (length: ${content.length})`);
+
+      const response = await this.httpClient.post("/api/v1/ai/enrich", {
+        content,
+        max_length: maxLength,
+        language,
+      });
+
+      const { summary, insights, classification, fallback_fields } =
+        response.data;
+      if (fallback_fields?.length) {
+        this.logger.warn(
+          `Enrich fell back for fields: ${fallback_fields.join(", ")}`,
+        );
+      }
+
+      return {
+        summary: summary.summary || null,
+        insights: insights.insights,
+        classification: {
+          category: classification.category,
+          subcategories: classification.subcategories,
+          tags: classification.tags,
+          difficultyLevel: classification.difficulty_level,
+        },
+      };
+    } catch (error) {
+      this.logger.error(`Failed to enrich content: ${getErrorMessage(error)}`);
+      return null;
+    }
+  }
+
+  /**
+   * 获取摘要、洞察和分类
+   * 优先使用综合增强接口，失败时回退为三个独立请求
+   */
+  private async analyzeContent(
+    contentForAI: string,
+  ): Promise<
+    [
+      string | null,
+      any[] | null,
+      Awaited<ReturnType<AIEnrichmentService["classifyContent"]>>,
+    ]
+  > {
+    const enriched = await this.enrichContent(contentForAI, 200, "zh");
+    if (enriched) {
+      return [enriched.summary, enriched.insights, enriched.classification];
+    }
+
+    return Promise.all([
+      this.generateSummary(contentForAI, 200, "zh"),
+      this.extractInsights(contentForAI, "zh"),
+      this.classifyContent(contentForAI),
+    ]);
+  }
+
   /**
    * 完整的 AI 增强处理
    * 对资源内容进行摘要、洞察提取和分类
@@ -152,12 +228,9 @@ export class AIEnrichmentService {
 
     this.logger.log(`Enriching resource: ${resource.title}`);
 
-    // 并行调用所有 AI 服务
-    const [summary, insights, classification] = await Promise.all([
-      this.generateSummary(contentForAI, 200, "zh"),
-      this.extractInsights(contentForAI, "zh"),
-      this.classifyContent(contentForAI),
-    ]);
+    // 一次请求获取摘要、洞察和分类（失败时回退为并行的独立请求）
+    const [summary, insights, classification] =
+      await this.analyzeContent(contentForAI);
 
     // 将难度等级字符串转换为数字
     const difficultyLevelNum = classification?.difficultyLevel
@@ -360,12 +433,10 @@ export class AIEnrichmentService {
       `Enriching resource with structured data: ${resource.title}`,
     );
 
-    // 并行调用三个 AI 服务
-    const [summary, insights, classification, structuredSummary] =
+    // 综合增强与结构化摘要并行
+    const [[summary, insights, classification], structuredSummary] =
       await Promise.all([
-        this.generateSummary(contentForAI, 200, "zh"),
-        this.extractInsights(contentForAI, "zh"),
-        this.classifyContent(contentForAI),
+        this.analyzeContent(contentForAI),
         this.generateStructuredSummary(resource, resourceType),
       ]);
 
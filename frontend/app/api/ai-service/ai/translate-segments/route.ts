@@ -15,11 +15,12 @@ export async function POST(request: NextRequest) {
       segments,
       targetLanguage = 'zh-CN',
       model = 'gemini',
-      batchSize = 10,
+      // 未指定时由 AI 服务按 token 预算自动分批
+      batchSize,
     } = body;
 
     console.log(
-      `Translation request: ${segments.length} segments, model: ${model}, batchSize: ${batchSize}`
+      `Translation request: ${segments.length} segments, model: ${model}, batchSize: ${batchSize ?? 'auto'}`
     );
 
     // 创建带超时的 fetch 请求